@@ -45,11 +45,21 @@ variable "containers_partitions" {
     aksversions  = "/clusterName"
     platopsapps  = "/appName"
     cveinfo      = "/dateReserved"
+    cveinfostate = "/id"
     netflow      = "/netflow"
     npmpackages  = "/repository"
   }
 }
 
+variable "containers_excluded_paths" {
+  type        = map(list(string))
+  description = "Paths left out of the indexing policy of the corresponding database containers."
+  default = {
+    # Compressed payloads are only ever read back whole, never queried
+    cveinfo = ["/descriptionsCompressed/?", "/affectedCompressed/?"]
+  }
+}
+
 variable "ptlsbox_subscription" {
   default     = "1497c3d7-ab6d-4bb7-8a10-b51d03189ee3"
   description = "PTLSBOX subscription Id to use for additional Managed Identity"
@@ -41,6 +41,10 @@ resource "azurerm_cosmosdb_sql_container" "this" {
   partition_key_paths   = [each.value]
   partition_key_version = 2
 
+  # Switch per-item TTL on without expiring anything by default, published report generations
+  # and cveinfo's shard leases set their own ttl
+  default_ttl = -1
+
   autoscale_settings {
     max_throughput = var.max_throughput
   }
@@ -51,6 +55,13 @@ resource "azurerm_cosmosdb_sql_container" "this" {
     included_path {
       path = "/*"
     }
+
+    dynamic "excluded_path" {
+      for_each = lookup(var.containers_excluded_paths, each.key, [])
+      content {
+        path = excluded_path.value
+      }
+    }
   }
 }
 
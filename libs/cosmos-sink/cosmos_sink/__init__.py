@@ -0,0 +1,4 @@
+from cosmos_sink.sink import (CosmosSink, SinkSummary, get_container, get_content_hash, get_document_id,
+                              get_generation_id)
+
+__all__ = ["CosmosSink", "SinkSummary", "get_container", "get_content_hash", "get_document_id", "get_generation_id"]
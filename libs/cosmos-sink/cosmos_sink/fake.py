@@ -0,0 +1,574 @@
+"""
+In-memory stand-ins for Cosmos containers, to test and benchmark report writers without an account.
+
+FakeContainer has the methods of azure.cosmos.ContainerProxy the reports use and AsyncFakeContainer
+those of azure.cosmos.aio.ContainerProxy. Both keep items per partition key value, charge every
+request with a rough model of Cosmos' request units and can answer 429 with a retry-after, either
+when a provisioned RU/s budget is spent or for a share of the requests.
+"""
+import asyncio
+import copy
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+# Cosmos rejects items over 2 MB and transactional batches of more than 100 operations
+MAX_ITEM_BYTES = 2 * 1024 * 1024
+MAX_BATCH_OPERATIONS = 100
+
+
+@dataclass
+class RequestCharges:
+    """
+    RU charged per request, close to what Cosmos charges for small documents with the default
+    indexing policy. Reads and writes are charged per started KB of the item.
+    """
+    read_per_kb: float = 1.0
+    write_per_kb: float = 5.5
+    delete: float = 5.5
+    query: float = 2.8
+    query_per_item: float = 0.1
+
+
+def get_item_size(body):
+    return len(json.dumps(body, separators=(",", ":")).encode("utf-8"))
+
+
+def get_path_value(document, path):
+    """Value at a /a/b or a.b path of the document, or Undefined"""
+    value = document
+    for key in re.split(r"[/.]", path.strip("/")):
+        if not isinstance(value, dict) or key not in value:
+            return Undefined
+        value = value[key]
+    return value
+
+
+class _Undefined:
+    def __repr__(self):
+        return "Undefined"
+
+
+# A missing property, which Cosmos SQL tells apart from null
+Undefined = _Undefined()
+
+
+def get_error(error_type, status_code, message, headers=None):
+    error = error_type(status_code=status_code, message=message)
+    error.headers = headers or {}
+    return error
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+TOKEN = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<number>-?\d+(?:\.\d+)?)
+  | (?P<operator>!=|<>|<=|>=|=|<|>)
+  | (?P<punctuation>[(),*])
+  | (?P<parameter>@\w+)
+  | (?P<name>[A-Za-z_][\w.]*)
+)""", re.VERBOSE)
+
+KEYWORDS = {"SELECT", "VALUE", "FROM", "WHERE", "AND", "OR", "NOT", "TRUE", "FALSE", "NULL", "IS_DEFINED"}
+
+
+def tokenize(query):
+    tokens, position = [], 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKEN.match(query, position)
+        if not match:
+            raise ValueError(f"Unsupported query at {query[position:]!r}")
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "name" and text.upper() in KEYWORDS:
+            kind, text = "keyword", text.upper()
+        tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+def compare(operator, left, right):
+    """Cosmos SQL comparison: undefined, or of values of different types, is undefined"""
+    if left is Undefined or right is Undefined:
+        return None
+    same_type = (type(left) is type(right) or
+                 (isinstance(left, (int, float)) and isinstance(right, (int, float))
+                  and not isinstance(left, bool) and not isinstance(right, bool)))
+    if operator in ("=", "!=", "<>"):
+        return (left == right if same_type else False) != (operator != "=")
+    if not same_type or not isinstance(left, (int, float, str)):
+        return None
+    return {"<": left < right, ">": left > right, "<=": left <= right, ">=": left >= right}[operator]
+
+
+class Query:
+    """
+    The SQL the reports run: SELECT *, SELECT VALUE c.a or SELECT c.a, c.b FROM c, optionally
+    WHERE comparisons of properties, @parameters and literals combined with AND, OR, NOT,
+    parentheses and IS_DEFINED.
+    """
+
+    def __init__(self, query, parameters=None):
+        self.parameters = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+        self.tokens = tokenize(query)
+        self.position = 0
+
+        self.expect("keyword", "SELECT")
+        self.value = self.accept("keyword", "VALUE")
+        if self.accept("punctuation", "*"):
+            self.projection = None
+        else:
+            self.projection = [self.expect("name")]
+            while self.accept("punctuation", ","):
+                self.projection.append(self.expect("name"))
+        self.expect("keyword", "FROM")
+        self.alias = self.expect("name")
+        self.where = self.parse_or() if self.accept("keyword", "WHERE") else None
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unsupported query, unexpected {self.tokens[self.position][1]!r}")
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def accept(self, kind, text=None):
+        token_kind, token_text = self.peek()
+        if token_kind == kind and (text is None or token_text == text):
+            self.position += 1
+            return token_text
+        return None
+
+    def expect(self, kind, text=None):
+        token = self.accept(kind, text)
+        if token is None:
+            raise ValueError(f"Unsupported query, expected {text or kind} but found {self.peek()[1]!r}")
+        return token
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept("keyword", "OR"):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else ("or", terms)
+
+    def parse_and(self):
+        factors = [self.parse_not()]
+        while self.accept("keyword", "AND"):
+            factors.append(self.parse_not())
+        return factors[0] if len(factors) == 1 else ("and", factors)
+
+    def parse_not(self):
+        if self.accept("keyword", "NOT"):
+            return ("not", self.parse_not())
+        if self.accept("keyword", "IS_DEFINED"):
+            self.expect("punctuation", "(")
+            operand = self.parse_operand()
+            self.expect("punctuation", ")")
+            return ("defined", operand)
+        if self.accept("punctuation", "("):
+            expression = self.parse_or()
+            self.expect("punctuation", ")")
+            return expression
+        left = self.parse_operand()
+        operator = self.expect("operator")
+        return ("compare", operator, left, self.parse_operand())
+
+    def parse_operand(self):
+        kind, text = self.peek()
+        self.position += 1
+        if kind == "string":
+            return ("literal", text[1:-1].encode().decode("unicode_escape"))
+        if kind == "number":
+            return ("literal", float(text) if "." in text else int(text))
+        if kind == "keyword" and text in ("TRUE", "FALSE", "NULL"):
+            return ("literal", {"TRUE": True, "FALSE": False, "NULL": None}[text])
+        if kind == "parameter":
+            if text not in self.parameters:
+                raise ValueError(f"Query parameter {text} has no value")
+            return ("literal", self.parameters[text])
+        if kind == "name":
+            return ("property", self.get_path(text))
+        raise ValueError(f"Unsupported query operand {text!r}")
+
+    def get_path(self, name):
+        alias, _, path = name.partition(".")
+        if alias != self.alias:
+            raise ValueError(f"Unknown alias in {name!r}")
+        return path
+
+    def evaluate(self, expression, document):
+        kind = expression[0]
+        if kind == "literal":
+            return expression[1]
+        if kind == "property":
+            return get_path_value(document, expression[1]) if expression[1] else document
+        if kind == "defined":
+            return self.evaluate(expression[1], document) is not Undefined
+        if kind == "compare":
+            _, operator, left, right = expression
+            return compare(operator, self.evaluate(left, document), self.evaluate(right, document))
+        if kind == "not":
+            value = self.evaluate(expression[1], document)
+            return None if value is None else not value
+        values = [self.evaluate(item, document) for item in expression[1]]
+        if kind == "and":
+            return False if False in values else None if None in values else True
+        return True if True in values else None if None in values else False
+
+    def matches(self, document):
+        return self.where is None or self.evaluate(self.where, document) is True
+
+    def project(self, document):
+        if self.projection is None:
+            return copy.deepcopy(document)
+        paths = [self.get_path(name) for name in self.projection]
+        if self.value:
+            return copy.deepcopy(get_path_value(document, paths[0]))
+        result = {}
+        for path in paths:
+            value = get_path_value(document, path)
+            if value is not Undefined:
+                result[path.split(".")[-1]] = copy.deepcopy(value)
+        return result
+
+
+# ---------------------------------------------------------------------------
+# Containers
+# ---------------------------------------------------------------------------
+
+class FakeContainer:
+    """
+    In-memory container partitioned on partition_key_path, e.g. "/clusterName".
+
+    Every request is charged with charges and reported to its response_hook with the
+    x-ms-request-charge header, the totals are kept in request_charge, requests and throttled.
+    ru_per_second sets a provisioned throughput: a request that would spend more than that
+    within the current second is answered 429 with the milliseconds left in the second as its
+    x-ms-retry-after-ms. throttle_rate answers that share of the requests 429 regardless, with
+    retry_after_ms. seed makes the injected throttling repeatable.
+    """
+
+    def __init__(self, partition_key_path="/id", charges=None, ru_per_second=None, throttle_rate=0.0,
+                 retry_after_ms=100, seed=None, id="fake"):
+        self.id = id
+        self.partition_key_path = partition_key_path
+        self.charges = charges or RequestCharges()
+        self.ru_per_second = ru_per_second
+        self.throttle_rate = throttle_rate
+        self.retry_after_ms = retry_after_ms
+        self.random = random.Random(seed)
+        self.partitions = {}
+        self.request_charge = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.window_start = time.monotonic()
+        self.window_charge = 0.0
+        self.etags = itertools.count(1)
+        self.lock = threading.RLock()
+
+    # Helpers
+
+    @property
+    def items(self):
+        """Every item, across partitions"""
+        return [item for partition in self.partitions.values() for item in partition.values()]
+
+    def get_partition_key(self, body):
+        value = get_path_value(body, self.partition_key_path)
+        return None if value is Undefined else value
+
+    def get_key(self, item_id, partition_key):
+        return json.dumps(partition_key), item_id
+
+    def throttle(self, charge):
+        """Raise a 429 if this request is throttled, otherwise spend its charge in the current second"""
+        now = time.monotonic()
+        if now - self.window_start >= 1:
+            self.window_start, self.window_charge = now, 0.0
+        retry_after_ms = None
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            retry_after_ms = self.retry_after_ms
+        elif self.ru_per_second and self.window_charge + charge > self.ru_per_second and self.window_charge:
+            retry_after_ms = max(1, math.ceil((self.window_start + 1 - now) * 1000))
+        if retry_after_ms is not None:
+            self.throttled += 1
+            raise get_error(exceptions.CosmosHttpResponseError, 429, "Request rate is large",
+                            {"x-ms-retry-after-ms": str(retry_after_ms), "x-ms-request-charge": "0"})
+        self.window_charge += charge
+
+    def record(self, charge, response_hook, result=None):
+        self.requests += 1
+        self.request_charge += charge
+        if response_hook:
+            response_hook({"x-ms-request-charge": str(charge)}, result)
+
+    def get_write_charge(self, body):
+        return self.charges.write_per_kb * max(1, math.ceil(get_item_size(body) / 1024))
+
+    def get_read_charge(self, body):
+        return self.charges.read_per_kb * max(1, math.ceil(get_item_size(body) / 1024))
+
+    def get_item(self, item):
+        return item["id"] if isinstance(item, dict) else item
+
+    def store(self, body):
+        if "id" not in body:
+            raise get_error(exceptions.CosmosHttpResponseError, 400, "The input content is invalid, id is missing")
+        if get_item_size(body) > MAX_ITEM_BYTES:
+            raise get_error(exceptions.CosmosHttpResponseError, 413, "Request size is too large")
+        document = dict(copy.deepcopy(body), _etag=f'"{next(self.etags)}"', _ts=int(time.time()),
+                        _rid=uuid.uuid4().hex[:16])
+        partition_key = self.get_partition_key(body)
+        self.partitions.setdefault(json.dumps(partition_key), {})[body["id"]] = document
+        return copy.deepcopy(document)
+
+    def find(self, item_id, partition_key):
+        return self.partitions.get(json.dumps(partition_key), {}).get(item_id)
+
+    def check_etag(self, current, etag, match_condition):
+        if match_condition == MatchConditions.IfNotModified and current["_etag"] != etag:
+            raise get_error(exceptions.CosmosAccessConditionFailedError, 412, "Precondition failed")
+
+    # Operations, without charging
+
+    def _read(self, item, partition_key):
+        document = self.find(self.get_item(item), partition_key)
+        if document is None:
+            raise get_error(exceptions.CosmosResourceNotFoundError, 404, "Entity with the specified id does not exist")
+        return copy.deepcopy(document)
+
+    def _create(self, body):
+        if self.find(body.get("id"), self.get_partition_key(body)) is not None:
+            raise get_error(exceptions.CosmosResourceExistsError, 409, "Entity with the specified id already exists")
+        return self.store(body)
+
+    def _replace(self, item, body, etag=None, match_condition=None):
+        current = self.find(self.get_item(item), self.get_partition_key(body))
+        if current is None:
+            raise get_error(exceptions.CosmosResourceNotFoundError, 404, "Entity with the specified id does not exist")
+        self.check_etag(current, etag, match_condition)
+        return self.store(body)
+
+    def _upsert(self, body, etag=None, match_condition=None):
+        current = self.find(body.get("id"), self.get_partition_key(body))
+        if current is not None:
+            self.check_etag(current, etag, match_condition)
+        return self.store(body)
+
+    def _delete(self, item, partition_key, etag=None, match_condition=None):
+        item_id = self.get_item(item)
+        current = self.find(item_id, partition_key)
+        if current is None:
+            raise get_error(exceptions.CosmosResourceNotFoundError, 404, "Entity with the specified id does not exist")
+        self.check_etag(current, etag, match_condition)
+        del self.partitions[json.dumps(partition_key)][item_id]
+
+    # The ContainerProxy methods
+
+    def read_item(self, item, partition_key, response_hook=None, **kwargs):
+        with self.lock:
+            document = self._read(item, partition_key)
+            charge = self.get_read_charge(document)
+            self.throttle(charge)
+            self.record(charge, response_hook, document)
+            return document
+
+    def create_item(self, body, response_hook=None, **kwargs):
+        with self.lock:
+            charge = self.get_write_charge(body)
+            self.throttle(charge)
+            document = self._create(body)
+            self.record(charge, response_hook, document)
+            return document
+
+    def upsert_item(self, body, response_hook=None, etag=None, match_condition=None, **kwargs):
+        with self.lock:
+            charge = self.get_write_charge(body)
+            self.throttle(charge)
+            document = self._upsert(body, etag, match_condition)
+            self.record(charge, response_hook, document)
+            return document
+
+    def replace_item(self, item, body, response_hook=None, etag=None, match_condition=None, **kwargs):
+        with self.lock:
+            charge = self.get_write_charge(body)
+            self.throttle(charge)
+            document = self._replace(item, body, etag, match_condition)
+            self.record(charge, response_hook, document)
+            return document
+
+    def delete_item(self, item, partition_key, response_hook=None, etag=None, match_condition=None, **kwargs):
+        with self.lock:
+            self.throttle(self.charges.delete)
+            self._delete(item, partition_key, etag, match_condition)
+            self.record(self.charges.delete, response_hook)
+
+    def run_query(self, query, parameters, partition_key, response_hook):
+        parsed = Query(query, parameters)
+        with self.lock:
+            if partition_key is not None:
+                scanned = list(self.partitions.get(json.dumps(partition_key), {}).values())
+            else:
+                scanned = self.items
+            charge = self.charges.query + self.charges.query_per_item * len(scanned)
+            self.throttle(charge)
+            results = [parsed.project(document) for document in scanned if parsed.matches(document)]
+            self.record(charge, response_hook)
+        return results
+
+    def query_items(self, query, parameters=None, partition_key=None, response_hook=None, **kwargs):
+        """
+        Iterates over the results. Like the SDK, the query is only run, charged and possibly
+        throttled once iteration starts.
+        """
+        def results():
+            yield from self.run_query(query, parameters, partition_key, response_hook)
+        return results()
+
+    def execute_item_batch(self, batch_operations, partition_key, response_hook=None, **kwargs):
+        """
+        Run the operations against a copy of the partition and keep it only if every one succeeds.
+        """
+        if len(batch_operations) > MAX_BATCH_OPERATIONS:
+            raise get_error(exceptions.CosmosHttpResponseError, 400,
+                            f"Batch request has more operations than the {MAX_BATCH_OPERATIONS} allowed")
+        with self.lock:
+            key = json.dumps(partition_key)
+            saved = copy.deepcopy(self.partitions.get(key, {}))
+            results, charge = [], 0.0
+            for index, operation in enumerate(batch_operations):
+                name, args = operation[0], operation[1]
+                options = operation[2] if len(operation) > 2 else {}
+                try:
+                    body = args[-1] if name in ("create", "upsert", "replace") else None
+                    if body is not None and self.get_partition_key(body) != partition_key:
+                        raise get_error(exceptions.CosmosHttpResponseError, 400,
+                                        "Partition key of the item does not match the batch")
+                    if name == "read":
+                        result = self._read(args[0], partition_key)
+                        charge += self.get_read_charge(result)
+                    elif name == "delete":
+                        result = self._delete(args[0], partition_key, **options)
+                        charge += self.charges.delete
+                    else:
+                        result = getattr(self, f"_{name}")(*args, **options)
+                        charge += self.get_write_charge(body)
+                    results.append({"statusCode": 201 if name == "create" else 200, "resourceBody": result})
+                except exceptions.CosmosHttpResponseError as e:
+                    self.partitions[key] = saved
+                    raise exceptions.CosmosBatchOperationError(
+                        error_index=index, headers={}, status_code=e.status_code,
+                        message=f"Operation {index} of the batch failed: {e.message}",
+                        operation_responses=results)
+            try:
+                self.throttle(charge)
+            except exceptions.CosmosHttpResponseError:
+                self.partitions[key] = saved
+                raise
+            self.record(charge, response_hook, results)
+            return results
+
+    def reset_counters(self):
+        """Start counting requests, charges and throttles afresh, e.g. after seeding the container"""
+        with self.lock:
+            self.request_charge, self.requests, self.throttled = 0.0, 0, 0
+            self.window_start, self.window_charge = time.monotonic(), 0.0
+
+
+class AsyncFakeContainer:
+    """
+    The FakeContainer behind the coroutine methods of azure.cosmos.aio.ContainerProxy.
+    Takes the same arguments, the sync container is available as container.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.container = kwargs.pop("container", None) or FakeContainer(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Items, settings and counters of the wrapped container
+        return getattr(self.container, name)
+
+    async def read_item(self, *args, **kwargs):
+        return self.container.read_item(*args, **kwargs)
+
+    async def create_item(self, *args, **kwargs):
+        return self.container.create_item(*args, **kwargs)
+
+    async def upsert_item(self, *args, **kwargs):
+        return self.container.upsert_item(*args, **kwargs)
+
+    async def replace_item(self, *args, **kwargs):
+        return self.container.replace_item(*args, **kwargs)
+
+    async def delete_item(self, *args, **kwargs):
+        return self.container.delete_item(*args, **kwargs)
+
+    async def execute_item_batch(self, *args, **kwargs):
+        return self.container.execute_item_batch(*args, **kwargs)
+
+    def query_items(self, query, parameters=None, partition_key=None, response_hook=None, **kwargs):
+        async def results():
+            for item in self.container.run_query(query, parameters, partition_key, response_hook):
+                yield item
+                # Let other tasks run between items, as between the pages of a real query
+                await asyncio.sleep(0)
+        return results()
+
+
+class FakeDatabase:
+    def __init__(self, container_type, partition_keys, options):
+        self.container_type = container_type
+        self.partition_keys = partition_keys
+        self.options = options
+        self.containers = {}
+
+    def get_container_client(self, container):
+        if container not in self.containers:
+            path = self.partition_keys.get(container, "/id")
+            self.containers[container] = self.container_type(path, id=container, **self.options)
+        return self.containers[container]
+
+
+class FakeCosmosClient:
+    """
+    Stands in for CosmosClient, e.g. patched into a report's module. partition_keys maps container
+    names to partition key paths, the containers partitioned on /id by default. Any other argument
+    is passed on to every container. Works with `async with` when asynchronous is set, like
+    azure.cosmos.aio.CosmosClient.
+    """
+
+    def __init__(self, *args, partition_keys=None, asynchronous=False, **options):
+        options.pop("credential", None)
+        options.pop("url", None)
+        self.container_type = AsyncFakeContainer if asynchronous else FakeContainer
+        self.partition_keys = partition_keys or {}
+        self.options = options
+        self.databases = {}
+
+    def get_database_client(self, database):
+        if database not in self.databases:
+            self.databases[database] = FakeDatabase(self.container_type, self.partition_keys, self.options)
+        return self.databases[database]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
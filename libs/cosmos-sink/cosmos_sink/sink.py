@@ -0,0 +1,334 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+from azure.core import MatchConditions
+from azure.cosmos import CosmosClient, exceptions
+
+# Expose concurrency and retry settings via environment variables
+MAX_WORKERS = int(os.getenv("COSMOS_SINK_WORKERS", 16))
+MAX_RETRIES = int(os.getenv("COSMOS_SINK_MAX_RETRIES", 8))
+# Changed documents sync holds before writing them, documents can be streamed to it without all being held
+BATCH_SIZE = int(os.getenv("COSMOS_SINK_BATCH_SIZE", 1000))
+# Too many requests and service unavailable are worth retrying, anything else is a real failure
+RETRY_STATUS_CODES = (429, 503)
+# Seconds a published generation's documents live, it must be longer than the time between two runs
+GENERATION_TTL = int(os.getenv("COSMOS_SINK_GENERATION_TTL", 7 * 24 * 60 * 60))
+# Fields left out of a document's content hash: its id, the hash itself and what Cosmos or publish add
+HASH_EXCLUDED_FIELDS = {"id", "contentHash", "generation", "ttl", "_rid", "_self", "_etag", "_attachments", "_ts"}
+# Namespace of the ids derived from a document's natural key
+DOCUMENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://github.com/hmcts/version-reporter-services")
+
+logger = logging.getLogger(__name__)
+
+
+def get_container(endpoint, database_name, container_name, credential=None):
+    """
+    Container client for a report, using DefaultAzureCredential unless a credential is given.
+    """
+    if credential is None:
+        from azure.identity import DefaultAzureCredential
+        credential = DefaultAzureCredential()
+    client = CosmosClient(endpoint, credential=credential)
+    return client.get_database_client(database_name).get_container_client(container_name)
+
+
+def get_retry_after(error, attempt):
+    """
+    Seconds to wait before retrying, from the retry-after header Cosmos returns with a 429,
+    falling back to an exponential backoff.
+    """
+    headers = getattr(error, "headers", None) or {}
+    retry_after_ms = headers.get("x-ms-retry-after-ms")
+    if retry_after_ms:
+        return float(retry_after_ms) / 1000
+    return min(2 ** attempt * 0.1, 10)
+
+
+def get_document_id(document, key_fields):
+    """
+    Id derived from the values of the document's key_fields, so the same cluster, chart or
+    package gets the same id on every run.
+    """
+    key = "|".join(str(document.get(field)) for field in key_fields)
+    return str(uuid.uuid5(DOCUMENT_ID_NAMESPACE, key))
+
+
+def get_content_hash(document, volatile_fields=()):
+    """
+    Stable hash of the document's payload, the same for the same content whatever the key order.
+    Its id and the volatile_fields, e.g. timestamps set on every run, are left out.
+    """
+    content = {key: value for key, value in document.items()
+               if key not in HASH_EXCLUDED_FIELDS and key not in volatile_fields}
+    payload = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_generation_id():
+    """Sortable id of a run's generation, e.g. 20240131T020000-3f2a9c1b"""
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+
+@dataclass
+class SinkSummary:
+    written: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    failed: int = 0
+    request_charge: float = 0.0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def duration(self):
+        return time.monotonic() - self.started
+
+    def __str__(self):
+        return (f"{self.written} documents written, {self.skipped} skipped, {self.deleted} deleted, {self.failed} failed, "
+                f"{self.request_charge:.0f} RU in {self.duration:.1f}s")
+
+
+class CosmosSink:
+    """
+    Writes a report's documents to its Cosmos container, many requests at a time.
+
+    partition_key is the document field holding the container's partition key, e.g. "clusterName",
+    or a function returning the partition key value of a document. Throttled (429) and unavailable
+    (503) requests are retried after the retry-after Cosmos asks for. summary counts the documents
+    written, deleted and failed, and the RU they cost.
+    """
+
+    def __init__(self, container, partition_key, max_workers=None, max_retries=None, batch_size=None):
+        self.container = container
+        self.partition_key = partition_key
+        self.max_workers = max_workers or MAX_WORKERS
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.batch_size = batch_size or BATCH_SIZE
+        self.summary = SinkSummary()
+        self.lock = threading.Lock()
+
+    def get_partition_key(self, document):
+        if callable(self.partition_key):
+            return self.partition_key(document)
+        return document.get(self.partition_key)
+
+    def record_charge(self, headers, *_):
+        with self.lock:
+            self.summary.request_charge += float(headers.get("x-ms-request-charge") or 0)
+
+    def call(self, operation, *args, **kwargs):
+        """
+        Run a container operation, retrying it while Cosmos answers 429 or 503.
+        """
+        attempt = 0
+        while True:
+            try:
+                return operation(*args, response_hook=self.record_charge, **kwargs)
+            except exceptions.CosmosHttpResponseError as e:
+                if e.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    raise
+                wait = get_retry_after(e, attempt)
+                logger.warning(f"Request failed with {e.status_code}, retrying in {wait:.2f} sec")
+                time.sleep(wait)
+                attempt += 1
+
+    def run_all(self, operation, items, counter):
+        """
+        Run operation for every item concurrently, counting successes in the summary's counter field.
+        Returns the number of items that failed.
+        """
+        def run(item):
+            try:
+                operation(item)
+            except exceptions.CosmosHttpResponseError as e:
+                logger.error(f"Cosmos request failed: {e}")
+                with self.lock:
+                    self.summary.failed += 1
+                return False
+            with self.lock:
+                setattr(self.summary, counter, getattr(self.summary, counter) + 1)
+            return True
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(run, items)).count(False)
+
+    def upsert_all(self, documents):
+        """
+        Upsert every document. Returns the number of documents that could not be written.
+        """
+        return self.run_all(lambda document: self.call(self.container.upsert_item, body=document),
+                            documents, "written")
+
+    def query_all(self, query, parameters=None):
+        """
+        Every item the query returns, across partitions.
+        """
+        def query_items(**kwargs):
+            # Read every page inside the retry, the query is only sent while iterating
+            return list(self.container.query_items(query=query, parameters=parameters,
+                                                   enable_cross_partition_query=True, **kwargs))
+
+        return self.call(query_items)
+
+    def delete_items(self, items):
+        """
+        Delete items, each holding at least the id and the partition key of a document.
+        Returns the number of documents that could not be deleted.
+        """
+        def delete(item):
+            try:
+                self.call(self.container.delete_item, item["id"], partition_key=self.get_partition_key(item))
+            except exceptions.CosmosResourceNotFoundError:
+                # Already gone, e.g. removed by an overlapping run
+                pass
+
+        return self.run_all(delete, items, "deleted")
+
+    def delete_all(self, query, parameters=None):
+        """
+        Delete every document the query returns. The query only needs to select the id and
+        the partition key, e.g. SELECT c.id, c.clusterName FROM c.
+        Returns the number of documents that could not be deleted.
+        """
+        return self.delete_items(self.query_all(query, parameters))
+
+    def sync(self, documents, key_fields, query, parameters=None, volatile_fields=()):
+        """
+        Make the documents the query returns match a report's new snapshot.
+
+        Each document gets an id derived from its key_fields, e.g. ["environment", "cluster", "chart"],
+        and a contentHash of its payload without the volatile_fields, e.g. ["lastUpdated"]. It is upserted
+        over the document with the same key from the last run unless that one has the same contentHash,
+        in which case it is counted as skipped. Documents the query returns that are not in the snapshot
+        are deleted. The query only needs to select the id, the partition key and the contentHash, scoped
+        to what the snapshot covers, e.g.
+        SELECT c.id, c.clusterName, c.contentHash FROM c WHERE c.environment = @environment.
+
+        documents can be a generator: changed documents are written batch_size at a time as they come,
+        only the ids and hashes of last run's documents are held. Nothing is deleted until it is exhausted,
+        so a snapshot that fails part way through leaves the documents it did not reach in place.
+        Returns the number of documents that could not be written or deleted.
+        """
+        existing = {(item["id"], self.get_partition_key(item)): item for item in self.query_all(query, parameters)}
+
+        failed, changed = 0, []
+        for document in documents:
+            document = dict(document, id=get_document_id(document, key_fields),
+                            contentHash=get_content_hash(document, volatile_fields))
+            current = existing.pop((document["id"], self.get_partition_key(document)), None)
+            if current and current.get("contentHash") == document["contentHash"]:
+                self.summary.skipped += 1
+                continue
+            changed.append(document)
+            if len(changed) >= self.batch_size:
+                failed += self.upsert_all(changed)
+                changed = []
+
+        failed += self.upsert_all(changed)
+        # What is left was not in the snapshot
+        return failed + self.delete_items(list(existing.values()))
+
+    def read_item(self, item_id, partition_key):
+        """
+        The item, or None if there is none.
+        """
+        try:
+            return self.call(self.container.read_item, item_id, partition_key=partition_key)
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+
+    def expire_generations(self, generation, pointer_id, ttl, scope=None):
+        """
+        Give a ttl to the documents of every generation but the one the pointer names, so Cosmos expires them
+        ttl seconds on. That is the generation the pointer moved from, and any left by a run that failed or lost
+        the race for the pointer. scope, e.g. {"environment": "prod"}, limits them to the report's own documents.
+        Returns the number of documents that could not be updated, the next publish tries them again.
+        """
+        conditions = ["IS_DEFINED(c.generation)", "c.generation != @generation", "NOT IS_DEFINED(c.ttl)",
+                      "c.id != @pointer"]
+        parameters = [{"name": "@generation", "value": generation}, {"name": "@pointer", "value": pointer_id}]
+        for index, (name, value) in enumerate((scope or {}).items()):
+            conditions.append(f"c.{name} = @scope{index}")
+            parameters.append({"name": f"@scope{index}", "value": value})
+        items = self.query_all(f"SELECT * FROM c WHERE {' AND '.join(conditions)}", parameters)
+        expiring = [dict({key: value for key, value in item.items() if not key.startswith("_")}, ttl=ttl)
+                    for item in items]
+        failed = self.upsert_all(expiring)
+        if expiring:
+            logger.info(f"{len(expiring) - failed} documents of older generations expire in {ttl} seconds")
+        return failed
+
+    def publish(self, documents, key_fields, pointer_id, ttl=None, synced_query=None, parameters=None, scope=None):
+        """
+        Publish documents as a new generation of a report, readers never seeing a half written one.
+
+        Every document is written as a new item tagged with the generation. Once every document is written,
+        the pointer document pointer_id is flipped to the new generation, so readers look up the pointer's
+        generation and then query SELECT * FROM c WHERE c.generation = @generation. The generation the
+        pointer names has no ttl, so it stays readable however long later runs keep failing. Once the pointer
+        has moved, the older generations get a ttl, GENERATION_TTL seconds unless given, and Cosmos expires
+        them, which needs TTL switched on for the container (default_ttl = -1). Nothing is deleted.
+        The pointer lives in the partition named after it, so partition_key must be a field name.
+        scope holds the fields shared by every document of the report and set on the pointer too, e.g.
+        {"environment": "prod"} when each environment has its own pointer, so only its own generations
+        are expired and a query scoped like the documents finds the pointer as well.
+
+        synced_query selects the id and partition key of the documents sync wrote in place before
+        the report switched to publishing, scoped like its sync query, e.g.
+        SELECT c.id, c.clusterName FROM c WHERE NOT IS_DEFINED(c.generation). They have no ttl, so
+        they are deleted once the pointer has moved, a delete that fails being retried by the next run.
+        Returns the number of documents that could not be written, in which case the pointer is
+        left at the previous generation.
+        """
+        generation = get_generation_id()
+        ttl = GENERATION_TTL if ttl is None else ttl
+        current = self.read_item(pointer_id, pointer_id)
+
+        items = []
+        for document in documents:
+            item = dict(document, generation=generation)
+            item["id"] = get_document_id(item, [*key_fields, "generation"])
+            items.append(item)
+
+        failed = self.upsert_all(items)
+        if failed:
+            # The documents written are expired by the next run that publishes
+            logger.error(f"{failed} documents could not be written, {pointer_id} left at the previous generation")
+            return failed
+
+        pointer = {
+            **(scope or {}),
+            "id": pointer_id,
+            self.partition_key: pointer_id,
+            "generation": generation,
+            "previousGeneration": current["generation"] if current else None,
+            "documentCount": len(items),
+            "publishedAt": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            if current:
+                self.call(self.container.replace_item, pointer_id, pointer,
+                          etag=current["_etag"], match_condition=MatchConditions.IfNotModified)
+            else:
+                self.call(self.container.create_item, pointer)
+        except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceExistsError):
+            # Another run published while this one was writing, its generation stays and it expires this one
+            logger.warning(f"{pointer_id} was moved by another run, generation {generation} not published")
+            return 0
+        logger.info(f"Published generation {generation} of {len(items)} documents to {pointer_id}")
+
+        # Failures here leave older documents without a ttl, the next publish expires them
+        self.expire_generations(generation, pointer_id, ttl, scope)
+        if synced_query:
+            synced = self.query_all(synced_query, parameters)
+            if synced:
+                failed = self.delete_items(synced)
+                logger.info(f"Removed {len(synced) - failed} of {len(synced)} documents synced in place before publishing")
+        return 0
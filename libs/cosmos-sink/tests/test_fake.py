@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+from cosmos_sink import CosmosSink
+from cosmos_sink.fake import AsyncFakeContainer, FakeContainer, FakeCosmosClient
+
+
+def test_items_are_kept_per_partition_key():
+    container = FakeContainer("/namespace")
+    container.create_item({"id": "keda", "namespace": "admin"})
+    container.create_item({"id": "keda", "namespace": "monitoring"})
+
+    with pytest.raises(exceptions.CosmosResourceExistsError):
+        container.create_item({"id": "keda", "namespace": "admin"})
+    with pytest.raises(exceptions.CosmosResourceNotFoundError):
+        container.read_item("keda", partition_key="flux-system")
+    container.delete_item("keda", partition_key="admin")
+    assert [item["namespace"] for item in container.items] == ["monitoring"]
+
+
+def test_query_filters_with_parameters_and_projects_fields():
+    container = FakeContainer("/namespace")
+    container.upsert_item({"id": "1", "namespace": "admin", "environment": "aat", "runId": "a"})
+    container.upsert_item({"id": "2", "namespace": "admin", "environment": "prod", "runId": "b"})
+    container.upsert_item({"id": "3", "namespace": "keda", "environment": "aat"})
+
+    results = list(container.query_items("SELECT c.id, c.namespace FROM c WHERE c.environment = @environment",
+                                         parameters=[dict(name="@environment", value="aat")]))
+    stale = list(container.query_items("SELECT VALUE c.id FROM c WHERE NOT IS_DEFINED(c.runId) OR c.runId != @runId",
+                                       parameters=[dict(name="@runId", value="a")]))
+
+    assert results == [{"id": "1", "namespace": "admin"}, {"id": "3", "namespace": "keda"}]
+    assert sorted(stale) == ["2", "3"]
+
+
+def test_requests_are_charged_through_the_response_hook():
+    container = FakeContainer("/id")
+    headers = {}
+
+    container.upsert_item({"id": "1", "payload": "x" * 3000}, response_hook=lambda h, *_: headers.update(h))
+
+    assert float(headers["x-ms-request-charge"]) == 5.5 * 3
+    assert (container.requests, container.request_charge) == (1, 16.5)
+
+
+def test_replace_honours_the_etag():
+    container = FakeContainer("/id")
+    current = container.create_item({"id": "pointer", "generation": "1"})
+    container.replace_item("pointer", {"id": "pointer", "generation": "2"},
+                           etag=current["_etag"], match_condition=MatchConditions.IfNotModified)
+
+    with pytest.raises(exceptions.CosmosAccessConditionFailedError):
+        container.replace_item("pointer", {"id": "pointer", "generation": "3"},
+                               etag=current["_etag"], match_condition=MatchConditions.IfNotModified)
+
+
+def test_batch_is_all_or_nothing():
+    container = FakeContainer("/dateReserved")
+    container.create_item({"id": "CVE-1", "dateReserved": "2024"})
+
+    with pytest.raises(exceptions.CosmosBatchOperationError):
+        container.execute_item_batch([("upsert", ({"id": "CVE-2", "dateReserved": "2024"},)),
+                                      ("create", ({"id": "CVE-1", "dateReserved": "2024"},))], partition_key="2024")
+    assert [item["id"] for item in container.items] == ["CVE-1"]
+
+
+def test_throughput_budget_answers_429_with_retry_after():
+    container = FakeContainer("/id", ru_per_second=10)
+    container.upsert_item({"id": "1"})
+
+    with pytest.raises(exceptions.CosmosHttpResponseError) as error:
+        container.upsert_item({"id": "2"})
+
+    assert error.value.status_code == 429
+    assert 0 < int(error.value.headers["x-ms-retry-after-ms"]) <= 1000
+    assert (container.throttled, len(container.items)) == (1, 1)
+
+
+def test_sink_retries_injected_throttling():
+    container = FakeContainer("/clusterName", throttle_rate=0.3, retry_after_ms=1, seed=1)
+    sink = CosmosSink(container, "clusterName", max_workers=4)
+
+    failed = sink.upsert_all([{"id": str(i), "clusterName": f"cluster-{i % 3}"} for i in range(50)])
+
+    assert failed == 0
+    assert len(container.items) == 50
+    assert container.throttled > 0
+    assert sink.summary.request_charge == container.request_charge
+
+
+def test_async_container_and_client():
+    client = FakeCosmosClient(partition_keys={"cveinfo": "/dateReserved"}, asynchronous=True)
+
+    async def run():
+        async with client:
+            container = client.get_database_client("reports").get_container_client("cveinfo")
+            await container.upsert_item({"id": "CVE-1", "dateReserved": "2024"})
+            return [item async for item in container.query_items("SELECT * FROM c WHERE c.dateReserved = '2024'")]
+
+    items = asyncio.run(run())
+
+    assert [item["id"] for item in items] == ["CVE-1"]
+    assert isinstance(client.get_database_client("reports").get_container_client("cveinfo"), AsyncFakeContainer)
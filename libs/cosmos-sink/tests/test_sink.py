@@ -0,0 +1,216 @@
+from unittest.mock import MagicMock
+
+from azure.cosmos import exceptions
+
+from cosmos_sink import CosmosSink, get_content_hash, get_document_id
+from cosmos_sink.fake import MAX_ITEM_BYTES, FakeContainer
+
+
+def charge(ru):
+    def operation(*args, response_hook=None, **kwargs):
+        response_hook({"x-ms-request-charge": str(ru)}, None)
+    return operation
+
+
+def test_upsert_all_writes_every_document_and_sums_the_charge():
+    container = MagicMock()
+    container.upsert_item.side_effect = charge(5)
+
+    sink = CosmosSink(container, "clusterName")
+
+    failed = sink.upsert_all([{"id": str(i)} for i in range(10)])
+
+    assert failed == 0
+    assert container.upsert_item.call_count == 10
+    assert (sink.summary.written, sink.summary.request_charge) == (10, 50)
+
+
+def test_summary_counts_written_failed_and_request_charge():
+    container = MagicMock()
+    bad_request = exceptions.CosmosHttpResponseError(status_code=400, message="Bad request")
+    container.upsert_item.side_effect = [None, bad_request, None]
+    sink = CosmosSink(container, "clusterName", max_workers=1)
+    sink.record_charge({"x-ms-request-charge": "2.5"})
+
+    failed = sink.upsert_all([{"id": "1"}, {"id": "2"}, {"id": "3"}])
+
+    assert failed == 1
+    assert (sink.summary.written, sink.summary.failed, sink.summary.request_charge) == (2, 1, 2.5)
+
+
+def test_throttled_and_unavailable_requests_are_retried():
+    container = MagicMock()
+    throttled = exceptions.CosmosHttpResponseError(status_code=429, message="Too many requests")
+    throttled.headers = {"x-ms-retry-after-ms": "1"}
+    unavailable = exceptions.CosmosHttpResponseError(status_code=503, message="Service unavailable")
+    container.upsert_item.side_effect = [throttled, unavailable, None]
+    sink = CosmosSink(container, "clusterName")
+
+    assert sink.upsert_all([{"id": "1"}]) == 0
+    assert container.upsert_item.call_count == 3
+
+
+def test_delete_all_uses_the_partition_key_of_each_item():
+    container = MagicMock()
+    container.query_items.return_value = iter([{"id": "1", "clusterName": "a"}, {"id": "2", "clusterName": "b"}])
+    sink = CosmosSink(container, "clusterName", max_workers=1)
+
+    sink.delete_all("SELECT c.id, c.clusterName FROM c")
+
+    assert [call.kwargs["partition_key"] for call in container.delete_item.call_args_list] == ["a", "b"]
+    assert sink.summary.deleted == 2
+
+
+def test_document_id_is_the_same_for_the_same_key():
+    first = get_document_id({"cluster": "cft-aat-00", "chart": "keda", "installed": "2.0"}, ["cluster", "chart"])
+    second = get_document_id({"cluster": "cft-aat-00", "chart": "keda", "installed": "2.1"}, ["cluster", "chart"])
+
+    assert first == second
+    assert first != get_document_id({"cluster": "cft-aat-01", "chart": "keda"}, ["cluster", "chart"])
+
+
+def test_sync_upserts_the_snapshot_and_deletes_only_missing_documents():
+    kept = {"namespace": "admin", "chart": "keda"}
+    added = {"namespace": "admin", "chart": "kured"}
+    kept_id = get_document_id(kept, ["namespace", "chart"])
+    container = MagicMock()
+    container.query_items.return_value = iter([{"id": kept_id, "namespace": "admin"},
+                                               {"id": "old", "namespace": "monitoring"}])
+    sink = CosmosSink(container, "namespace", max_workers=1)
+
+    failed = sink.sync([kept, added], ["namespace", "chart"], "SELECT c.id, c.namespace FROM c")
+
+    assert failed == 0
+    assert [call.kwargs["body"]["id"] for call in container.upsert_item.call_args_list] == \
+        [kept_id, get_document_id(added, ["namespace", "chart"])]
+    container.delete_item.assert_called_once_with("old", partition_key="monitoring", response_hook=sink.record_charge)
+    assert (sink.summary.written, sink.summary.deleted) == (2, 1)
+
+
+def test_publish_writes_a_new_generation_and_then_moves_the_pointer():
+    container = MagicMock()
+    container.read_item.return_value = {"id": "current-generation", "generation": "old", "_etag": "1"}
+    sink = CosmosSink(container, "clusterName", max_workers=1)
+
+    failed = sink.publish([{"clusterName": "a"}, {"clusterName": "b"}], ["clusterName"], "current-generation", ttl=60)
+
+    written = [call.kwargs["body"] for call in container.upsert_item.call_args_list]
+    generation = written[0]["generation"]
+    assert failed == 0
+    assert [(item["clusterName"], item["generation"], "ttl" in item) for item in written] == \
+        [("a", generation, False), ("b", generation, False)]
+    pointer = container.replace_item.call_args.args[1]
+    assert (pointer["clusterName"], pointer["generation"], pointer["previousGeneration"]) == \
+        ("current-generation", generation, "old")
+    assert container.replace_item.call_args.kwargs["etag"] == "1"
+    container.delete_item.assert_not_called()
+
+
+def test_publish_leaves_the_pointer_when_a_write_fails():
+    container = MagicMock()
+    container.read_item.side_effect = exceptions.CosmosResourceNotFoundError(status_code=404, message="Not found")
+    bad_request = exceptions.CosmosHttpResponseError(status_code=400, message="Bad request")
+    container.upsert_item.side_effect = [None, bad_request]
+    sink = CosmosSink(container, "clusterName", max_workers=1)
+
+    assert sink.publish([{"clusterName": "a"}, {"clusterName": "b"}], ["clusterName"], "current-generation") == 1
+    container.create_item.assert_not_called()
+    container.replace_item.assert_not_called()
+
+
+def test_only_generations_the_pointer_moved_from_expire():
+    container = FakeContainer("/clusterName")
+    sink = CosmosSink(container, "clusterName")
+    sink.publish([{"clusterName": "a"}], ["clusterName"], "current-generation", ttl=60)
+    first = container.read_item("current-generation", "current-generation")["generation"]
+
+    # A run failing, however often, leaves the published generation without a ttl
+    too_large = {"clusterName": "b", "padding": "x" * MAX_ITEM_BYTES}
+    for _ in range(3):
+        assert sink.publish([{"clusterName": "b"}, too_large], ["clusterName"], "current-generation", ttl=60) == 1
+    assert [item.get("ttl") for item in container.items if item.get("generation") == first] == [None, None]
+
+    sink.publish([{"clusterName": "c"}], ["clusterName"], "current-generation", ttl=60)
+
+    pointer = container.read_item("current-generation", "current-generation")
+    assert pointer["previousGeneration"] == first
+    # Without a ttl an item never expires, as with a ttl of -1
+    # The documents of the failed runs expire along with the one the pointer moved from
+    assert sorted((item["clusterName"], item.get("ttl", -1)) for item in container.items) == \
+        [("a", 60), ("b", 60), ("b", 60), ("b", 60), ("c", -1), ("current-generation", -1)]
+
+
+def test_scoped_publish_leaves_the_generations_of_other_scopes_alone():
+    container = FakeContainer("/appName")
+    sink = CosmosSink(container, "appName")
+    for environment in ["aat", "prod", "aat"]:
+        sink.publish([{"appName": "flux", "environment": environment}], ["environment", "appName"],
+                     f"current-generation-{environment}", ttl=60, scope={"environment": environment})
+
+    assert sorted((item["environment"], item["appName"], item.get("ttl", -1)) for item in container.items) == [
+        ("aat", "current-generation-aat", -1), ("aat", "flux", -1), ("aat", "flux", 60),
+        ("prod", "current-generation-prod", -1), ("prod", "flux", -1)]
+
+
+def test_publish_removes_the_documents_synced_in_place_once_the_pointer_moved():
+    container = FakeContainer("/clusterName")
+    sink = CosmosSink(container, "clusterName")
+    sink.sync([{"clusterName": "a"}, {"clusterName": "b"}], ["clusterName"],
+              "SELECT c.id, c.clusterName, c.contentHash FROM c")
+    synced_query = "SELECT c.id, c.clusterName FROM c WHERE NOT IS_DEFINED(c.generation)"
+
+    assert sink.publish([{"clusterName": "a"}], ["clusterName"], "current-generation", synced_query=synced_query) == 0
+    assert sink.publish([{"clusterName": "a"}], ["clusterName"], "current-generation", synced_query=synced_query) == 0
+
+    # The pointer and the two generations of a, the next deletes nothing
+    assert sorted(item["clusterName"] for item in container.items) == ["a", "a", "current-generation"]
+    assert all("generation" in item for item in container.items)
+    assert sink.summary.deleted == 2
+
+
+def test_content_hash_ignores_the_id_key_order_and_volatile_fields():
+    document = {"id": "1", "chart": "keda", "installed": "2.0", "lastUpdated": "monday"}
+    same = {"installed": "2.0", "chart": "keda", "id": "2", "lastUpdated": "tuesday"}
+
+    assert get_content_hash(document, ["lastUpdated"]) == get_content_hash(same, ["lastUpdated"])
+    assert get_content_hash(document, ["lastUpdated"]) != get_content_hash(dict(same, installed="2.1"), ["lastUpdated"])
+
+
+def test_sync_skips_unchanged_documents():
+    unchanged = {"namespace": "admin", "chart": "keda", "installed": "2.0", "lastUpdated": "tuesday"}
+    changed = {"namespace": "admin", "chart": "kured", "installed": "1.5"}
+    container = MagicMock()
+    container.query_items.return_value = iter([
+        {"id": get_document_id(unchanged, ["namespace", "chart"]), "namespace": "admin",
+         "contentHash": get_content_hash(dict(unchanged, lastUpdated="monday"), ["lastUpdated"])},
+        {"id": get_document_id(changed, ["namespace", "chart"]), "namespace": "admin",
+         "contentHash": get_content_hash(dict(changed, installed="1.4"), ["lastUpdated"])},
+    ])
+    sink = CosmosSink(container, "namespace", max_workers=1)
+
+    sink.sync([unchanged, changed], ["namespace", "chart"], "SELECT c.id, c.namespace, c.contentHash FROM c",
+              volatile_fields=["lastUpdated"])
+
+    written = container.upsert_item.call_args_list
+    assert [call.kwargs["body"]["chart"] for call in written] == ["kured"]
+    assert written[0].kwargs["body"]["contentHash"] == get_content_hash(changed)
+    container.delete_item.assert_not_called()
+    assert (sink.summary.written, sink.summary.skipped, sink.summary.deleted) == (1, 1, 0)
+
+
+def test_sync_writes_streamed_documents_in_batches_and_deletes_last():
+    container = FakeContainer("/repository")
+    container.upsert_item({"id": "gone", "repository": "old-app"})
+    sink = CosmosSink(container, "repository", max_workers=2, batch_size=2)
+    written_before = []
+
+    def documents():
+        for version in range(5):
+            written_before.append(len(container.items))
+            yield {"repository": "app", "package": "express", "version": f"4.{version}"}
+
+    failed = sink.sync(documents(), ["repository", "package", "version"], "SELECT c.id, c.repository FROM c")
+
+    assert failed == 0
+    assert written_before == [1, 1, 3, 3, 5]
+    assert sorted(item["version"] for item in container.items) == ["4.0", "4.1", "4.2", "4.3", "4.4"]
@@ -0,0 +1,8 @@
+from github_client.cache import ResponseCache, RunCache, get_cache_store
+from github_client.client import GitHubClient, GitHubError, create_session, get_next_link
+from github_client.scheduler import RateLimitScheduler
+from github_client.stores import LocalStore, get_env_store, get_store, load_cache, save_cache
+
+__all__ = ["GitHubClient", "GitHubError", "LocalStore", "RateLimitScheduler", "ResponseCache", "RunCache",
+           "create_session", "get_cache_store", "get_env_store", "get_next_link", "get_store", "load_cache",
+           "save_cache"]
@@ -0,0 +1,110 @@
+import gzip
+import json
+import logging
+from urllib.parse import urlencode
+
+from github_client.stores import get_env_store
+
+# Response headers kept with a cached body, a cached page still links to the next one
+KEPT_HEADERS = ["Link", "ETag", "Last-Modified"]
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_key(url, params=None, accept=""):
+    # The same url answers differently to another media type
+    query = f"?{urlencode(sorted((params or {}).items()))}" if params else ""
+    return f"{accept} {url}{query}"
+
+
+class RunCache:
+    """
+    Entries kept from one run to the next, saved gzipped with a version. Only the entries used by a run
+    are saved, so what is no longer requested drops out of the cache. Subclasses set a name for the logs,
+    and a version to bump when their entries change meaning, so entries saved the old way are dropped.
+    """
+    name = "cache"
+    version = 1
+    hit_label = "hits"
+    miss_label = "misses"
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+
+    def use(self, key):
+        """The entry of key, counted as a hit and kept"""
+        self.hits += 1
+        entry = self.used[key] = self.entries[key]
+        return entry
+
+    def keep(self, key, entry):
+        self.entries[key] = self.used[key] = entry
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        return (f"{self.name.capitalize()}: {self.hits} {self.hit_label}, {self.misses} {self.miss_label}, "
+                f"{self.hit_rate:.0%} hit rate, {len(self.used)} entries kept")
+
+    def dumps(self):
+        return gzip.compress(json.dumps({"version": self.version, "entries": self.used}).encode("utf-8"))
+
+    @classmethod
+    def loads(cls, data):
+        content = json.loads(gzip.decompress(data))
+        if content.get("version") != cls.version:
+            logger.info(f"The {cls.name} was written by another version, starting afresh")
+            return cls()
+        return cls(content["entries"])
+
+
+class ResponseCache(RunCache):
+    """
+    GitHub responses keyed by request, with the ETag and Last-Modified validators GitHub answered them with.
+    Requests for a cached response are sent as conditional requests: a 304 Not Modified does not count
+    against the rate limit and the cached body is used.
+    """
+    name = "response cache"
+    hit_label = "not modified"
+    miss_label = "fetched"
+
+    def get_validators(self, key):
+        """The conditional request headers of a cached response, empty if it is not cached"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return {}
+        headers = entry["headers"]
+        validators = {}
+        if "ETag" in headers:
+            validators["If-None-Match"] = headers["ETag"]
+        if "Last-Modified" in headers:
+            validators["If-Modified-Since"] = headers["Last-Modified"]
+        return validators
+
+    def hit(self, key):
+        """The headers and body of a cached response GitHub answered 304 Not Modified for"""
+        entry = self.use(key)
+        return entry["headers"], entry["body"].encode("utf-8")
+
+    def put(self, key, headers, body):
+        """Keeps a 200 response if GitHub sent validators for it, a fresh response is a miss either way"""
+        self.misses += 1
+        kept = {name: headers[name] for name in KEPT_HEADERS if name in headers}
+        if "ETag" not in kept and "Last-Modified" not in kept:
+            return
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            return
+        self.keep(key, {"headers": kept, "body": text})
+
+
+def get_cache_store():
+    """The store GITHUB_CACHE_BLOB_URL or GITHUB_CACHE_PATH point at, None when caching is off"""
+    return get_env_store("GITHUB")
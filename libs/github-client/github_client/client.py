@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import os
+import re
+
+import aiohttp
+
+from github_client.cache import get_cache_key
+from github_client.scheduler import RateLimitScheduler, get_resource
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+# Requests in flight at once
+GITHUB_CONCURRENCY = int(os.getenv("GITHUB_CONCURRENCY", 16))
+# Attempts of a rate limited or failed request after the first
+GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", 5))
+
+# <https://api.github.com/...?page=2>; rel="next" entries of a Link header
+LINK = re.compile(r'<([^>]+)>;\s*rel="(\w+)"')
+
+logger = logging.getLogger(__name__)
+
+
+class GitHubError(RuntimeError):
+    """A request GitHub did not answer, still rate limited or failing after every retry, or not found"""
+
+    def __init__(self, url, status):
+        super().__init__(f"GET {url} failed with HTTP status {status}")
+        self.url = url
+        self.status = status
+
+
+def get_next_link(headers):
+    links = {rel: url for url, rel in LINK.findall(headers.get("Link", ""))}
+    return links.get("next")
+
+
+def create_session(token, concurrency=None):
+    """An aiohttp session authenticated with token, pooling as many connections as requests in flight"""
+    headers = {"Authorization": f"Bearer {token}", "X-GitHub-Api-Version": "2022-11-28"}
+    connector = aiohttp.TCPConnector(limit=concurrency or GITHUB_CONCURRENCY)
+    return aiohttp.ClientSession(headers=headers, connector=connector)
+
+
+class GitHubClient:
+    """
+    One pooled HTTP session for every GitHub request of a run, with at most concurrency requests in flight.
+    Requests are paced by a RateLimitScheduler and retried when rate limited or failed by a server error.
+    With a ResponseCache, requests for responses cached by an earlier run are sent as conditional requests
+    and answered from the cache when GitHub replies 304 Not Modified.
+    """
+
+    def __init__(self, session, concurrency=None, api_url=GITHUB_API_URL, cache=None, scheduler=None,
+                 max_retries=GITHUB_MAX_RETRIES):
+        self.session = session
+        self.api_url = api_url
+        self.cache = cache
+        self.scheduler = RateLimitScheduler() if scheduler is None else scheduler
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(concurrency or GITHUB_CONCURRENCY)
+        self.requests = 0
+        self.retries = 0
+
+    async def request(self, path, params=None, accept="application/vnd.github+json", cached=True):
+        """
+        Returns the status, headers and body of a GET of path, a path of the API or a full url.
+        A response served from the cache is returned as a 200 with its cached headers.
+        Pass cached=False for responses not worth keeping, e.g. content already cached by its sha.
+        Raises GitHubError when GitHub still rate limits or fails the request after max_retries retries.
+        """
+        url = path if path.startswith("http") else f"{self.api_url}{path}"
+        cache = self.cache if cached else None
+        key = get_cache_key(url, params, accept)
+        headers = {"Accept": accept, **(cache.get_validators(key) if cache is not None else {})}
+        resource = get_resource(url)
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                await self.scheduler.wait(resource)
+                async with self.session.get(url, params=params, headers=headers) as response:
+                    self.requests += 1
+                    status, response_headers, body = response.status, response.headers, await response.read()
+            self.scheduler.update(resource, response_headers)
+            if status < 400 or not self.scheduler.should_retry(status, response_headers, body):
+                break
+            if attempt >= self.max_retries:
+                raise GitHubError(url, status)
+            await self.scheduler.back_off(resource, status, response_headers, attempt)
+            attempt += 1
+            self.retries += 1
+            logger.info(f"Retrying GET {url} after HTTP status {status}, attempt {attempt}")
+
+        if cache is not None:
+            if status == 304:
+                cached_headers, body = cache.hit(key)
+                return 200, cached_headers, body
+            if status == 200:
+                cache.put(key, response_headers, body)
+        return status, response_headers, body
+
+    async def get_json(self, path, params=None):
+        status, _, body = await self.request(path, params)
+        return status, json.loads(body) if status == 200 else None
+
+    async def get_pages(self, path, params=None, limit=None):
+        """Every item of a paginated list, following the next links, or the first limit items"""
+        items, url, params = [], path, dict(params or {}, per_page=100)
+        while url and (limit is None or len(items) < limit):
+            status, headers, body = await self.request(url, params)
+            if status != 200:
+                raise GitHubError(url, status)
+            page = json.loads(body)
+            # Search results are wrapped in an object with the total count
+            items.extend(page["items"] if isinstance(page, dict) else page)
+            url, params = get_next_link(headers), None
+        return items if limit is None else items[:limit]
+
+    def summary(self):
+        return f"GitHub: {self.requests} requests, {self.retries} retried. {self.scheduler.summary()}"
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+import time
+
+# Share of each rate limit window's budget spread evenly up to its reset, requests are sent unpaced before
+GITHUB_RATE_LIMIT_RESERVE = float(os.getenv("GITHUB_RATE_LIMIT_RESERVE", 0.1))
+# First wait after a secondary rate limit without a Retry-After, doubled on each retry, GitHub asks for a minute
+SECONDARY_LIMIT_WAIT = 60
+# Longest wait between two attempts of a request GitHub failed with a server error
+MAX_SERVER_ERROR_WAIT = 30
+# Seconds waited past a reset, the clocks of GitHub and the job are not quite in step
+RESET_MARGIN = 1
+
+SERVER_ERROR_CODES = [500, 502, 503, 504]
+
+logger = logging.getLogger(__name__)
+
+
+def get_resource(url):
+    """The rate limit a request counts against, search has its own of 30 requests a minute"""
+    return "search" if "/search/" in url else "core"
+
+
+class RateLimit:
+    """The budget of one rate limit as its latest response reported it"""
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = 0.0
+        self.next_slot = 0.0
+
+
+class RateLimitScheduler:
+    """
+    Schedules the requests of a GitHub client against the rate limits GitHub reports with every response.
+
+    - Requests are sent as they come while more than the reserve share of a window's budget is left. The
+      reserve is spread evenly up to the window's reset, so a run slows down rather than runs out.
+    - Once the budget is spent, requests wait for the window to reset.
+    - Secondary rate limits pause every request for the Retry-After GitHub asks for, or a minute doubled
+      on each retry when it does not say.
+    """
+
+    def __init__(self, reserve=GITHUB_RATE_LIMIT_RESERVE, clock=time.time, sleep=asyncio.sleep):
+        self.reserve = reserve
+        self.clock = clock
+        self.sleep = sleep
+        self.limits = {}
+        self.resume_at = 0.0
+        self.waited = 0.0
+        self.throttled = 0
+
+    def get_limit(self, resource):
+        return self.limits.setdefault(resource, RateLimit())
+
+    def reserve_slot(self, resource):
+        """Seconds to wait before sending a request counting against resource"""
+        limit = self.get_limit(resource)
+        now = self.clock()
+        start = max(now, self.resume_at)
+        if limit.remaining is not None and now >= limit.reset:
+            # A new window, its budget is known from the next response
+            limit.remaining = None
+        if limit.remaining is not None:
+            if limit.remaining <= 0:
+                start = max(start, limit.reset + RESET_MARGIN)
+            elif limit.limit and limit.remaining <= limit.limit * self.reserve:
+                start = max(start, limit.next_slot)
+                limit.next_slot = start + max(limit.reset - start, 0) / limit.remaining
+        return start - now
+
+    async def wait(self, resource):
+        delay = self.reserve_slot(resource)
+        if delay > 0:
+            self.waited += delay
+            await self.sleep(delay)
+
+    def update(self, resource, headers):
+        """Records the budget a response reports"""
+        if "X-RateLimit-Remaining" not in headers:
+            return
+        limit = self.get_limit(resource)
+        limit.remaining = int(headers["X-RateLimit-Remaining"])
+        limit.limit = int(headers.get("X-RateLimit-Limit", limit.limit or 0)) or None
+        limit.reset = float(headers.get("X-RateLimit-Reset", limit.reset))
+
+    def should_retry(self, status, headers, body):
+        """Whether a failed response is rate limited or a server error, rather than e.g. not found or forbidden"""
+        if status in (403, 429):
+            return ("Retry-After" in headers or headers.get("X-RateLimit-Remaining") == "0" or status == 429
+                    or b"rate limit" in body.lower())
+        return status in SERVER_ERROR_CODES
+
+    async def back_off(self, resource, status, headers, attempt):
+        """Waits out a response should_retry accepted before it is retried"""
+        if status in SERVER_ERROR_CODES:
+            delay = min(2 ** attempt, MAX_SERVER_ERROR_WAIT)
+            self.waited += delay
+            await self.sleep(delay)
+            return
+        self.throttled += 1
+        if "Retry-After" not in headers and headers.get("X-RateLimit-Remaining") == "0":
+            # The primary budget is spent, update() has the reset the next attempt waits for
+            logger.info(f"GitHub {resource} rate limit spent, waiting for it to reset")
+            return
+        delay = float(headers["Retry-After"]) if "Retry-After" in headers else SECONDARY_LIMIT_WAIT * 2 ** attempt
+        logger.info(f"GitHub secondary rate limit hit, pausing requests for {delay:.0f} sec")
+        self.resume_at = max(self.resume_at, self.clock() + delay)
+
+    def summary(self):
+        return f"Rate limits: throttled {self.throttled} times, waited {self.waited:.1f} sec"
@@ -0,0 +1,88 @@
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class LocalStore:
+    """A cache file on local disk, e.g. on a mounted volume"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as file:
+            return file.read()
+
+    def save(self, data):
+        # Write next to the cache and move it in place, a failed run never leaves a truncated cache
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+            file.write(data)
+        os.replace(file.name, self.path)
+
+
+class BlobStorageStore:
+    """A cache file in an Azure storage blob, read and written with DefaultAzureCredential"""
+
+    def __init__(self, url, credential=None):
+        from azure.identity import DefaultAzureCredential
+        from azure.storage.blob import BlobClient
+        self.blob = BlobClient.from_blob_url(url, credential=credential or DefaultAzureCredential())
+
+    def load(self):
+        from azure.core.exceptions import ResourceNotFoundError
+        try:
+            return self.blob.download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+
+    def save(self, data):
+        self.blob.upload_blob(data, overwrite=True)
+
+
+def get_store(path="", blob_url=""):
+    """The store blob_url or else path point at, None when neither is set and caching is off"""
+    if blob_url:
+        return BlobStorageStore(blob_url)
+    if path:
+        return LocalStore(path)
+    return None
+
+
+def get_env_store(prefix):
+    """
+    The store of a cache configured by environment variables: <prefix>_CACHE_BLOB_URL, an Azure storage blob,
+    or else <prefix>_CACHE_PATH, a local file. None when neither is set and caching is off.
+    """
+    return get_store(os.getenv(f"{prefix}_CACHE_PATH", ""), os.getenv(f"{prefix}_CACHE_BLOB_URL", ""))
+
+
+def load_cache(store, cache_class):
+    """
+    The cache_class instance saved by the last run, or an empty one if there is none or it cannot be read.
+    cache_class is a RunCache.
+    """
+    if store is None:
+        return cache_class()
+    try:
+        data = store.load()
+        cache = cache_class.loads(data) if data else cache_class()
+    except Exception as e:
+        logger.warning(f"Cannot read the {cache_class.name}, starting afresh: {e}")
+        return cache_class()
+    logger.info(f"The {cache_class.name} was loaded with {len(cache.entries)} entries")
+    return cache
+
+
+def save_cache(store, cache):
+    if store is None:
+        return
+    try:
+        store.save(cache.dumps())
+    except Exception as e:
+        # The report is complete without it, the next run only makes more requests
+        logger.warning(f"Cannot save the {cache.name}: {e}")
@@ -0,0 +1,95 @@
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from github_client import GitHubClient, LocalStore, ResponseCache, get_next_link, load_cache, save_cache
+
+REPOS = {1: '[{"name": "b"}]', 2: '[{"name": "a"}]'}
+
+
+def create_app(requests):
+    """Two pages of repositories, answered 304 when the If-None-Match matches the page's ETag"""
+
+    async def repos(request):
+        page = int(request.query.get("page", 1))
+        requests.append((page, request.headers.get("If-None-Match")))
+        etag = f'"page-{page}"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        headers = {"ETag": etag}
+        if page == 1:
+            headers["Link"] = f'<{request.url.with_query(page=2)}>; rel="next"'
+        return web.Response(text=REPOS[page], headers=headers, content_type="application/json")
+
+    async def search(request):
+        return web.json_response({"total_count": 3, "items": [{"number": 1}, {"number": 2}, {"number": 3}]})
+
+    app = web.Application()
+    app.router.add_get("/orgs/hmcts/repos", repos)
+    app.router.add_get("/search/issues", search)
+    return app
+
+
+def run(requests, cache, action, runs=1):
+    """The results of action on a client, once per run against the same server"""
+    async def scan():
+        async with TestServer(create_app(requests)) as server:
+            results = []
+            for _ in range(runs):
+                async with aiohttp.ClientSession() as session:
+                    client = GitHubClient(session, concurrency=2, api_url=str(server.make_url("")).rstrip("/"),
+                                          cache=cache)
+                    results.append(await action(client))
+            return results if runs > 1 else results[0]
+
+    return asyncio.run(scan())
+
+
+def test_unchanged_responses_are_served_from_the_cache():
+    requests, cache = [], ResponseCache()
+
+    first, second = run(requests, cache, lambda client: client.get_pages("/orgs/hmcts/repos"), runs=2)
+
+    assert first == second == [{"name": "b"}, {"name": "a"}]
+    assert requests == [(1, None), (2, None), (1, '"page-1"'), (2, '"page-2"')]
+    assert (cache.hits, cache.misses, cache.hit_rate) == (2, 2, 0.5)
+
+
+def test_responses_without_validators_are_not_cached():
+    cache = ResponseCache()
+
+    items = run([], cache, lambda client: client.get_pages("/search/issues", {"q": "is:pr"}, limit=2))
+
+    assert items == [{"number": 1}, {"number": 2}]
+    assert (cache.misses, cache.entries) == (1, {})
+
+
+def test_uncached_requests_skip_the_cache():
+    cache = ResponseCache()
+
+    status, _, _ = run([], cache, lambda client: client.request("/orgs/hmcts/repos", cached=False))
+
+    assert status == 200
+    assert (cache.hits, cache.misses, cache.entries) == (0, 0, {})
+
+
+def test_cache_keeps_only_the_entries_used_by_the_run(tmp_path):
+    store = LocalStore(str(tmp_path / "github-cache.json.gz"))
+    cache = ResponseCache({"old": {"headers": {"ETag": '"old"'}, "body": "[]"}})
+    run([], cache, lambda client: client.get_pages("/orgs/hmcts/repos"))
+    save_cache(store, cache)
+
+    loaded = load_cache(store, ResponseCache)
+
+    assert len(loaded.entries) == 2
+    assert "old" not in loaded.entries
+    assert load_cache(LocalStore(str(tmp_path / "missing.json.gz")), ResponseCache).entries == {}
+
+
+def test_next_link():
+    headers = {"Link": '<https://api.github.com/x?page=3>; rel="next", <https://api.github.com/x?page=9>; rel="last"'}
+
+    assert get_next_link(headers) == "https://api.github.com/x?page=3"
+    assert get_next_link({}) is None
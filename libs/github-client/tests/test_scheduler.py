@@ -0,0 +1,116 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from github_client import GitHubClient, GitHubError, RateLimitScheduler
+from github_client.scheduler import RESET_MARGIN
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+def budget(remaining, reset, limit=5000):
+    return {"X-RateLimit-Limit": str(limit), "X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(reset)}
+
+
+def test_requests_are_unpaced_while_the_budget_lasts():
+    clock = Clock()
+    scheduler = RateLimitScheduler(reserve=0.1, clock=clock)
+    scheduler.update("core", budget(4000, clock.now + 3600))
+
+    assert [scheduler.reserve_slot("core") for _ in range(3)] == [0, 0, 0]
+
+
+def test_the_reserve_is_spread_up_to_the_reset():
+    clock = Clock()
+    scheduler = RateLimitScheduler(reserve=0.1, clock=clock)
+
+    scheduler.update("core", budget(5, clock.now + 10, limit=100))
+    first = scheduler.reserve_slot("core")
+    scheduler.update("core", budget(4, clock.now + 10, limit=100))
+    second = scheduler.reserve_slot("core")
+
+    assert (first, second) == (0, 2)
+
+
+def test_a_spent_budget_waits_for_the_reset():
+    clock = Clock()
+    scheduler = RateLimitScheduler(clock=clock)
+    scheduler.update("core", budget(0, clock.now + 30))
+
+    assert scheduler.reserve_slot("core") == 30 + RESET_MARGIN
+    assert scheduler.reserve_slot("search") == 0
+
+
+def create_app(responses, requests):
+    """Answers each request with the next of responses, a status and headers"""
+
+    async def handler(request):
+        requests.append(request.path)
+        status, headers = responses.pop(0) if responses else (200, {})
+        body = "[]" if status == 200 else '{"message": "You have exceeded a secondary rate limit"}'
+        return web.Response(status=status, text=body, headers=headers, content_type="application/json")
+
+    app = web.Application()
+    app.router.add_get("/{path:.*}", handler)
+    return app
+
+
+def run(responses, path="/orgs/hmcts/repos", max_retries=3):
+    requests, clock = [], Clock()
+    scheduler = RateLimitScheduler(clock=clock, sleep=clock.sleep)
+
+    async def scan():
+        async with TestServer(create_app(responses, requests)) as server:
+            async with aiohttp.ClientSession() as session:
+                client = GitHubClient(session, api_url=str(server.make_url("")).rstrip("/"), scheduler=scheduler,
+                                      max_retries=max_retries)
+                status, _, _ = await client.request(path)
+                return status, client.retries
+
+    return (*asyncio.run(scan()), requests, clock.sleeps)
+
+
+def test_secondary_rate_limits_are_retried_after_the_retry_after():
+    status, retries, requests, sleeps = run([(403, {"Retry-After": "7"}), (429, {})])
+
+    assert (status, retries, len(requests)) == (200, 2, 3)
+    assert sleeps == [7, 120]
+
+
+def test_a_spent_budget_is_retried_after_the_reset():
+    status, retries, _, sleeps = run([(403, budget(0, 1030))])
+
+    assert (status, retries, sleeps) == (200, 1, [30 + RESET_MARGIN])
+
+
+def test_server_errors_are_retried_with_backoff():
+    status, retries, _, sleeps = run([(502, {}), (503, {})])
+
+    assert (status, retries, sleeps) == (200, 2, [1, 2])
+
+
+def test_other_errors_are_returned():
+    status, retries, _, _ = run([(404, {})])
+
+    assert (status, retries) == (404, 0)
+
+
+def test_requests_still_limited_after_every_retry_raise():
+    with pytest.raises(GitHubError) as error:
+        run([(429, {})] * 3, max_retries=2)
+
+    assert error.value.status == 429
@@ -13,4 +13,5 @@ ACR_NAME=$4
 
 echo "Publishing a new image to '${ACR_NAME} for '${REPORT_NAME}'"
 
-az acr build -r "${ACR_NAME}" -t "${TAG}" -g "${ACR_RESOURCE_GROUP}" .
+# Built from the root of the repository, so the report's image can install the shared libraries in libs
+az acr build -r "${ACR_NAME}" -t "${TAG}" -g "${ACR_RESOURCE_GROUP}" -f "reports/${REPORT_NAME}/Dockerfile" .
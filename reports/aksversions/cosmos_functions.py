@@ -1,38 +1,46 @@
+import os
 import pytz
 from datetime import datetime
-from azure.cosmos import exceptions
+from cosmos_sink import CosmosSink
 
-# Checks to determine if the chart has already been processed
-# If chart data has not changed i.e the chart name, namespace, latest version and cluster name, it will be the same
-def remove_documents(container):
-    try:
-        current_time = get_formatted_datetime()
-        print(f"Removing all document added before {current_time}")
-        for item in container.query_items(
-                query='SELECT * FROM c',
-                enable_cross_partition_query=True):
-            container.delete_item(item, partition_key=item["clusterName"])
+# Partition key of the aksversions container
+PARTITION_KEY = "clusterName"
 
-        print("Removing documents complete")
-    except exceptions.CosmosHttpResponseError as remove_response_error:
-        print(f"Removing items from db failed with: {remove_response_error}")
+# Cluster names are only unique within a subscription
+KEY_FIELDS = ["subscription", "clusterName"]
+# Publish each run as a new generation behind a pointer document instead of syncing documents in place
+PUBLISH_GENERATIONS = os.getenv("PUBLISH_GENERATIONS", 'False').lower() in ('true', '1', 't')
+# Pointer document holding the generation readers should show
+POINTER_ID = "current-generation"
 
-# Add new documents to database
-def add_documents(container, documents):
-    print("Adding all documents.")
-    try:
-        for document in documents:
-            save_document(container, document)
-    except exceptions.CosmosHttpResponseError as add_response_error:
-        print(f"Adding document to db failed with CosmosHttpResponseError: {add_response_error}")
+# Save the documents of a run the way PUBLISH_GENERATIONS asks for
+def save_documents(container, documents):
+    if PUBLISH_GENERATIONS:
+        publish_documents(container, documents)
+    else:
+        sync_documents(container, documents)
 
-def save_document(container, document):
-    resource_name = document.get('cluster')
-    try:
-        container.create_item(body=document)
-    except exceptions.CosmosHttpResponseError as save_response_error:
-        print(f"Saving to db for {resource_name} failed with CosmosHttpResponseError: {save_response_error}")
-        raise
+# Replace last run's documents with the new ones, writing over the document of each cluster
+# and removing only the clusters no longer found
+def sync_documents(container, documents):
+    print(f"Syncing {len(documents)} documents at {get_formatted_datetime()}")
+    sink = CosmosSink(container, PARTITION_KEY)
+    failed = sink.sync(documents, KEY_FIELDS, f"SELECT c.id, c.{PARTITION_KEY}, c.contentHash FROM c")
+    if failed:
+        raise RuntimeError(f"{failed} documents could not be saved")
+    print(f"Syncing documents complete: {sink.summary}")
+
+# Write the documents as a new generation and point readers at it once every document is written,
+# older generations are given a ttl once the pointer has moved. Documents synced in place before, which have no ttl,
+# are removed once the pointer has moved
+def publish_documents(container, documents):
+    print(f"Publishing {len(documents)} documents at {get_formatted_datetime()}")
+    sink = CosmosSink(container, PARTITION_KEY)
+    failed = sink.publish(documents, KEY_FIELDS, POINTER_ID,
+                          synced_query=f"SELECT c.id, c.{PARTITION_KEY} FROM c WHERE NOT IS_DEFINED(c.generation)")
+    if failed:
+        raise RuntimeError(f"{failed} documents could not be written, the previous generation is still published")
+    print(f"Publishing documents complete: {sink.summary}")
 
 def get_now():
     return datetime.now(pytz.timezone('Europe/London'))
@@ -1,13 +1,12 @@
 # Import relevant packages
 import os
-import uuid
 import json
 import logging
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.resource import SubscriptionClient
 from azure.mgmt.containerservice import ContainerServiceClient
 from azure.cosmos import CosmosClient, exceptions
-from cosmos_functions import remove_documents, add_documents
+from cosmos_functions import save_documents
 
 # Set up logging with a custom format
 logging.basicConfig(
@@ -114,7 +113,6 @@ def main():
 
                 # Create a dictionary with all the cluster information
                 cluster = {
-                    "id": str(uuid.uuid4()),
                     "subscription": sub_details.display_name,
                     "clusterName": cluster.name,
                     "currentVersion": current_version,
@@ -146,8 +144,7 @@ def main():
             database = cosmosClient.get_database_client(database)
             db_container = database.get_container_client(container_name)
 
-            remove_documents(db_container)
-            add_documents(db_container, clusters_info)
+            save_documents(db_container, clusters_info)
 
         except AttributeError as attribute_error:
             logging.error(f"Saving to db failed with AttributeError error: {attribute_error}")
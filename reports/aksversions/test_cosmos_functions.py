@@ -0,0 +1,41 @@
+import pytest
+from cosmos_sink import get_document_id
+from cosmos_sink.fake import MAX_ITEM_BYTES, FakeContainer
+
+from cosmos_functions import KEY_FIELDS, sync_documents
+
+def get_cluster(subscription, cluster_name, version="1.30.0"):
+    return {"subscription": subscription, "clusterName": cluster_name, "kubernetesVersion": version}
+
+def get_ids(container):
+    return sorted(item["id"] for item in container.items)
+
+# Test clusters of the same name in different subscriptions are different documents, written over on the next run
+def test_clusters_are_written_over_by_subscription_and_name():
+    container = FakeContainer("/clusterName")
+    clusters = [get_cluster("DTS-CFTPTL-INTSVC", "cft-ptl-00-aks"), get_cluster("DTS-CFTSBOX-INTSVC", "cft-ptl-00-aks")]
+    sync_documents(container, clusters)
+
+    sync_documents(container, [get_cluster("DTS-CFTPTL-INTSVC", "cft-ptl-00-aks", "1.31.0"),
+                               get_cluster("DTS-CFTSBOX-INTSVC", "cft-ptl-00-aks")])
+
+    assert get_ids(container) == sorted(get_document_id(cluster, KEY_FIELDS) for cluster in clusters)
+    assert sorted(item["kubernetesVersion"] for item in container.items) == ["1.30.0", "1.31.0"]
+
+# Test clusters no longer found are removed
+def test_clusters_no_longer_found_are_removed():
+    container = FakeContainer("/clusterName")
+    sync_documents(container, [get_cluster("DTS-CFTPTL-INTSVC", "cft-ptl-00-aks"),
+                               get_cluster("DTS-CFTPTL-INTSVC", "cft-ptl-01-aks")])
+
+    sync_documents(container, [get_cluster("DTS-CFTPTL-INTSVC", "cft-ptl-01-aks")])
+
+    assert get_ids(container) == [get_document_id(get_cluster("DTS-CFTPTL-INTSVC", "cft-ptl-01-aks"), KEY_FIELDS)]
+
+# Test documents that could not be saved fail the job
+def test_failed_documents_fail_the_sync():
+    container = FakeContainer("/clusterName")
+    cluster = get_cluster("DTS-CFTPTL-INTSVC", "cft-ptl-00-aks", "x" * MAX_ITEM_BYTES)
+
+    with pytest.raises(RuntimeError, match="1 documents could not be saved"):
+        sync_documents(container, [cluster])
@@ -0,0 +1,37 @@
+import base64
+import zlib
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    import json
+
+    def json_dumps(value):
+        return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+    json_loads = json.loads
+
+# Bulky fields that are read back whole but never queried on
+COMPRESSED_FIELDS = ["descriptions", "affected"]
+# A compressed field is stored as <field>Compressed, the indexing policy excludes those paths
+COMPRESSED_SUFFIX = "Compressed"
+
+
+def compress_fields(document, fields=None):
+    """
+    Replace each field with a base64 encoded, zlib compressed copy of its JSON.
+    """
+    for field in fields or COMPRESSED_FIELDS:
+        value = document.pop(field, None)
+        if value is not None:
+            document[field + COMPRESSED_SUFFIX] = base64.b64encode(zlib.compress(json_dumps(value))).decode("ascii")
+    return document
+
+
+def decompress_fields(document):
+    """
+    Restore the compressed fields of a document read from the container, for its readers.
+    """
+    for key in [key for key in document if key.endswith(COMPRESSED_SUFFIX)]:
+        document[key[:-len(COMPRESSED_SUFFIX)]] = json_loads(zlib.decompress(base64.b64decode(document.pop(key))))
+    return document
@@ -0,0 +1,59 @@
+import contextlib
+import logging
+import pathlib
+import shutil
+import tempfile
+import urllib.request
+import zipfile
+
+from cve_repo import is_cve_json_file
+
+logger = logging.getLogger(__name__)
+
+
+def get_year_folder(name):
+    # Paths look like cves/<year>/<group>/CVE-<year>-<id>.json, possibly under another top level folder
+    return pathlib.PurePosixPath(name).parts[-3]
+
+
+@contextlib.contextmanager
+def open_cve_archive(source):
+    """
+    Open a bulk CVE release zip, from a local path or an http(s) URL, without extracting it.
+    A URL is downloaded to a single temporary file. The release assets wrap the zip of CVE
+    files in a second zip, that inner zip is read in place from the outer one.
+    """
+    with contextlib.ExitStack() as stack:
+        if source.startswith(("http://", "https://")):
+            logger.info(f"Downloading CVE archive: {source}")
+            download = stack.enter_context(tempfile.TemporaryFile())
+            with urllib.request.urlopen(source) as response:
+                shutil.copyfileobj(response, download)
+            download.seek(0)
+            archive = stack.enter_context(zipfile.ZipFile(download))
+        else:
+            archive = stack.enter_context(zipfile.ZipFile(source))
+
+        names = archive.namelist()
+        if not any(is_cve_json_file(name) for name in names):
+            inner = [name for name in names if name.endswith(".zip")]
+            if len(inner) == 1:
+                logger.info(f"Reading nested archive: {inner[0]}")
+                archive = stack.enter_context(zipfile.ZipFile(stack.enter_context(archive.open(inner[0]))))
+        yield archive
+
+
+def iter_archive_year_folders(archive):
+    """
+    Yield (year_folder, records) once for each year folder of the CVE files in archive, records
+    being (name, content) pairs. A year's members are read in the order they are stored, so a
+    nested archive is read forward unless the archive interleaves the files of different years.
+    """
+    members = sorted((info for info in archive.infolist() if is_cve_json_file(info.filename)),
+                     key=lambda info: info.header_offset)
+    logger.info(f"{len(members)} CVE files found in archive")
+    by_year = {}
+    for info in members:
+        by_year.setdefault(get_year_folder(info.filename), []).append(info)
+    for year_folder in sorted(by_year):
+        yield year_folder, ((info.filename, archive.read(info)) for info in by_year[year_folder])
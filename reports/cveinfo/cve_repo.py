@@ -0,0 +1,78 @@
+import datetime
+import logging
+import pathlib
+
+from git import Repo, GitCommandError
+
+# CVE project repo. Publicly accessible for use
+CVE_REPO_URL = "https://github.com/CVEProject/cvelistV5.git"
+
+logger = logging.getLogger(__name__)
+
+
+def clone_cve_repo(local_dir, shallow_since=None, sparse_paths=None, repo_url=CVE_REPO_URL):
+    """
+    Clone the cve repo to local_dir.
+    By default only the latest commit is fetched. When shallow_since is given the history
+    back to that date is fetched as well, so the changes since a checkpoint can be diffed.
+    When sparse_paths is given the clone is blobless and only those folders are checked
+    out, so only the files under them are downloaded.
+    """
+    logger.info(f'Cloning repo: {repo_url}')
+    envs = dict()
+    envs['sb'] = "--single-branch"
+    options = dict(shallow_since=shallow_since) if shallow_since else dict(depth=1)
+    if sparse_paths:
+        options.update(filter="blob:none", sparse=True)
+    repo = Repo.clone_from(repo_url, local_dir, env=envs, **options)
+    if sparse_paths:
+        logger.info(f"Checking out {', '.join(sparse_paths)}")
+        repo.git.sparse_checkout("set", *sparse_paths)
+    if repo:
+        logger.info(f'Successfully cloned repo: {repo_url}')
+    return repo
+
+
+def get_head_commit(repo):
+    commit = repo.head.commit
+    return {
+        "commit": commit.hexsha,
+        "committedDate": commit.committed_datetime.isoformat()
+    }
+
+
+def get_shallow_since(committed_date):
+    """
+    Date to fetch history from for a checkpoint commit, with a day of margin so the
+    checkpoint commit itself is always part of the clone.
+    """
+    since = datetime.datetime.fromisoformat(committed_date) - datetime.timedelta(days=1)
+    return since.isoformat()
+
+
+def is_cve_json_file(path):
+    name = pathlib.PurePosixPath(path).name
+    return name.startswith("CVE-") and name.endswith(".json")
+
+
+def get_changed_cve_files(repo, since_commit):
+    """
+    Return the CVE json files, relative to the repo root, added or modified between
+    since_commit and HEAD. Returns None when since_commit is not in the cloned history,
+    in which case the caller should fall back to a full load.
+    """
+    try:
+        repo.git.cat_file("-e", f"{since_commit}^{{commit}}")
+    except GitCommandError:
+        logger.warning(f"Checkpoint commit {since_commit} not found in cloned history")
+        return None
+
+    diff = repo.git.diff("--name-only", "--diff-filter=d", since_commit, "HEAD", "--", "cves")
+    changed = [path for path in diff.splitlines() if is_cve_json_file(path)]
+
+    deleted = repo.git.diff("--name-only", "--diff-filter=D", since_commit, "HEAD", "--", "cves")
+    deleted_count = len([path for path in deleted.splitlines() if is_cve_json_file(path)])
+    if deleted_count:
+        logger.info(f"{deleted_count} CVE files deleted upstream, incremental runs do not remove documents")
+
+    return sorted(changed)
@@ -1,21 +1,53 @@
 import asyncio
 import datetime
-import json
+import functools
 import os
 import pathlib
 import shutil
 import time
-import uuid
 from pathlib import Path
 
-from git import Repo
 from humanfriendly import format_timespan
 
-from save_to_db import add_batch
+try:
+    # Noticeably faster than the json module on the ~300k CVE files
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+from compression import compress_fields
+from cve_archive import iter_archive_year_folders, open_cve_archive
+from cve_repo import clone_cve_repo, get_changed_cve_files, get_head_commit, get_shallow_since
+from oversized import OversizedReport
+from pipeline import CvePipeline
+from progress import LoadProgress, read_resumable_progress, skip_committed_files
+from query_fields import get_query_fields
+from throttle import AdaptiveConcurrency
+from trim import trim_document
+from shards import SHARD_COUNT, SHARD_INDEX, ShardCoordinator, get_oldest_head, get_shard_order
+from save_to_db import add_batch, get_container, get_cosmos_client, get_state_container, \
+    read_checkpoint, remove_legacy_documents, remove_old_batch, save_checkpoint
 
 import logging
 
 MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 1000))
+# One-off clean up of documents written with random ids before ids were derived from the cveId
+MIGRATE_LEGACY_IDS = os.getenv("MIGRATE_LEGACY_IDS", 'False').lower() in ('true', '1', 't')
+# Reload every CVE instead of only the files changed since the last sync checkpoint
+FULL_SYNC = os.getenv("FULL_SYNC", 'False').lower() in ('true', '1', 't')
+SYNC_CHECKPOINT_ID = "sync-checkpoint"
+# Ignore the progress of an interrupted load and start again from the first year folder
+RESTART_LOAD = os.getenv("RESTART_LOAD", 'False').lower() in ('true', '1', 't')
+# Comma separated year folders to load, e.g. 2024,2025. Only those folders are cloned and walked
+CVE_YEARS = os.getenv("CVE_YEARS", "")
+# Load the given number of most recent year folders, the current year included
+CVE_RECENT_YEARS = int(os.getenv("CVE_RECENT_YEARS", 0))
+# Store descriptions and affected compressed, see compression.decompress_fields for reading them back
+COMPRESS_BULKY_FIELDS = os.getenv("COMPRESS_BULKY_FIELDS", 'False').lower() in ('true', '1', 't')
+# Path or URL of a bulk CVE release zip, when set CVEs are read from it instead of cloning the repo
+CVE_ARCHIVE = os.getenv("CVE_ARCHIVE")
+# Delete documents not written by a complete full sync
+PRUNE_STALE_DOCUMENTS = os.getenv("PRUNE_STALE_DOCUMENTS", 'True').lower() in ('true', '1', 't')
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
@@ -25,10 +57,23 @@ logging.getLogger("azure.cosmos").setLevel(logging.ERROR)
 
 
 # Utility used to cheery pick cve object
-def extract_cve_data(job_time, cve_data):
+def get_cve_year(cve_id):
+    """Year of a CVE-YYYY-NNNN id, which never changes, unlike the dateReserved"""
+    parts = cve_id.split('-') if isinstance(cve_id, str) else []
+    return parts[1] if len(parts) == 3 and parts[1].isdigit() else None
+
+
+def extract_cve_data(job_time, cve_data, run_id=None):
     """
     Safely extract relevant fields from a CVE JSON object for database insertion.
     Handles missing keys gracefully.
+    The document id is the cveId so each CVE always maps to the same document and
+    can be written with a single upsert. run_id marks the run that last wrote the document.
+    The upsert only replaces the document in the same partition: should the partition key, e.g.
+    dateReserved, change upstream, a second document is written in the new partition. The old one
+    is left until a full run prunes it, as it does not carry that run's run_id. With /cveYear as
+    the partition key this cannot happen, the year being part of the cveId.
+    Flat severity, vendor/product and publication fields are added for querying.
     """
     def get_nested(d, *keys, default=None):
         for key in keys:
@@ -38,9 +83,11 @@ def extract_cve_data(job_time, cve_data):
                 return default
         return d
 
+    cve_id = get_nested(cve_data, 'cveMetadata', 'cveId')
     data = {
-        'id': str(uuid.uuid4()),
-        'cveId': get_nested(cve_data, 'cveMetadata', 'cveId'),
+        'id': cve_id,
+        'cveId': cve_id,
+        'cveYear': get_cve_year(cve_id),
         'state': get_nested(cve_data, 'cveMetadata', 'state'),
         'dataType': cve_data.get('dataType'),
         'dataVersion': cve_data.get('dataVersion'),
@@ -51,11 +98,49 @@ def extract_cve_data(job_time, cve_data):
         'descriptions': get_nested(cve_data, 'containers', 'cna', 'descriptions'),
         'affected': get_nested(cve_data, 'containers', 'cna', 'affected'),
         'metrics': get_nested(cve_data, 'containers', 'cna', 'metrics'),
-        'runTime': job_time
+        **get_query_fields(cve_data),
+        'runTime': job_time,
+        'runId': run_id
     }
     return data
 
 
+def parse_cve_records(job_time, records, run_id=None):
+    """
+    Extract a chunk of (name, content) CVE records into (document, size) pairs. Runs in a parse worker process.
+    """
+    documents = []
+    for name, content in records:
+        data = extract_cve_data(job_time, json_loads(content), run_id)
+        if not data['cveId']:
+            logger.warning(f"Skipping {name}: no cveId found")
+            continue
+        if COMPRESS_BULKY_FIELDS:
+            compress_fields(data)
+        documents.append(trim_document(data))
+    return documents
+
+
+def read_cve_file(file):
+    with open(file, mode='rb') as cve:
+        return cve.read()
+
+
+def parse_cve_files(job_time, files, run_id=None):
+    """
+    Read and extract a chunk of CVE files. Runs in a parse worker process.
+    """
+    return parse_cve_records(job_time, ((file, read_cve_file(file)) for file in files), run_id)
+
+
+def log_write_cost(pipeline, controller, charge_before):
+    """Average size and RU cost of the documents a pipeline wrote, to compare storage options"""
+    documents = pipeline.write_stats.items
+    if documents:
+        logger.info(f"Average document {pipeline.document_bytes / documents:.0f} bytes, "
+                    f"{(controller.total_charge - charge_before) / documents:.2f} RU per document written")
+
+
 def get_year():
     today = datetime.datetime.now()
     return today.strftime("%Y")
@@ -66,42 +151,115 @@ def get_job_run_time():
     return today.strftime("%H:%M:%S")
 
 
-def filter_by_year(cve_filename):
-    pattern = f"/{get_year()}/"
-    if pattern in str(cve_filename):
-        return True
-    return False
+def get_run_id():
+    return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def get_sync_years():
+    """
+    Year folders a partial load is limited to, or None to load every year.
+    """
+    years = {year.strip() for year in CVE_YEARS.split(",") if year.strip()}
+    if CVE_RECENT_YEARS:
+        current_year = int(get_year())
+        years.update(str(year) for year in range(current_year - CVE_RECENT_YEARS + 1, current_year + 1))
+    return sorted(years) or None
 
 
 def iter_cve_json_files(path):
     """
-    Recursively yield all files matching 'CVE-*.json' under the given path.
+    Recursively yield all files matching 'CVE-*.json' under the given path, in sorted
+    order so an interrupted load can tell which files it has already saved.
     """
     path = pathlib.Path(path)
-    for entry in path.iterdir():
+    for entry in sorted(path.iterdir()):
         if entry.is_file() and entry.name.startswith("CVE-") and entry.suffix == ".json":
             yield entry
         elif entry.is_dir():
             yield from iter_cve_json_files(entry)
 
 
-async def load_cve(job_time):
+def iter_year_folders(cve_dir, changed_files=None, years=None):
+    """
+    Yield (year_folder, files) for each year folder under cve_dir, or only for years when given.
+    For a full load every CVE file is walked. For an incremental load only the
+    changed files, relative to the repo root, are grouped by their year folder.
+    """
+    if changed_files is None:
+        for year_folder in sorted(os.listdir(cve_dir)):
+            year_path = os.path.join(cve_dir, year_folder)
+            if os.path.isdir(year_path) and (years is None or year_folder in years):
+                yield year_folder, iter_cve_json_files(year_path)
+        return
+
+    repo_dir = os.path.dirname(cve_dir)
+    by_year = {}
+    for changed_file in changed_files:
+        # Paths look like cves/<year>/<group>/CVE-<year>-<id>.json
+        year_folder = pathlib.PurePosixPath(changed_file).parts[1]
+        by_year.setdefault(year_folder, []).append(Path(repo_dir, changed_file))
+    for year_folder in sorted(by_year):
+        yield year_folder, by_year[year_folder]
+
+
+async def load_cve(job_time, run_id, container, state_container, controller):
     start_time = time.time()
 
     # get the current working directory
     current_working_directory = Path.cwd()
     local_dir = os.path.join(current_working_directory, "cverepo")
 
-    # CVE project repo. Publicly accessible for use
-    repo_url = "https://github.com/CVEProject/cvelistV5.git"
-    logger.info(f'Cloning repo: {repo_url}')
+    progress = None
+    if RESTART_LOAD:
+        logger.info("Restart requested, progress of any interrupted load is ignored")
+    elif SHARD_COUNT > 1:
+        logger.info(f"Sharded load across {SHARD_COUNT} workers, shard leases take the place of load progress")
+    else:
+        progress = await read_resumable_progress(state_container)
+
+    years = get_sync_years()
+    checkpoint = None
+    if years:
+        logger.info(f"Partial load of year folders {', '.join(years)}, the sync checkpoint is not used")
+    elif FULL_SYNC:
+        logger.info("Full sync requested, every CVE will be loaded")
+    else:
+        checkpoint = await read_checkpoint(state_container, SYNC_CHECKPOINT_ID)
+        if checkpoint is None:
+            logger.info("No sync checkpoint found, every CVE will be loaded")
+
+    # Shallow clone, only latest commit unless history is needed to diff from a checkpoint
+    dates = [doc["committedDate"] for doc in (checkpoint, progress) if doc]
+    shallow_since = get_shallow_since(min(dates, key=datetime.datetime.fromisoformat)) if dates else None
+    sparse_paths = [f"cves/{year}" for year in years] if years else None
+    repo = clone_cve_repo(local_dir, shallow_since=shallow_since, sparse_paths=sparse_paths)
 
-    # Clone the cve repo to local_dir (shallow clone, only latest commit)
-    envs = dict()
-    envs['sb'] = "--single-branch"
-    repo = Repo.clone_from(repo_url, local_dir, env=envs, depth=1)
-    if repo:
-        logger.info(f'Successfully cloned repo: {repo_url}')
+    if progress and progress["mode"] == "full":
+        # Finish the full load the interrupted run started
+        checkpoint = None
+
+    changed_files = None
+    if checkpoint:
+        changed_files = get_changed_cve_files(repo, checkpoint["commit"])
+        if changed_files is None:
+            logger.info("Falling back to loading every CVE")
+        else:
+            logger.info(f"{len(changed_files)} CVE files changed since commit {checkpoint['commit']}")
+    if years:
+        sync_mode = "partial"
+    else:
+        sync_mode = "full" if changed_files is None else "incremental"
+
+    changed_since_progress = None
+    if progress:
+        changed_since_progress = get_changed_cve_files(repo, progress["commit"])
+        if progress["mode"] != sync_mode or progress.get("years") != years or changed_since_progress is None:
+            logger.warning(f"Cannot resume the interrupted {progress['mode']} load, starting again")
+            progress = None
+        else:
+            logger.info(f"Resuming run {progress['runId']} after {progress['lastFile']}")
+            # Keep the interrupted run's id so the documents it saved are not pruned
+            run_id = progress["runId"]
 
     # Get path to cve files
     cve_dir = os.path.join(current_working_directory, "cverepo", "cves")
@@ -109,35 +267,43 @@ async def load_cve(job_time):
         # Sanity check there is a cves folder
         if os.path.isdir(cve_dir):
             logger.info(f"The cve repository at {cve_dir} exists")
-            batch = []
-            total_files = 0
-            # Process one subfolder at a time to reduce memory usage
-            for year_folder in sorted(os.listdir(cve_dir)):
-                year_path = os.path.join(cve_dir, year_folder)
-                if not os.path.isdir(year_path):
-                    continue
-                logger.info(f"Processing folder: {year_path}")
-                folder_file_count = 0
-                for file in iter_cve_json_files(year_path):
-                    with open(file, mode='r') as cve:
-                        data = json.load(cve)
-                        data = extract_cve_data(job_time, data)
-                        batch.append(data)
-                        folder_file_count += 1
-                        total_files += 1
-                        if len(batch) == MAX_BATCH_SIZE:
-                            logger.info(f"Saving batch of {MAX_BATCH_SIZE} items from folder {year_folder}")
-                            await save_and_reset_batch(batch)
-                if batch:
-                    logger.info(f"Saving batch of {len(batch)} items after folder {year_folder}")
-                    await save_and_reset_batch(batch)
-                logger.info(f"Finished processing folder: {year_path} ({folder_file_count} files)")
-            if batch:
-                logger.info(f"Saving remaining batch of {len(batch)} items after all folders")
-                await save_and_reset_batch(batch, is_final=True)
-            logger.info(f"Total files processed: {total_files}")
-            # TODO: Clean old data
-            # await remove_old_batch(job_time)
+            head = get_head_commit(repo)
+            repo_dir = os.path.dirname(cve_dir)
+            year_folders = iter_year_folders(cve_dir, changed_files, years)
+            if SHARD_COUNT > 1:
+                since = checkpoint["commit"] if changed_files is not None else None
+                await load_shards(job_time, run_id, container, state_container, controller,
+                                  sync_mode, years, since, head, year_folders)
+            else:
+                if progress:
+                    year_folders = skip_committed_files(year_folders, repo_dir, progress, changed_since_progress)
+                load_progress = LoadProgress(state_container, run_id, sync_mode, head, repo_dir, years)
+                oversized = OversizedReport(run_id)
+
+                parse = functools.partial(parse_cve_files, run_id=run_id)
+                pipeline = CvePipeline(parse, functools.partial(add_batch, container, controller=controller),
+                                       MAX_BATCH_SIZE, on_progress=load_progress.on_batch_committed,
+                                       on_oversized=oversized.add)
+                charge_before = controller.total_charge
+                total_files, failed_batches = await pipeline.run(job_time, year_folders)
+                logger.info(f"Total files processed: {total_files} ({sync_mode} sync)")
+                log_write_cost(pipeline, controller, charge_before)
+                await oversized.save(state_container)
+
+                # Only move the checkpoint on when everything up to HEAD has been saved
+                if failed_batches:
+                    logger.error(f"{failed_batches} batches failed, sync checkpoint not updated")
+                elif sync_mode == "partial":
+                    await load_progress.complete()
+                    logger.info("Partial load complete, sync checkpoint not updated")
+                else:
+                    await load_progress.complete()
+                    await save_checkpoint(state_container, SYNC_CHECKPOINT_ID, dict(head, mode=sync_mode))
+                    logger.info(f"Sync checkpoint updated to commit {head['commit']}")
+
+                # Documents a complete full run did not write are no longer in the upstream list
+                if PRUNE_STALE_DOCUMENTS and sync_mode == "full" and not failed_batches:
+                    await remove_old_batch(container, run_id, controller)
         else:
             logger.error(f"The cve repository at {cve_dir} does not exist")
     finally:
@@ -150,16 +316,101 @@ async def load_cve(job_time):
     logger.info(f'Elapsed time: {format_timespan(elapsed_time)}')
 
 
-async def save_and_reset_batch(batch, is_final=False):
-    await add_batch(batch)
-    # Logging is now handled in load_cve
-    batch.clear()
+async def load_shards(job_time, run_id, container, state_container, controller, sync_mode, years, since, head,
+                      year_folders):
+    """
+    Load the year folders, one shard each, that no other worker of the sharded run has claimed,
+    waiting on the shards other workers hold in case one of them dies.
+    The worker that finishes the last shard moves the sync checkpoint on and prunes.
+    """
+    year_folders = dict(year_folders)
+    coordinator = ShardCoordinator(state_container)
+    run = await coordinator.join(run_id, sync_mode, years, head, sorted(year_folders), since)
+    # Every worker writes with the run's id so a full run can be pruned as one
+    run_id = run["runId"]
+
+    parse = functools.partial(parse_cve_files, run_id=run_id)
+    write = functools.partial(add_batch, container, controller=controller)
+    async for lease in coordinator.claim_until_done(get_shard_order(run["shards"], SHARD_INDEX, SHARD_COUNT)):
+        shard = lease.document["shard"]
+        logger.info(f"Loading shard {shard}")
+        oversized = OversizedReport(run_id)
+        async with lease.keep_alive():
+            pipeline = CvePipeline(parse, write, MAX_BATCH_SIZE, on_oversized=oversized.add)
+            charge_before = controller.total_charge
+            total_files, failed_batches = await pipeline.run(job_time, [(shard, year_folders.get(shard, []))])
+        log_write_cost(pipeline, controller, charge_before)
+        await lease.complete(head, failed_batches, oversized)
+        logger.info(f"Shard {shard} done: {total_files} files processed")
+
+    leases = await coordinator.finish()
+    if leases is None:
+        logger.info("No shards left to claim, the last worker to finish completes the run")
+        return
+
+    oversized = OversizedReport(run_id)
+    for lease in leases:
+        oversized.extend(lease.get("oversized", []), lease.get("oversizedCount", 0))
+    await oversized.save(state_container)
+
+    failed_batches = sum(lease["failedBatches"] for lease in leases)
+    if failed_batches:
+        logger.error(f"{failed_batches} batches failed across shards, sync checkpoint not updated")
+        return
+    if sync_mode != "partial":
+        # Workers may have cloned different commits, only the oldest is loaded in every shard
+        checkpoint = get_oldest_head([run] + leases)
+        await save_checkpoint(state_container, SYNC_CHECKPOINT_ID, dict(checkpoint, mode=sync_mode))
+        logger.info(f"Sync checkpoint updated to commit {checkpoint['commit']}")
+    if PRUNE_STALE_DOCUMENTS and sync_mode == "full":
+        await remove_old_batch(container, run_id, controller)
+
+
+async def load_cve_archive(job_time, run_id, container, state_container, controller):
+    """
+    Full load straight from a bulk release archive, no clone and nothing extracted to disk.
+    The archive has no commit to diff from later, so the sync checkpoint is left as it is.
+    """
+    start_time = time.time()
+    logger.info(f"Loading CVEs from archive {CVE_ARCHIVE}")
+
+    oversized = OversizedReport(run_id)
+    with open_cve_archive(CVE_ARCHIVE) as archive:
+        parse = functools.partial(parse_cve_records, run_id=run_id)
+        pipeline = CvePipeline(parse, functools.partial(add_batch, container, controller=controller), MAX_BATCH_SIZE,
+                               on_oversized=oversized.add)
+        charge_before = controller.total_charge
+        total_files, failed_batches = await pipeline.run(job_time, iter_archive_year_folders(archive))
+    logger.info(f"Total files processed: {total_files} (archive)")
+    log_write_cost(pipeline, controller, charge_before)
+    await oversized.save(state_container)
+
+    if failed_batches:
+        logger.error(f"{failed_batches} batches failed")
+    elif PRUNE_STALE_DOCUMENTS:
+        await remove_old_batch(container, run_id, controller)
+
+    elapsed_time = time.time() - start_time
+    logger.info(f'Elapsed time: {format_timespan(elapsed_time)}')
 
 
 async def main():
     job_time = get_job_run_time()
-    logger.info(f"Starting job at {job_time}")
-    await load_cve(job_time)
+    run_id = get_run_id()
+    logger.info(f"Starting job at {job_time}, run {run_id}")
+    # One client and container handle for the whole run, closed when the job completes
+    async with get_cosmos_client() as client:
+        container = get_container(client)
+        state_container = get_state_container(client)
+        # One concurrency controller for every write of the run, so the RU budget applies to the whole job
+        controller = AdaptiveConcurrency()
+        if CVE_ARCHIVE:
+            await load_cve_archive(job_time, run_id, container, state_container, controller)
+        else:
+            await load_cve(job_time, run_id, container, state_container, controller)
+        if MIGRATE_LEGACY_IDS:
+            await remove_legacy_documents(container, controller)
+        logger.info(f"Cosmos usage: {controller.summary()}")
 
 
 if __name__ == "__main__":
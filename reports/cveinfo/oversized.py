@@ -0,0 +1,38 @@
+import logging
+
+from save_to_db import save_checkpoint
+
+OVERSIZED_REPORT_ID = "oversized-documents"
+# Keep the report itself well within the item size limit
+MAX_REPORTED_DOCUMENTS = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class OversizedReport:
+    """
+    Documents a run could not save because they are over the item size limit, written to the
+    state container as a side report so they can be followed up.
+    """
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.count = 0
+        self.documents = []
+
+    def add(self, document, size):
+        self.count += 1
+        if len(self.documents) < MAX_REPORTED_DOCUMENTS:
+            self.documents.append({"cveId": document.get("cveId"), "dateReserved": document.get("dateReserved"),
+                                   "size": size})
+
+    def extend(self, documents, count):
+        self.count += count
+        self.documents.extend(documents[:MAX_REPORTED_DOCUMENTS - len(self.documents)])
+
+    async def save(self, state_container):
+        # Written after every run, so the report never lists documents of an earlier run
+        await save_checkpoint(state_container, OVERSIZED_REPORT_ID,
+                              {"runId": self.run_id, "count": self.count, "documents": self.documents})
+        if self.count:
+            logger.warning(f"{self.count} documents over the size limit were not saved, see {OVERSIZED_REPORT_ID}")
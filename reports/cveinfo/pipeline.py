@@ -0,0 +1,251 @@
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from trim import MAX_DOCUMENT_BYTES
+
+# Parse processes used unless PARSE_WORKERS is set. The CPUs the job may run on are counted rather than the node's,
+# but a container's CPU limit does not show there, so set PARSE_WORKERS to the limit when it is lower
+MAX_DEFAULT_PARSE_WORKERS = 4
+
+
+def get_default_parse_workers():
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available outside Linux
+        cpus = os.cpu_count() or 1
+    return min(cpus, MAX_DEFAULT_PARSE_WORKERS)
+
+
+# Expose pipeline sizing via environment variables
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", get_default_parse_workers()))
+PARSE_CHUNK_SIZE = int(os.getenv("PARSE_CHUNK_SIZE", 100))
+WRITE_WORKERS = int(os.getenv("WRITE_WORKERS", 2))
+# Number of batches allowed to wait for a writer, this bounds the memory held by the pipeline
+QUEUE_SIZE = int(os.getenv("QUEUE_SIZE", 4))
+STATS_INTERVAL = float(os.getenv("PIPELINE_STATS_INTERVAL", 60))
+# Serialised size a batch is closed at, along with MAX_BATCH_SIZE, so each batch holds a similar amount of memory
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", 8 * 1024 * 1024))
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    """
+    Throughput counters for one stage of the pipeline.
+    busy is the time the stage spent working, waiting the time the stage before it was held up
+    by this one, so the stage with the highest utilisation and waiting time is the bottleneck.
+    """
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    def summary(self, elapsed):
+        rate = self.items / elapsed if elapsed else 0
+        utilisation = self.busy / (elapsed * self.workers) * 100 if elapsed else 0
+        return f"{self.name}: {self.items} items ({rate:.1f}/s, {utilisation:.0f}% busy, {self.waiting:.1f}s waiting)"
+
+
+def timed_parse(parse, job_time, chunk):
+    """Runs in a parse worker, returning the parsed documents with their sizes and the time spent parsing them"""
+    start = time.perf_counter()
+    documents = parse(job_time, chunk)
+    return documents, time.perf_counter() - start
+
+
+class CvePipeline:
+    """
+    Staged load of CVE files so disk, CPU and network work overlap:
+    the directory walk feeds chunks of files to a pool of parse workers, parsed documents
+    are grouped into batches and handed over a bounded queue to concurrent writers.
+
+    parse(job_time, files) must be a module level function returning a list of (document, size)
+    pairs, size being the serialised size trim_document measured. write(batch) is a coroutine
+    function returning False when the batch failed. A batch is closed at max_batch_size
+    documents or max_batch_bytes of serialised documents.
+    Documents over max_document_bytes are never written, they are passed to
+    on_oversized(document, size) instead.
+    on_progress(year_folder, last_file), when given, is awaited once every file up to and
+    including last_file has been written, in the order the files were read. Batches can be
+    written out of order, so progress only moves on past batches that are all saved and
+    stops at the first failed one.
+    """
+
+    def __init__(self, parse, write, max_batch_size, parse_workers=None, write_workers=None,
+                 queue_size=None, chunk_size=None, on_progress=None, max_batch_bytes=None,
+                 max_document_bytes=None, on_oversized=None):
+        self.parse = parse
+        self.write = write
+        self.on_progress = on_progress
+        self.on_oversized = on_oversized
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes or MAX_BATCH_BYTES
+        self.max_document_bytes = max_document_bytes or MAX_DOCUMENT_BYTES
+        self.batch_bytes = 0
+        self.document_bytes = 0
+        self.parse_workers = parse_workers or PARSE_WORKERS
+        self.write_workers = write_workers or WRITE_WORKERS
+        self.chunk_size = chunk_size or PARSE_CHUNK_SIZE
+        self.queue = asyncio.Queue(maxsize=queue_size or QUEUE_SIZE)
+        self.read_stats = StageStats("read")
+        self.parse_stats = StageStats("parse", self.parse_workers)
+        self.write_stats = StageStats("write", self.write_workers)
+        self.failed_batches = 0
+        self.start_time = None
+        # Progress tracking: where each parsed chunk ends, in documents parsed, and which batches are written
+        self.parsed_documents = 0
+        self.queued_documents = 0
+        self.chunk_ends = collections.deque()
+        self.marker = None
+        self.next_sequence = 0
+        self.next_commit = 0
+        self.written = {}
+        self.progress_stopped = False
+        self.progress_lock = asyncio.Lock()
+
+    async def run(self, job_time, year_folders):
+        """
+        Load every file yielded by year_folders, an iterable of (year_folder, files).
+        Returns the number of documents processed and the number of failed batches.
+        """
+        self.start_time = time.perf_counter()
+        writers = [asyncio.create_task(self.consume()) for _ in range(self.write_workers)]
+        reporter = asyncio.create_task(self.report_periodically())
+        try:
+            with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+                await self.produce(executor, job_time, year_folders)
+            for _ in writers:
+                await self.queue.put(None)
+            await asyncio.gather(*writers)
+        except BaseException:
+            for writer in writers:
+                writer.cancel()
+            raise
+        finally:
+            reporter.cancel()
+            self.log_stats()
+
+        return self.write_stats.items, self.failed_batches
+
+    async def produce(self, executor, job_time, year_folders):
+        loop = asyncio.get_running_loop()
+        batch = []
+        for year_folder, files in year_folders:
+            logger.info(f"Processing folder: {year_folder}")
+            folder_file_count = 0
+            pending = collections.deque()
+            files = iter(files)
+            while True:
+                # Walking the folder is the read stage
+                start = time.perf_counter()
+                chunk = list(itertools.islice(files, self.chunk_size))
+                self.read_stats.busy += time.perf_counter() - start
+                if not chunk:
+                    break
+                self.read_stats.items += len(chunk)
+                folder_file_count += len(chunk)
+                parsed = loop.run_in_executor(executor, timed_parse, self.parse, job_time, chunk)
+                pending.append((parsed, chunk[-1]))
+                # Keep every parse worker busy without reading ahead of them
+                if len(pending) >= self.parse_workers * 2:
+                    batch = await self.collect(*pending.popleft(), batch, year_folder)
+            while pending:
+                batch = await self.collect(*pending.popleft(), batch, year_folder)
+            if batch:
+                logger.info(f"Queueing batch of {len(batch)} items after folder {year_folder}")
+                await self.put(batch)
+                batch = []
+            logger.info(f"Finished reading folder: {year_folder} ({folder_file_count} files)")
+
+    async def collect(self, parsed, last_file, batch, year_folder):
+        start = time.perf_counter()
+        documents, parse_time = await parsed
+        self.parse_stats.waiting += time.perf_counter() - start
+        self.parse_stats.items += len(documents)
+        self.parse_stats.busy += parse_time
+
+        # Oversized documents count as queued straight away, so progress can move past them
+        self.parsed_documents += len(documents)
+        self.chunk_ends.append((self.parsed_documents, year_folder, last_file))
+        for document, size in documents:
+            if size > self.max_document_bytes:
+                await self.divert(document, size)
+                continue
+            if batch and self.batch_bytes + size > self.max_batch_bytes:
+                logger.info(f"Queueing batch of {len(batch)} items ({self.batch_bytes} bytes) from folder {year_folder}")
+                await self.put(batch)
+                batch = []
+            batch.append(document)
+            self.batch_bytes += size
+            self.document_bytes += size
+            if len(batch) >= self.max_batch_size:
+                logger.info(f"Queueing batch of {len(batch)} items from folder {year_folder}")
+                await self.put(batch)
+                batch = []
+        return batch
+
+    async def divert(self, document, size):
+        logger.error(f"{document.get('id')} is {size} bytes, over the {self.max_document_bytes} byte limit, not saved")
+        self.queued_documents += 1
+        if self.on_oversized:
+            self.on_oversized(document, size)
+
+    async def put(self, batch):
+        # Time spent blocked here means the writers are the bottleneck
+        self.queued_documents += len(batch)
+        self.batch_bytes = 0
+        # The batch completes every chunk whose documents have now all been queued
+        while self.chunk_ends and self.chunk_ends[0][0] <= self.queued_documents:
+            self.marker = self.chunk_ends.popleft()[1:]
+        sequence = self.next_sequence
+        self.next_sequence += 1
+
+        start = time.perf_counter()
+        await self.queue.put((sequence, batch, self.marker))
+        self.write_stats.waiting += time.perf_counter() - start
+
+    async def consume(self):
+        while True:
+            entry = await self.queue.get()
+            if entry is None:
+                return
+            sequence, batch, marker = entry
+            start = time.perf_counter()
+            saved = await self.write(batch)
+            self.write_stats.busy += time.perf_counter() - start
+            self.write_stats.items += len(batch)
+            if not saved:
+                self.failed_batches += 1
+            await self.commit(sequence, saved, marker)
+
+    async def commit(self, sequence, saved, marker):
+        self.written[sequence] = (saved, marker)
+        async with self.progress_lock:
+            progress = None
+            while self.next_commit in self.written:
+                saved, marker = self.written.pop(self.next_commit)
+                self.next_commit += 1
+                self.progress_stopped = self.progress_stopped or not saved
+                if not self.progress_stopped and marker:
+                    progress = marker
+            if progress and self.on_progress:
+                await self.on_progress(*progress)
+
+    async def report_periodically(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            self.log_stats()
+
+    def log_stats(self):
+        elapsed = time.perf_counter() - self.start_time
+        stages = ", ".join(stats.summary(elapsed) for stats in (self.read_stats, self.parse_stats, self.write_stats))
+        logger.info(f"Pipeline stats after {elapsed:.0f}s - {stages}, queue {self.queue.qsize()}/{self.queue.maxsize}")
@@ -0,0 +1,71 @@
+import logging
+import os
+import pathlib
+
+from save_to_db import read_checkpoint, save_checkpoint
+
+LOAD_PROGRESS_ID = "load-progress"
+
+logger = logging.getLogger(__name__)
+
+
+def get_relative_path(file, repo_dir):
+    return pathlib.Path(os.path.relpath(file, repo_dir)).as_posix()
+
+
+async def read_resumable_progress(state_container):
+    """
+    Progress of a load that did not finish, or None if the last load completed.
+    """
+    progress = await read_checkpoint(state_container, LOAD_PROGRESS_ID)
+    if progress and progress.get("status") == "running" and progress.get("lastFile"):
+        return progress
+    return None
+
+
+def skip_committed_files(year_folders, repo_dir, progress, changed_since_progress):
+    """
+    Filter the files of (year_folder, files) pairs down to those the interrupted load had
+    not yet saved. Files are walked in sorted order, so everything up to the recorded
+    lastFile was saved, unless it changed upstream since the interrupted load's commit.
+    """
+    changed = set(changed_since_progress)
+    last_folder = progress["folder"]
+    last_file = pathlib.PurePosixPath(progress["lastFile"]).parts
+
+    def is_committed(year_folder, file):
+        relative_path = get_relative_path(file, repo_dir)
+        if relative_path in changed:
+            return False
+        return year_folder < last_folder or pathlib.PurePosixPath(relative_path).parts <= last_file
+
+    for year_folder, files in year_folders:
+        if year_folder > last_folder:
+            yield year_folder, files
+        else:
+            yield year_folder, (file for file in files if not is_committed(year_folder, file))
+
+
+class LoadProgress:
+    """
+    Persists how far a load has got, after every batch the pipeline has saved in order,
+    so a restarted job carries on from there with the same runId.
+    """
+
+    def __init__(self, state_container, run_id, mode, head, repo_dir, years=None):
+        self.state_container = state_container
+        self.document = dict(head, runId=run_id, mode=mode, years=years, status="running", folder=None, lastFile=None)
+        self.repo_dir = repo_dir
+
+    async def on_batch_committed(self, year_folder, last_file):
+        self.document["folder"] = year_folder
+        self.document["lastFile"] = get_relative_path(last_file, self.repo_dir)
+        try:
+            await save_checkpoint(self.state_container, LOAD_PROGRESS_ID, self.document)
+        except Exception as e:
+            # Losing a progress update only means redoing more work after a restart
+            logger.warning(f"Saving load progress failed: {e}")
+
+    async def complete(self):
+        self.document["status"] = "complete"
+        await save_checkpoint(self.state_container, LOAD_PROGRESS_ID, self.document)
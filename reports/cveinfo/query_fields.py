@@ -0,0 +1,82 @@
+import re
+
+# Lower bound of each CVSS v3/v4 severity rating, highest first
+SEVERITY_RATINGS = [(9.0, "CRITICAL"), (7.0, "HIGH"), (4.0, "MEDIUM"), (0.1, "LOW"), (0.0, "NONE")]
+# CVSS v2 has no critical or none rating, a 9.5 scored with v2 is HIGH
+V2_SEVERITY_RATINGS = [(7.0, "HIGH"), (4.0, "MEDIUM"), (0.0, "LOW")]
+
+
+def get_severity(score, version=None, base_severity=None):
+    """
+    The rating the record gives its score, or else the band of the score in its CVSS version's ratings.
+    """
+    if score is None:
+        return None
+    if isinstance(base_severity, str) and base_severity.strip():
+        return base_severity.strip().upper()
+    ratings = V2_SEVERITY_RATINGS if str(version or "").startswith("2") else SEVERITY_RATINGS
+    for lower_bound, severity in ratings:
+        if score >= lower_bound:
+            return severity
+
+
+def iter_metrics(cve_data):
+    """Every metric of the CNA container and of the ADP containers, e.g. CISA's enrichment"""
+    containers = cve_data.get("containers") or {}
+    cna = containers.get("cna") or {}
+    yield from cna.get("metrics") or []
+    for adp in containers.get("adp") or []:
+        yield from adp.get("metrics") or []
+
+
+def get_max_base_score(cve_data):
+    """
+    Highest CVSS base score of any version, with the CVSS version it was scored with and
+    the baseSeverity the record rates it, None if it has none.
+    """
+    best = None, None, None
+    for metric in iter_metrics(cve_data):
+        for key, cvss in metric.items():
+            if not key.startswith("cvss") or not isinstance(cvss, dict):
+                continue
+            score = cvss.get("baseScore")
+            if isinstance(score, (int, float)) and (best[0] is None or score > best[0]):
+                best = float(score), cvss.get("version"), cvss.get("baseSeverity")
+    return best
+
+
+def normalize_key(value):
+    """Lower case, single spaced, so 'Acme Corp ' and 'acme  corp' are the same key"""
+    return re.sub(r"\s+", " ", value).strip().lower() if isinstance(value, str) else None
+
+
+def get_vendor_products(cve_data):
+    """Sorted vendors and vendor:product keys of the CNA affected list, n/a entries left out"""
+    cna = (cve_data.get("containers") or {}).get("cna") or {}
+    vendors, keys = set(), set()
+    for affected in cna.get("affected") or []:
+        vendor = normalize_key(affected.get("vendor"))
+        product = normalize_key(affected.get("product"))
+        if vendor and product and "n/a" not in (vendor, product):
+            vendors.add(vendor)
+            keys.add(f"{vendor}:{product}")
+    return sorted(vendors), sorted(keys)
+
+
+def get_query_fields(cve_data):
+    """
+    Flat fields derived from the nested metrics, affected and dates, so reports can filter
+    on severity, vendor/product and publication date with plain equality and range queries.
+    """
+    score, version, base_severity = get_max_base_score(cve_data)
+    vendors, vendor_products = get_vendor_products(cve_data)
+    published = ((cve_data.get("cveMetadata") or {}).get("datePublished") or "")[:7]
+    return {
+        'maxBaseScore': score,
+        'maxBaseScoreVersion': version,
+        'severity': get_severity(score, version, base_severity),
+        'vendors': vendors,
+        'vendorProducts': vendor_products,
+        'publishedYear': int(published[:4]) if published[:4].isdigit() else None,
+        'publishedMonth': published if len(published) == 7 else None,
+    }
@@ -1,4 +1,5 @@
 import asyncio
+import json
 import os
 import time
 from datetime import datetime as dt
@@ -7,11 +8,21 @@ import logging
 from azure.cosmos import exceptions
 from azure.cosmos.aio import CosmosClient
 
+from throttle import AdaptiveConcurrency, with_throttle_retry
+
 # Environment variables passed in via sds flux configuration
 endpoint = os.getenv("COSMOS_DB_URI")
 key = os.getenv("COSMOS_KEY")
 database_name = os.getenv("COSMOS_DB_NAME", "reports")
 container_name = os.getenv("COSMOS_DB_CONTAINER", "cveinfo")
+# Partition key path of the container, documents are grouped on it for transactional batches
+partition_key_path = os.getenv("COSMOS_PARTITION_KEY_PATH", "/dateReserved")
+# Small container, partitioned on /id, holding the job's own state e.g. sync checkpoints
+state_container_name = os.getenv("COSMOS_DB_STATE_CONTAINER", "cveinfostate")
+
+# Limits of a Cosmos transactional batch
+MAX_TRANSACTIONAL_OPERATIONS = 100
+MAX_TRANSACTIONAL_BYTES = 2 * 1024 * 1024
 
 # Setup logger
 logging.basicConfig(level=logging.INFO)
@@ -23,20 +34,52 @@ def get_formatted_time():
     return now.strftime("%I:%M:%S %p")
 
 
-async def add_batch(batch):
+def get_cosmos_client():
+    """
+    Client shared by the whole run. Open it once with `async with` so every batch
+    reuses the same connection pool and token.
+    """
+    return CosmosClient(url=endpoint, credential=key)
+
+
+def get_container(client):
+    database = client.get_database_client(database_name)
+    return database.get_container_client(container_name)
+
+
+def get_state_container(client):
+    database = client.get_database_client(database_name)
+    return database.get_container_client(state_container_name)
+
+
+async def read_checkpoint(state_container, checkpoint_id):
+    """
+    Returns the checkpoint document, or None if it has never been written.
+    """
     try:
-        async with CosmosClient(url=endpoint, credential=key) as client:
-            database = client.get_database_client(database_name)
-            container = database.get_container_client(container_name)
-
-            timer = time.time()
-            logger.info(f"Starting Concurrent Batched Item Creation: {get_formatted_time()}.")
-            await create_all_the_items(container, batch)
-
-            concurrent_batch_time = time.time() - timer
-            logger.info(f"Time taken: {concurrent_batch_time:.2f} sec")
-            # Use asyncio.sleep instead of time.sleep in async context
-            await asyncio.sleep(1)
+        return await with_throttle_retry(state_container.read_item, item=checkpoint_id, partition_key=checkpoint_id)
+    except exceptions.CosmosResourceNotFoundError:
+        return None
+
+
+async def save_checkpoint(state_container, checkpoint_id, checkpoint):
+    document = dict(checkpoint, id=checkpoint_id, updatedAt=dt.now().isoformat())
+    await with_throttle_retry(state_container.upsert_item, document)
+    return document
+
+
+async def add_batch(container, batch, controller=None):
+    """
+    Save a batch, returning False if it failed so the caller does not advance its checkpoint.
+    """
+    try:
+        timer = time.time()
+        logger.info(f"Starting Concurrent Batched Item Creation: {get_formatted_time()}.")
+        await create_all_the_items(container, batch, controller)
+
+        concurrent_batch_time = time.time() - timer
+        logger.info(f"Time taken: {concurrent_batch_time:.2f} sec")
+        return True
     except exceptions.CosmosResourceNotFoundError as e:
         logger.error(f"Error adding batch: Error: {e}")
     except exceptions.CosmosResourceExistsError as e:
@@ -46,41 +89,144 @@ async def add_batch(batch):
     except exceptions.CosmosClientTimeoutError as e:
         logger.error(f"Error adding batch: Error: {e}")
     except Exception as e:
-        logger.error(f"Unexpected error adding batch: {e}")
+        logger.exception(f"Unexpected error adding batch: {e}")
+    return False
+
+
+def get_partition_key(document, path=None):
+    """
+    Value of the container's partition key for a document, path being e.g. /dateReserved
+    """
+    value = document
+    for key in (path or partition_key_path).strip("/").split("/"):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def get_document_size(document):
+    return len(json.dumps(document, separators=(",", ":")).encode("utf-8"))
+
+
+def group_by_partition(batch, path=None):
+    """
+    Group documents into transactional batches: same partition key value, at most
+    MAX_TRANSACTIONAL_OPERATIONS documents and MAX_TRANSACTIONAL_BYTES per group.
+    With the default /dateReserved, a timestamp to the millisecond, nearly every group is a
+    single document and is upserted on its own, so transactional batches save next to nothing.
+    They only pay off on a coarser partition key such as /cveYear, which needs a new container.
+    """
+    groups = {}
+    for document in batch:
+        groups.setdefault(get_partition_key(document, path), []).append(document)
+
+    for partition_key, documents in groups.items():
+        group, group_size = [], 0
+        for document in documents:
+            size = get_document_size(document)
+            if group and (len(group) == MAX_TRANSACTIONAL_OPERATIONS or group_size + size > MAX_TRANSACTIONAL_BYTES):
+                yield partition_key, group
+                group, group_size = [], 0
+            group.append(document)
+            group_size += size
+        yield partition_key, group
+
+
+async def create_all_the_items(container, batch, controller=None):
+    """
+    Upsert every item of the batch. Documents sharing a partition key value are written
+    together in one transactional batch, falling back to one upsert per document when
+    the transactional batch fails. Pass the run's AdaptiveConcurrency controller so
+    concurrent batches share one RU aware limit.
+    """
+    if controller is None:
+        controller = AdaptiveConcurrency()
 
+    async def upsert_item(item):
+        # Document id is derived from the cveId, so a single upsert either creates or replaces it
+        try:
+            await controller.run(container.upsert_item, item)
+        except exceptions.CosmosHttpResponseError as e:
+            if e.status_code == 413:
+                logger.error(f"{item['id']} is too large to save ({get_document_size(item)} bytes)")
+            raise
+
+    async def upsert_group(partition_key, group):
+        if len(group) > 1:
+            operations = [("upsert", (item,)) for item in group]
+            try:
+                await controller.run(container.execute_item_batch, operations, partition_key=partition_key)
+                return
+            except (exceptions.CosmosBatchOperationError, exceptions.CosmosHttpResponseError) as e:
+                logger.warning(f"Transactional batch of {len(group)} items failed, upserting one by one: {e}")
+        await asyncio.gather(*(upsert_item(item) for item in group))
+
+    groups = list(group_by_partition(batch))
+    await asyncio.gather(*(upsert_group(partition_key, group) for partition_key, group in groups))
+    # How much the transactional batches save depends on how coarse the partition key is, log what they did
+    transactional = [len(group) for _, group in groups if len(group) > 1]
+    logger.info(f"Batch of {len(batch)} items upserted in {len(groups)} requests, "
+                f"{sum(transactional)} items in {len(transactional)} transactional batches")
+
+
+async def remove_legacy_documents(container, controller=None):
+    """
+    One-time migration for documents created before the id was derived from the cveId.
+    Those documents have a random uuid as their id, so they no longer match their cveId.
+    Only the id and partition key are projected, the replacement documents have already
+    been upserted by the current run.
+    """
+    if controller is None:
+        controller = AdaptiveConcurrency()
+    partition_key_field = partition_key_path.strip("/").replace("/", ".")
+    query = f"SELECT c.id, c.{partition_key_field} FROM c WHERE c.id != c.cveId"
+
+    async def delete_item(item):
+        await controller.run(container.delete_item, item['id'], partition_key=get_partition_key(item))
 
-# Expose concurrency and delay settings via environment variables
-MAX_CONCURRENT_UPSERTS = int(os.getenv("MAX_CONCURRENT_UPSERTS", 10))
-DELAY_BETWEEN_BATCHES = float(os.getenv("DELAY_BETWEEN_BATCHES", 0.5))
-
+    try:
+        logger.info("Removing documents with legacy random ids")
+        items = [item async for item in container.query_items(query=query)]
+        await asyncio.gather(*(delete_item(item) for item in items))
+        logger.info(f"Removed {len(items)} documents with legacy ids")
+    except exceptions.CosmosHttpResponseError as e:
+        logger.error(f"Error removing legacy documents: Error: {e}")
+
+
+async def remove_old_batch(container, run_id, controller=None, page_size=1000):
+    """
+    Delete the documents a full run did not write, i.e. CVEs no longer in the upstream list
+    and documents left in their old partition. Only the id and partition key are read, and
+    deletes run concurrently within the controller's limit one page at a time.
+    Returns the number of documents removed and the RU the deletes cost.
+    """
+    if controller is None:
+        controller = AdaptiveConcurrency()
+    partition_key_field = partition_key_path.strip("/").replace("/", ".")
+    # Documents written before runId existed have no runId at all
+    query = (f"SELECT c.id, c.{partition_key_field} FROM c "
+             "WHERE NOT IS_DEFINED(c.runId) OR c.runId != @runId")
+    charge_before = controller.total_charge
+    removed = 0
+
+    async def delete_item(item):
+        try:
+            await controller.run(container.delete_item, item['id'], partition_key=get_partition_key(item))
+            return 1
+        except exceptions.CosmosResourceNotFoundError:
+            return 0
 
-async def create_all_the_items(container, batch, max_concurrent=None, delay_between_batches=None):
-    if max_concurrent is None:
-        max_concurrent = MAX_CONCURRENT_UPSERTS
-    if delay_between_batches is None:
-        delay_between_batches = DELAY_BETWEEN_BATCHES
-    semaphore = asyncio.BoundedSemaphore(max_concurrent)
+    try:
+        logger.info(f"Removing documents not written by run {run_id}")
+        page = []
+        async for item in container.query_items(query=query, parameters=[{"name": "@runId", "value": run_id}]):
+            page.append(item)
+            if len(page) == page_size:
+                removed += sum(await asyncio.gather(*(delete_item(item) for item in page)))
+                page = []
+        removed += sum(await asyncio.gather(*(delete_item(item) for item in page)))
+    except exceptions.CosmosHttpResponseError as e:
+        logger.error(f"Error removing old documents: Error: {e}")
 
-    async def upsert_item(item):
-        async with semaphore:
-            cve_id = item.get("cveId")
-            query = "SELECT * FROM c WHERE c.cveId = @cveId"
-            items = [i async for i in container.query_items(
-                query=query,
-                parameters=[{"name": "@cveId", "value": cve_id}]
-            )]
-            if items:
-                existing = items[0]
-                item['id'] = existing['id']  # Ensure id is set for replace
-                await container.replace_item(existing['id'], item)
-            else:
-                await container.create_item(item)
-
-    await asyncio.gather(*(upsert_item(item) for item in batch))
-    logger.info(f"Batch of {len(batch)} items upserted!")
-    if delay_between_batches > 0:
-        await asyncio.sleep(delay_between_batches)
-
-async def remove_old_batch(job_time):
-  logger.info("Removing old doc")
-  # call custom function on cosmosdb
+    charge = controller.total_charge - charge_before
+    logger.info(f"Removed {removed} stale documents, costing {charge:.0f} RU")
+    return removed, charge
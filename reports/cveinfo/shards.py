@@ -0,0 +1,233 @@
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+import socket
+import time
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+from save_to_db import read_checkpoint
+from throttle import with_throttle_retry
+
+# Number of worker pods sharing a load, 1 loads everything in this pod
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+# Which share of the shards this pod starts with, set by Kubernetes for an indexed job
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", os.getenv("JOB_COMPLETION_INDEX", 0)))
+# A shard whose lease is not renewed for this long is taken over by another worker
+SHARD_LEASE_SECONDS = float(os.getenv("SHARD_LEASE_SECONDS", 300))
+# Workers only join a sharded run started less than this long ago
+SHARDED_RUN_MAX_AGE = float(os.getenv("SHARDED_RUN_MAX_AGE", 12 * 60 * 60))
+# Seconds a lease document is kept after its last write, long after every worker of its run has finished
+SHARD_LEASE_TTL = int(os.getenv("SHARD_LEASE_TTL", 2 * SHARDED_RUN_MAX_AGE))
+# Seconds between checks on the shards other workers hold, until they are done or their lease has expired
+SHARD_POLL_SECONDS = float(os.getenv("SHARD_POLL_SECONDS", 30))
+
+SHARDED_RUN_ID = "sharded-run"
+
+logger = logging.getLogger(__name__)
+
+
+def get_owner():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def get_lease_id(run_id, shard):
+    return f"shard-{run_id}-{shard}"
+
+
+def get_shard_order(shards, index, count):
+    """
+    Shards in the order a worker tries to claim them: its own share first, then every other
+    shard, so the shards of a dead or slow worker are still picked up.
+    """
+    own = shards[index % count::count]
+    return own + [shard for shard in shards if shard not in own]
+
+
+def get_oldest_head(documents):
+    """The commit every shard has been loaded up to, the oldest of the heads they were loaded from"""
+    oldest = min(documents, key=lambda document: datetime.datetime.fromisoformat(document["committedDate"]))
+    return {"commit": oldest["commit"], "committedDate": oldest["committedDate"]}
+
+
+async def replace_if_unchanged(state_container, current, document):
+    """
+    Replace current with document, raising CosmosAccessConditionFailedError if another
+    worker has written it since it was read.
+    """
+    return await with_throttle_retry(state_container.replace_item, current["id"], document,
+                                     etag=current["_etag"], match_condition=MatchConditions.IfNotModified)
+
+
+class ShardLease:
+    """
+    A worker's claim on one shard, kept alive while the shard loads.
+    """
+
+    def __init__(self, state_container, document):
+        self.state_container = state_container
+        self.document = document
+        self.lost = False
+
+    async def renew(self):
+        document = dict(self.document, expiresAt=time.time() + SHARD_LEASE_SECONDS)
+        try:
+            self.document = await replace_if_unchanged(self.state_container, self.document, document)
+        except exceptions.CosmosAccessConditionFailedError:
+            # Another worker took the shard over, writes are upserts so the overlap is harmless
+            logger.warning(f"Lease on shard {self.document['shard']} lost")
+            self.lost = True
+
+    async def renew_periodically(self):
+        while not self.lost:
+            await asyncio.sleep(SHARD_LEASE_SECONDS / 3)
+            try:
+                await self.renew()
+            except exceptions.CosmosHttpResponseError as e:
+                logger.warning(f"Renewing lease on shard {self.document['shard']} failed: {e}")
+
+    @contextlib.asynccontextmanager
+    async def keep_alive(self):
+        renewer = asyncio.create_task(self.renew_periodically())
+        try:
+            yield self
+        finally:
+            renewer.cancel()
+
+    async def complete(self, head, failed_batches, oversized=None):
+        document = dict(self.document, **head, status="done", failedBatches=failed_batches)
+        if oversized and oversized.count:
+            # Collected into the run's oversized report by the worker completing the run
+            document.update(oversized=oversized.documents, oversizedCount=oversized.count)
+        try:
+            self.document = await replace_if_unchanged(self.state_container, self.document, document)
+        except exceptions.CosmosAccessConditionFailedError:
+            logger.info(f"Shard {self.document['shard']} was taken over, leaving it to the new owner")
+
+
+class ShardCoordinator:
+    """
+    Coordinates the workers of a sharded load through documents in the state container.
+
+    The first worker starts a sharded run listing the shards, the others join it and share
+    its runId. Each shard is claimed with a lease document, created or taken over with an
+    etag condition so two workers never hold the same shard, and renewed while it loads.
+    Lease documents have a ttl, Cosmos removes them once the run is long over.
+    The worker that finds every shard done completes the run.
+    """
+
+    def __init__(self, state_container, owner=None):
+        self.state_container = state_container
+        self.owner = owner or get_owner()
+        self.run = None
+
+    def is_joinable(self, run, mode, years, since):
+        started = datetime.datetime.fromisoformat(run["startedAt"])
+        age = (datetime.datetime.now(datetime.timezone.utc) - started).total_seconds()
+        return (run["status"] == "running" and run["mode"] == mode and run.get("years") == years
+                and run.get("since") == since and age < SHARDED_RUN_MAX_AGE)
+
+    async def join(self, run_id, mode, years, head, shards, since=None):
+        """
+        Join the sharded run in progress with the same mode, years and checkpoint,
+        or start one with this worker's runId, head and shards.
+        """
+        while True:
+            run = await read_checkpoint(self.state_container, SHARDED_RUN_ID)
+            if run and self.is_joinable(run, mode, years, since):
+                logger.info(f"Joining sharded run {run['runId']} of {len(run['shards'])} shards")
+                self.run = run
+                return run
+
+            started_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            document = dict(head, id=SHARDED_RUN_ID, runId=run_id, mode=mode, years=years, since=since,
+                            shards=shards, status="running", startedAt=started_at)
+            try:
+                if run:
+                    self.run = await replace_if_unchanged(self.state_container, run, document)
+                else:
+                    self.run = await with_throttle_retry(self.state_container.create_item, document)
+            except (exceptions.CosmosResourceExistsError, exceptions.CosmosAccessConditionFailedError):
+                # Another worker started a run at the same time, join that one
+                continue
+            logger.info(f"Started sharded run {run_id} of {len(shards)} shards")
+            return self.run
+
+    async def claim(self, shard):
+        """
+        Returns a lease on shard, or None if it is done or held by another live worker.
+        """
+        lease_id = get_lease_id(self.run["runId"], shard)
+        document = dict(id=lease_id, runId=self.run["runId"], shard=shard, owner=self.owner,
+                        status="running", expiresAt=time.time() + SHARD_LEASE_SECONDS, ttl=SHARD_LEASE_TTL)
+        try:
+            return ShardLease(self.state_container, await with_throttle_retry(self.state_container.create_item, document))
+        except exceptions.CosmosResourceExistsError:
+            pass
+
+        current = await read_checkpoint(self.state_container, lease_id)
+        if current is None or current["status"] == "done" or current["expiresAt"] > time.time():
+            return None
+        try:
+            lease = ShardLease(self.state_container, await replace_if_unchanged(self.state_container, current, document))
+        except exceptions.CosmosAccessConditionFailedError:
+            return None
+        logger.info(f"Took over shard {shard} from {current['owner']}")
+        return lease
+
+    async def claim_until_done(self, shards, poll_seconds=None):
+        """
+        Yields a lease on each of shards this worker gets to load, in order. The shards other
+        workers hold are checked again every poll_seconds until they are done, or their lease
+        has expired and is taken over, so a worker dying after the others have passed its shard
+        does not leave the run unfinished. Stops once every shard is done or the run is over.
+        """
+        poll_seconds = SHARD_POLL_SECONDS if poll_seconds is None else poll_seconds
+        shards = list(shards)
+        while shards:
+            for shard in shards:
+                lease = await self.claim(shard)
+                if lease is not None:
+                    yield lease
+            unfinished = set(await self.get_unfinished())
+            shards = [shard for shard in shards if shard in unfinished]
+            if shards:
+                if not await self.is_running():
+                    return
+                logger.info(f"Waiting on {len(shards)} shards held by other workers: {', '.join(shards)}")
+                await asyncio.sleep(poll_seconds)
+
+    async def read_leases(self):
+        return [await read_checkpoint(self.state_container, get_lease_id(self.run["runId"], shard))
+                for shard in self.run["shards"]]
+
+    async def get_unfinished(self):
+        """The shards of the run not done yet"""
+        leases = await self.read_leases()
+        return [shard for shard, lease in zip(self.run["shards"], leases) if not (lease and lease["status"] == "done")]
+
+    async def is_running(self):
+        """Whether the run is still the one in progress, not completed or replaced by a newer run"""
+        run = await read_checkpoint(self.state_container, SHARDED_RUN_ID)
+        return run is not None and run["runId"] == self.run["runId"] and run["status"] == "running"
+
+    async def finish(self):
+        """
+        Returns the shard leases if every shard is done and this worker is the one to complete
+        the run, otherwise None.
+        """
+        leases = await self.read_leases()
+        if not all(lease and lease["status"] == "done" for lease in leases):
+            return None
+
+        run = await read_checkpoint(self.state_container, SHARDED_RUN_ID)
+        if run is None or run["runId"] != self.run["runId"] or run["status"] != "running":
+            return None
+        try:
+            self.run = await replace_if_unchanged(self.state_container, run, dict(run, status="complete"))
+        except exceptions.CosmosAccessConditionFailedError:
+            return None
+        return leases
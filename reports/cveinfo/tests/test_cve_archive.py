@@ -0,0 +1,49 @@
+import io
+import json
+import zipfile
+
+from cve_archive import iter_archive_year_folders, open_cve_archive
+from main import parse_cve_records
+
+
+def write_cve_zip(file, names):
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name in names:
+            cve_id = name.rsplit("/", 1)[-1][:-len(".json")]
+            archive.writestr(name, json.dumps({"cveMetadata": {"cveId": cve_id}}))
+        archive.writestr("cves/delta.json", "{}")
+
+
+def test_cve_records_are_streamed_from_a_nested_archive(tmp_path):
+    inner = io.BytesIO()
+    write_cve_zip(inner, ["cves/2023/0xxx/CVE-2023-0001.json",
+                          "cves/2024/0xxx/CVE-2024-0001.json",
+                          "cves/2024/1xxx/CVE-2024-1001.json"])
+    release = tmp_path / "all_CVEs_at_midnight.zip.zip"
+    with zipfile.ZipFile(release, "w") as outer:
+        outer.writestr("cves.zip", inner.getvalue())
+
+    with open_cve_archive(str(release)) as archive:
+        year_folders = [(year_folder, parse_cve_records("01:00:00", records))
+                        for year_folder, records in iter_archive_year_folders(archive)]
+
+    assert [(year_folder, [doc["id"] for doc, _ in documents]) for year_folder, documents in year_folders] == [
+        ("2023", ["CVE-2023-0001"]),
+        ("2024", ["CVE-2024-0001", "CVE-2024-1001"])]
+    assert not list(tmp_path.glob("**/*.json"))
+
+
+def test_each_year_folder_is_yielded_once_when_the_archive_interleaves_years(tmp_path):
+    release = tmp_path / "cves.zip"
+    write_cve_zip(release, ["cves/2024/0xxx/CVE-2024-0001.json",
+                            "cves/2023/0xxx/CVE-2023-0001.json",
+                            "cves/2024/1xxx/CVE-2024-1001.json",
+                            "cves/2023/1xxx/CVE-2023-1001.json"])
+
+    with open_cve_archive(str(release)) as archive:
+        year_folders = [(year_folder, [name for name, _ in records])
+                        for year_folder, records in iter_archive_year_folders(archive)]
+
+    assert year_folders == [
+        ("2023", ["cves/2023/0xxx/CVE-2023-0001.json", "cves/2023/1xxx/CVE-2023-1001.json"]),
+        ("2024", ["cves/2024/0xxx/CVE-2024-0001.json", "cves/2024/1xxx/CVE-2024-1001.json"])]
@@ -0,0 +1,40 @@
+from git import Repo
+
+from cve_repo import clone_cve_repo, get_changed_cve_files
+
+
+def commit_file(repo, path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    repo.index.add([str(path)])
+    return repo.index.commit(f"update {path.name}")
+
+
+def test_get_changed_cve_files_since_commit(tmp_path):
+    repo = Repo.init(tmp_path)
+    checkpoint = commit_file(repo, tmp_path / "cves/2023/1xxx/CVE-2023-1000.json", "{}")
+    commit_file(repo, tmp_path / "cves/2024/0xxx/CVE-2024-0001.json", "{}")
+    commit_file(repo, tmp_path / "cves/2023/1xxx/CVE-2023-1000.json", '{"updated": true}')
+    commit_file(repo, tmp_path / "cves/deltaLog.json", "[]")
+
+    changed = get_changed_cve_files(repo, checkpoint.hexsha)
+
+    assert changed == ["cves/2023/1xxx/CVE-2023-1000.json", "cves/2024/0xxx/CVE-2024-0001.json"]
+
+
+def test_get_changed_cve_files_unknown_commit(tmp_path):
+    repo = Repo.init(tmp_path)
+    commit_file(repo, tmp_path / "cves/2024/0xxx/CVE-2024-0001.json", "{}")
+
+    assert get_changed_cve_files(repo, "0" * 40) is None
+
+
+def test_sparse_clone_only_checks_out_selected_years(tmp_path):
+    upstream = Repo.init(tmp_path / "upstream")
+    commit_file(upstream, tmp_path / "upstream/cves/2023/1xxx/CVE-2023-1000.json", "{}")
+    commit_file(upstream, tmp_path / "upstream/cves/2024/0xxx/CVE-2024-0001.json", "{}")
+
+    clone_cve_repo(tmp_path / "clone", sparse_paths=["cves/2024"], repo_url=(tmp_path / "upstream").as_uri())
+
+    assert (tmp_path / "clone/cves/2024/0xxx/CVE-2024-0001.json").exists()
+    assert not (tmp_path / "clone/cves/2023").exists()
@@ -0,0 +1,111 @@
+import json
+
+import main
+from compression import decompress_fields
+from main import extract_cve_data, parse_cve_files
+from save_to_db import get_document_size
+
+
+def get_cve(cve_id="CVE-2024-0001"):
+    return {
+        "dataType": "CVE_RECORD",
+        "dataVersion": "5.1",
+        "cveMetadata": {
+            "cveId": cve_id,
+            "state": "PUBLISHED",
+            "assignerShortName": "mitre",
+            "datePublished": "2024-01-02T00:00:00.000Z",
+            "dateReserved": "2024-01-01T00:00:00.000Z",
+            "dateUpdated": "2024-01-03T00:00:00.000Z"
+        },
+        "containers": {
+            "cna": {
+                "descriptions": [{"lang": "en", "value": "A test vulnerability"}],
+                "affected": [{"vendor": "acme", "product": "widget"}],
+                "metrics": []
+            }
+        }
+    }
+
+
+# The id must be stable across runs so documents can be upserted without a lookup
+def test_extract_cve_data_id_is_cve_id():
+    first = extract_cve_data("01:00:00", get_cve())
+    second = extract_cve_data("02:00:00", get_cve())
+    assert first["id"] == "CVE-2024-0001"
+    assert first["id"] == second["id"]
+
+
+def test_extract_cve_data_handles_missing_keys():
+    data = extract_cve_data("01:00:00", {"dataType": "CVE_RECORD"})
+    assert data["id"] is None
+    assert data["descriptions"] is None
+    assert data["runTime"] == "01:00:00"
+
+
+def test_parse_cve_files_skips_records_without_cve_id(tmp_path):
+    good = tmp_path / "CVE-2024-0001.json"
+    good.write_text(json.dumps(get_cve()))
+    bad = tmp_path / "CVE-2024-0002.json"
+    bad.write_text(json.dumps({"dataType": "CVE_RECORD"}))
+
+    documents = parse_cve_files("01:00:00", [good, bad])
+
+    assert [(doc["id"], size) for doc, size in documents] == [("CVE-2024-0001", get_document_size(documents[0][0]))]
+
+
+def test_get_sync_years_combines_listed_and_recent_years(monkeypatch):
+    monkeypatch.setattr(main, "CVE_YEARS", "2019, 2024")
+    monkeypatch.setattr(main, "CVE_RECENT_YEARS", 2)
+    monkeypatch.setattr(main, "get_year", lambda: "2025")
+
+    assert main.get_sync_years() == ["2019", "2024", "2025"]
+
+
+def test_cve_year_comes_from_the_id():
+    assert extract_cve_data("01:00:00", get_cve("CVE-2019-10001"))["cveYear"] == "2019"
+    assert extract_cve_data("01:00:00", {"dataType": "CVE_RECORD"})["cveYear"] is None
+
+
+def test_extract_cve_data_adds_query_fields():
+    cve = get_cve()
+    cve["containers"]["cna"]["metrics"] = [{"cvssV3_1": {"version": "3.1", "baseScore": 7.5, "baseSeverity": "HIGH"}}]
+    cve["containers"]["adp"] = [{"metrics": [{"cvssV4_0": {"version": "4.0", "baseScore": 9.3}}]}]
+    cve["containers"]["cna"]["affected"].append({"vendor": " Acme ", "product": "Widget  Pro"})
+
+    data = extract_cve_data("01:00:00", cve)
+
+    assert (data["maxBaseScore"], data["maxBaseScoreVersion"], data["severity"]) == (9.3, "4.0", "CRITICAL")
+    assert data["vendors"] == ["acme"]
+    assert data["vendorProducts"] == ["acme:widget", "acme:widget pro"]
+    assert (data["publishedYear"], data["publishedMonth"]) == (2024, "2024-01")
+
+
+def test_severity_is_the_records_own_rating_or_the_band_of_its_cvss_version():
+    cve = get_cve()
+    cve["containers"]["cna"]["metrics"] = [{"cvssV2_0": {"version": "2.0", "baseScore": 9.3}}]
+    assert extract_cve_data("01:00:00", cve)["severity"] == "HIGH"
+
+    cve["containers"]["cna"]["metrics"] = [{"cvssV3_1": {"version": "3.1", "baseScore": 9.3, "baseSeverity": "high"}}]
+    assert extract_cve_data("01:00:00", cve)["severity"] == "HIGH"
+
+
+def test_extract_cve_data_without_metrics_has_no_severity():
+    data = extract_cve_data("01:00:00", {"dataType": "CVE_RECORD"})
+    assert data["maxBaseScore"] is None
+    assert data["severity"] is None
+    assert data["vendorProducts"] == []
+
+
+def test_compressed_fields_decode_to_the_original(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "COMPRESS_BULKY_FIELDS", True)
+    file = tmp_path / "CVE-2024-0001.json"
+    file.write_text(json.dumps(get_cve()))
+
+    document, _ = parse_cve_files("01:00:00", [file])[0]
+
+    assert "affected" not in document and "descriptions" not in document
+    assert isinstance(document["affectedCompressed"], str)
+    decompress_fields(document)
+    assert document["affected"] == get_cve()["containers"]["cna"]["affected"]
+    assert document["descriptions"] == get_cve()["containers"]["cna"]["descriptions"]
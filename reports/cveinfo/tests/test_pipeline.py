@@ -0,0 +1,94 @@
+import asyncio
+
+import pipeline
+from pipeline import CvePipeline, get_default_parse_workers
+
+
+def parse_names(job_time, files):
+    return [({"id": name, "runTime": job_time}, 100) for name in files if not name.startswith("bad")]
+
+
+def test_pipeline_batches_every_parsed_document():
+    written = []
+
+    async def write(batch):
+        written.append(list(batch))
+        return True
+
+    year_folders = [
+        ("2023", [f"CVE-2023-{i}" for i in range(7)]),
+        ("2024", [f"CVE-2024-{i}" for i in range(3)] + ["bad-file"]),
+    ]
+    pipeline = CvePipeline(parse_names, write, max_batch_size=3, parse_workers=1, write_workers=2,
+                           queue_size=1, chunk_size=2)
+
+    total, failed = asyncio.run(pipeline.run("01:00:00", year_folders))
+
+    assert total == 10
+    assert failed == 0
+    # Batches never cross a year folder and never exceed the maximum size
+    assert sorted(len(batch) for batch in written) == [1, 3, 3, 3]
+    assert sorted(doc["id"] for batch in written for doc in batch) == sorted(
+        [f"CVE-2023-{i}" for i in range(7)] + [f"CVE-2024-{i}" for i in range(3)])
+    assert pipeline.read_stats.items == 11
+
+
+def test_pipeline_counts_failed_batches():
+    async def write(batch):
+        return False
+
+    pipeline = CvePipeline(parse_names, write, max_batch_size=2, parse_workers=1, write_workers=1)
+
+    total, failed = asyncio.run(pipeline.run("01:00:00", [("2024", ["a", "b", "c"])]))
+
+    assert total == 3
+    assert failed == 2
+
+
+def test_pipeline_reports_progress_up_to_the_first_failed_batch():
+    progress = []
+
+    async def write(batch):
+        return batch[0]["id"] != "c"
+
+    async def on_progress(year_folder, last_file):
+        progress.append((year_folder, last_file))
+
+    pipeline = CvePipeline(parse_names, write, max_batch_size=2, parse_workers=1, write_workers=1,
+                           chunk_size=2, on_progress=on_progress)
+
+    asyncio.run(pipeline.run("01:00:00", [("2024", ["a", "b", "c", "d", "e", "f"])]))
+
+    assert progress == [("2024", "b")]
+
+
+def parse_sized(job_time, files):
+    # The sizes are taken as parsed, the documents are not measured again
+    return [({"id": name}, int(name.split("-")[1])) for name in files]
+
+
+def test_pipeline_closes_batches_at_the_byte_budget_and_diverts_oversized_documents():
+    written, oversized = [], []
+
+    async def write(batch):
+        written.append([doc["id"] for doc in batch])
+        return True
+
+    files = ["a-120", "b-120", "c-120", "d-5000", "e-120"]
+    pipeline = CvePipeline(parse_sized, write, max_batch_size=10, parse_workers=1, write_workers=1,
+                           max_batch_bytes=300, max_document_bytes=1000,
+                           on_oversized=lambda document, size: oversized.append(document["id"]))
+
+    total, failed = asyncio.run(pipeline.run("01:00:00", [("2024", files)]))
+
+    assert written == [["a-120", "b-120"], ["c-120", "e-120"]]
+    assert oversized == ["d-5000"]
+    assert total == 4
+
+
+def test_default_parse_workers_are_the_usable_cpus_capped(monkeypatch):
+    monkeypatch.setattr(pipeline.os, "sched_getaffinity", lambda pid: set(range(64)), raising=False)
+    assert get_default_parse_workers() == pipeline.MAX_DEFAULT_PARSE_WORKERS
+
+    monkeypatch.setattr(pipeline.os, "sched_getaffinity", lambda pid: {0, 1}, raising=False)
+    assert get_default_parse_workers() == 2
@@ -0,0 +1,20 @@
+from pathlib import Path
+
+from progress import skip_committed_files
+
+
+def test_skip_committed_files_resumes_after_the_last_saved_file():
+    repo_dir = Path("/repo")
+    files = [repo_dir / "cves" / "2024" / "0xxx" / f"CVE-2024-000{i}.json" for i in range(4)]
+    year_folders = [("2023", [repo_dir / "cves" / "2023" / "0xxx" / "CVE-2023-0001.json"]),
+                    ("2024", files),
+                    ("2025", [repo_dir / "cves" / "2025" / "0xxx" / "CVE-2025-0001.json"])]
+    progress = {"folder": "2024", "lastFile": "cves/2024/0xxx/CVE-2024-0001.json"}
+    changed = ["cves/2023/0xxx/CVE-2023-0001.json"]
+
+    remaining = [(year_folder, [file.name for file in files])
+                 for year_folder, files in skip_committed_files(year_folders, repo_dir, progress, changed)]
+
+    assert remaining == [("2023", ["CVE-2023-0001.json"]),
+                         ("2024", ["CVE-2024-0002.json", "CVE-2024-0003.json"]),
+                         ("2025", ["CVE-2025-0001.json"])]
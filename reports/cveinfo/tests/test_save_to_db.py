@@ -0,0 +1,111 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+from azure.cosmos import exceptions
+from cosmos_sink.fake import AsyncFakeContainer
+
+from save_to_db import create_all_the_items, group_by_partition, remove_old_batch
+from throttle import AdaptiveConcurrency
+
+
+def get_item(i, date_reserved=None):
+    return {"id": f"CVE-2024-{i:04}", "cveId": f"CVE-2024-{i:04}", "dateReserved": date_reserved or f"2024-01-{i + 1:02}"}
+
+
+def test_create_all_the_items_upserts_without_querying():
+    container = MagicMock()
+    container.upsert_item = AsyncMock()
+    batch = [get_item(i) for i in range(5)]
+
+    asyncio.run(create_all_the_items(container, batch, AdaptiveConcurrency(initial=2)))
+
+    assert container.upsert_item.await_count == 5
+    container.query_items.assert_not_called()
+
+
+def test_throttled_upsert_is_retried_after_retry_after():
+    throttled = exceptions.CosmosHttpResponseError(status_code=429, message="Too many requests")
+    throttled.headers = {"x-ms-retry-after-ms": "1"}
+    container = MagicMock()
+    container.upsert_item = AsyncMock(side_effect=[throttled, None])
+
+    asyncio.run(create_all_the_items(container, [get_item(1)]))
+
+    assert container.upsert_item.await_count == 2
+
+
+def test_group_by_partition_limits_operations_per_group():
+    batch = [get_item(i, "2024-01-01") for i in range(150)] + [get_item(200, "2024-02-01")]
+
+    groups = list(group_by_partition(batch, "/dateReserved"))
+
+    assert [(key, len(group)) for key, group in groups] == [("2024-01-01", 100), ("2024-01-01", 50), ("2024-02-01", 1)]
+
+
+def test_items_sharing_a_partition_are_written_in_one_transactional_batch():
+    container = MagicMock()
+    container.execute_item_batch = AsyncMock()
+    container.upsert_item = AsyncMock()
+    batch = [get_item(i, "2024-01-01") for i in range(3)] + [get_item(3, "2024-02-01")]
+
+    asyncio.run(create_all_the_items(container, batch))
+
+    container.execute_item_batch.assert_awaited_once()
+    assert container.execute_item_batch.await_args.kwargs["partition_key"] == "2024-01-01"
+    assert container.upsert_item.await_count == 1
+
+
+def test_failed_transactional_batch_falls_back_to_single_upserts():
+    container = MagicMock()
+    container.execute_item_batch = AsyncMock(side_effect=exceptions.CosmosBatchOperationError(
+        error_index=0, headers={}, status_code=413, message="Request entity too large", operation_responses=[]))
+    container.upsert_item = AsyncMock()
+    batch = [get_item(i, "2024-01-01") for i in range(3)]
+
+    asyncio.run(create_all_the_items(container, batch))
+
+    assert container.upsert_item.await_count == 3
+
+
+def test_remove_old_batch_deletes_documents_from_other_runs():
+    stale = [{"id": "CVE-1999-0001", "dateReserved": "1999-01-01"}, {"id": "CVE-1999-0002", "dateReserved": "1999-01-02"}]
+
+    async def query_items(query, parameters):
+        assert parameters == [{"name": "@runId", "value": "run-2"}]
+        for item in stale:
+            yield item
+
+    async def delete_item(item, partition_key=None, response_hook=None):
+        response_hook({"x-ms-request-charge": "5"}, None)
+
+    container = MagicMock()
+    container.query_items = query_items
+    container.delete_item = AsyncMock(side_effect=delete_item)
+
+    removed, charge = asyncio.run(remove_old_batch(container, "run-2", page_size=1))
+
+    assert removed == 2
+    assert charge == 10
+    assert container.delete_item.await_args_list[0].kwargs["partition_key"] == "1999-01-01"
+
+
+def test_full_run_against_a_container_with_a_throughput_budget():
+    container = AsyncFakeContainer("/dateReserved", ru_per_second=400)
+    stale = [dict(get_item(i, "1999-01-01"), runId="run-1") for i in range(20)]
+    asyncio.run(create_all_the_items(container, stale))
+    container.reset_counters()
+    # Two documents per partition, written as transactional batches
+    batch = [dict(get_item(i, f"2024-01-{i // 2 + 1:02}"), runId="run-2") for i in range(60)]
+    controller = AdaptiveConcurrency(initial=8, target_ru_per_second=400)
+
+    async def full_run():
+        await create_all_the_items(container, batch, controller)
+        return await remove_old_batch(container, "run-2", controller)
+
+    removed, charge = asyncio.run(full_run())
+
+    assert removed == 20
+    assert charge == 20 * container.charges.delete
+    assert sorted(item["id"] for item in container.items) == sorted(item["id"] for item in batch)
+    assert container.throttled > 0
+    assert controller.throttled == container.throttled
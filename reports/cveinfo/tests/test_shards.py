@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import time
+
+from azure.cosmos import exceptions
+
+from shards import ShardCoordinator, get_oldest_head, get_shard_order
+
+HEAD = {"commit": "abc", "committedDate": "2024-01-02T00:00:00+00:00"}
+
+
+class FakeStateContainer:
+    """Just enough of a Cosmos container for the etag conditions the leases rely on"""
+
+    def __init__(self):
+        self.items = {}
+        self.etags = itertools.count()
+
+    def store(self, body):
+        document = dict(body, _etag=str(next(self.etags)))
+        self.items[document["id"]] = document
+        return dict(document)
+
+    async def create_item(self, body):
+        if body["id"] in self.items:
+            raise exceptions.CosmosResourceExistsError(status_code=409, message="Conflict")
+        return self.store(body)
+
+    async def read_item(self, item, partition_key):
+        if item not in self.items:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message="Not found")
+        return dict(self.items[item])
+
+    async def replace_item(self, item, body, etag=None, match_condition=None):
+        if self.items[item]["_etag"] != etag:
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="Precondition failed")
+        return self.store(body)
+
+
+def test_workers_share_a_run_and_never_hold_the_same_shard():
+    state = FakeStateContainer()
+    first, second = ShardCoordinator(state, "worker-0"), ShardCoordinator(state, "worker-1")
+
+    async def load():
+        run = await first.join("run-1", "full", None, HEAD, ["2023", "2024"])
+        joined = await second.join("run-2", "full", None, HEAD, ["2023", "2024"])
+        assert joined["runId"] == run["runId"] == "run-1"
+
+        lease = await first.claim("2023")
+        assert lease is not None
+        assert await second.claim("2023") is None
+        await lease.complete(HEAD, 0)
+        assert await second.claim("2023") is None
+
+        other = await second.claim("2024")
+        assert await first.finish() is None
+        await other.complete(HEAD, 0)
+        leases = await second.finish()
+        assert [lease["shard"] for lease in leases] == ["2023", "2024"]
+        # The run is only completed once
+        assert await first.finish() is None
+
+    asyncio.run(load())
+
+
+def test_expired_lease_is_taken_over():
+    state = FakeStateContainer()
+    first, second = ShardCoordinator(state, "worker-0"), ShardCoordinator(state, "worker-1")
+
+    async def load():
+        await first.join("run-1", "full", None, HEAD, ["2024"])
+        await second.join("run-1", "full", None, HEAD, ["2024"])
+        await first.claim("2024")
+        state.items["shard-run-1-2024"]["expiresAt"] = 0
+
+        lease = await second.claim("2024")
+        assert lease.document["owner"] == "worker-1"
+
+    asyncio.run(load())
+
+
+def test_shard_of_a_worker_dying_after_the_others_passed_it_is_taken_over():
+    state = FakeStateContainer()
+    dead, second = ShardCoordinator(state, "worker-0"), ShardCoordinator(state, "worker-1")
+
+    async def load():
+        await dead.join("run-1", "full", None, HEAD, ["2023", "2024"])
+        await second.join("run-1", "full", None, HEAD, ["2023", "2024"])
+        await dead.claim("2024")
+        # The dead worker's lease runs out while the second worker waits on it
+        state.items["shard-run-1-2024"]["expiresAt"] = time.time() + 0.05
+
+        loaded = []
+        async for lease in second.claim_until_done(["2023", "2024"], poll_seconds=0.01):
+            loaded.append(lease.document["shard"])
+            await lease.complete(HEAD, 0)
+        assert loaded == ["2023", "2024"]
+        assert await second.finish() is not None
+
+    asyncio.run(load())
+
+
+def test_waiting_stops_once_every_shard_is_done_by_others():
+    state = FakeStateContainer()
+    first, second = ShardCoordinator(state, "worker-0"), ShardCoordinator(state, "worker-1")
+
+    async def load():
+        await first.join("run-1", "full", None, HEAD, ["2024"])
+        await second.join("run-1", "full", None, HEAD, ["2024"])
+        lease = await first.claim("2024")
+
+        async def complete_later():
+            await asyncio.sleep(0.05)
+            await lease.complete(HEAD, 0)
+
+        completing = asyncio.create_task(complete_later())
+        assert [lease async for lease in second.claim_until_done(["2024"], poll_seconds=0.01)] == []
+        await completing
+        assert state.items["shard-run-1-2024"]["ttl"] > 0
+
+    asyncio.run(load())
+
+
+def test_shard_order_starts_with_own_share():
+    assert get_shard_order(["1999", "2000", "2001", "2002"], 1, 2) == ["2000", "2002", "1999", "2001"]
+
+
+def test_oldest_head_is_the_checkpoint():
+    newer = {"commit": "def", "committedDate": "2024-01-03T00:00:00+00:00"}
+    assert get_oldest_head([newer, HEAD]) == HEAD
@@ -0,0 +1,71 @@
+import asyncio
+from throttle import AdaptiveConcurrency
+
+
+def test_limit_grows_while_it_is_the_constraint():
+    controller = AdaptiveConcurrency(initial=4, maximum=100, target_ru_per_second=1e9)
+    peak = 0
+
+    async def upsert_item(item, response_hook=None):
+        nonlocal peak
+        peak = max(peak, controller.in_flight)
+        await asyncio.sleep(0)
+        response_hook({"x-ms-request-charge": "5"}, item)
+        return item
+
+    async def write_all():
+        await asyncio.gather(*(controller.run(upsert_item, {"id": str(i)}) for i in range(2000)))
+
+    asyncio.run(write_all())
+
+    assert controller.limit > 10
+    assert peak > 4
+    assert controller.total_charge == 10000
+    assert controller.in_flight == 0
+
+
+def test_limit_does_not_grow_when_it_is_not_the_constraint():
+    controller = AdaptiveConcurrency(initial=4, maximum=100, target_ru_per_second=1e9)
+
+    async def upsert_item(item, response_hook=None):
+        response_hook({"x-ms-request-charge": "5"}, item)
+        return item
+
+    async def write_one_at_a_time():
+        for i in range(50):
+            await controller.run(upsert_item, {"id": str(i)})
+
+    asyncio.run(write_one_at_a_time())
+
+    assert controller.limit == 4
+
+
+def test_limit_halves_when_the_sdk_retried_a_throttled_request():
+    controller = AdaptiveConcurrency(initial=8, minimum=1, target_ru_per_second=1000)
+
+    controller.on_success({"x-ms-request-charge": "5", "x-ms-throttle-retry-count": "2"})
+
+    assert controller.limit == 4
+    assert controller.throttled == 1
+
+
+def test_limit_is_trimmed_above_the_ru_target():
+    controller = AdaptiveConcurrency(initial=10, target_ru_per_second=10)
+
+    controller.on_success({"x-ms-request-charge": "100"})
+
+    assert controller.limit == 9
+
+
+def test_run_passes_response_headers_to_the_controller():
+    controller = AdaptiveConcurrency(initial=1)
+
+    async def upsert_item(item, response_hook=None):
+        response_hook({"x-ms-request-charge": "7.5"}, item)
+        return item
+
+    result = asyncio.run(controller.run(upsert_item, {"id": "CVE-2024-0001"}))
+
+    assert result == {"id": "CVE-2024-0001"}
+    assert controller.total_charge == 7.5
+    assert controller.in_flight == 0
@@ -0,0 +1,42 @@
+import trim
+from trim import trim_document
+
+
+def get_document(versions=3):
+    return {
+        "id": "CVE-2024-0001",
+        "descriptions": [{"lang": "en", "value": "A test vulnerability", "supportingMedia": [{"value": "<p>html</p>"}]}],
+        "affected": [{"vendor": "acme", "product": "widget", "modules": ["core"],
+                      "versions": [{"version": str(i), "status": "affected"} for i in range(versions)]}],
+    }
+
+
+def test_small_document_is_left_alone():
+    assert trim_document(get_document()) == (get_document(), trim.get_document_size(get_document()))
+
+
+def test_unused_fields_are_dropped(monkeypatch):
+    monkeypatch.setattr(trim, "DROP_FIELDS", ["descriptions.supportingMedia", "affected.modules"])
+
+    document, _ = trim_document(get_document())
+
+    assert document["descriptions"] == [{"lang": "en", "value": "A test vulnerability"}]
+    assert "modules" not in document["affected"][0]
+
+
+def test_arrays_are_capped_with_a_truncation_marker(monkeypatch):
+    monkeypatch.setattr(trim, "MAX_ARRAY_ITEMS", 2)
+
+    document, _ = trim_document(get_document(versions=5))
+
+    assert len(document["affected"][0]["versions"]) == 2
+    assert document["truncated"] == {"affected[0].versions": 3}
+
+
+def test_oversized_document_is_cut_down_to_the_limit(monkeypatch):
+    monkeypatch.setattr(trim, "MAX_DOCUMENT_BYTES", 20_000)
+
+    document, size = trim_document(get_document(versions=5000))
+
+    assert size == trim.get_document_size(document) <= 20_000
+    assert document["truncated"]["affected[0].versions"] > 0
@@ -0,0 +1,164 @@
+import asyncio
+import collections
+import logging
+import os
+import time
+
+from azure.cosmos import exceptions
+
+# Expose concurrency and throttling settings via environment variables
+# MAX_CONCURRENT_UPSERTS is the starting point, the controller moves between MIN and MAX_CONCURRENCY
+MAX_CONCURRENT_UPSERTS = int(os.getenv("MAX_CONCURRENT_UPSERTS", 10))
+MIN_CONCURRENCY = int(os.getenv("MIN_CONCURRENCY", 1))
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", 100))
+# RU/s the job aims to use, keep it below max_throughput of the container (05-cosmosdb.tf)
+TARGET_RU_PER_SECOND = float(os.getenv("TARGET_RU_PER_SECOND", 2000))
+MAX_THROTTLE_RETRIES = int(os.getenv("MAX_THROTTLE_RETRIES", 5))
+CONCURRENCY_LOG_INTERVAL = float(os.getenv("CONCURRENCY_LOG_INTERVAL", 30))
+
+# Seconds of request charges used to work out the current RU rate
+RATE_WINDOW = 5
+
+logger = logging.getLogger(__name__)
+
+
+def get_retry_after(error, attempt):
+    """
+    Seconds to wait before retrying a throttled request. Uses the retry-after
+    header returned with the 429, falling back to an exponential backoff.
+    """
+    headers = getattr(error, "headers", None) or {}
+    retry_after_ms = headers.get("x-ms-retry-after-ms")
+    if retry_after_ms:
+        return float(retry_after_ms) / 1000
+    return min(2 ** attempt * 0.1, 10)
+
+
+async def with_throttle_retry(operation, *args, **kwargs):
+    """
+    Run a one-off container operation, waiting only when Cosmos answers with 429 (too many requests).
+    """
+    attempt = 0
+    while True:
+        try:
+            return await operation(*args, **kwargs)
+        except exceptions.CosmosHttpResponseError as e:
+            if e.status_code != 429 or attempt >= MAX_THROTTLE_RETRIES:
+                raise
+            wait = get_retry_after(e, attempt)
+            logger.warning(f"Request throttled, retrying in {wait:.2f} sec")
+            await asyncio.sleep(wait)
+            attempt += 1
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the number of in-flight Cosmos requests and adjusts that limit from the responses.
+
+    Additive increase, multiplicative decrease: while the RU rate is below the target the
+    limit grows by roughly one per round of requests, a throttled request (429, or one the
+    SDK had to retry) halves it, and a rate above the target trims it. Share one instance
+    across every writer of a run so the limit applies to the whole job.
+    """
+
+    def __init__(self, initial=None, minimum=None, maximum=None, target_ru_per_second=None):
+        self.minimum = minimum or MIN_CONCURRENCY
+        self.maximum = maximum or MAX_CONCURRENCY
+        self.limit = float(min(max(initial or MAX_CONCURRENT_UPSERTS, self.minimum), self.maximum))
+        self.target_ru_per_second = target_ru_per_second or TARGET_RU_PER_SECOND
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.charges = collections.deque()
+        self.window_charge = 0.0
+        self.total_charge = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.last_log = time.monotonic()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        # Honour the retry-after of a throttled request before sending anything new
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def ru_rate(self, now):
+        while self.charges and self.charges[0][0] < now - RATE_WINDOW:
+            self.window_charge -= self.charges.popleft()[1]
+        return self.window_charge / RATE_WINDOW
+
+    def decrease(self, now, factor):
+        # Several requests in flight see the same throttling episode, only back off once for it
+        if now - self.last_decrease >= 1:
+            self.limit = max(self.minimum, self.limit * factor)
+            self.last_decrease = now
+
+    def on_success(self, headers):
+        """Record a completed request, called before its slot is released"""
+        now = time.monotonic()
+        charge = float(headers.get("x-ms-request-charge") or 0)
+        self.requests += 1
+        self.total_charge += charge
+        self.charges.append((now, charge))
+        self.window_charge += charge
+
+        if int(headers.get("x-ms-throttle-retry-count") or 0) > 0:
+            # The SDK already waited and retried this request, it still means we are going too fast
+            self.throttled += 1
+            self.decrease(now, 0.5)
+        elif self.ru_rate(now) > self.target_ru_per_second:
+            self.decrease(now, 0.9)
+        elif self.in_flight >= int(self.limit):
+            # Only grow while the limit is what holds the writers back
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self, retry_after):
+        now = time.monotonic()
+        self.throttled += 1
+        self.paused_until = max(self.paused_until, now + retry_after)
+        self.decrease(now, 0.5)
+
+    async def run(self, operation, *args, **kwargs):
+        """
+        Run a container operation within the concurrency limit, retrying it after the
+        retry-after when it is still throttled once the SDK has given up.
+        """
+        attempt = 0
+        while True:
+            headers = {}
+            await self.acquire()
+            try:
+                result = await operation(*args, response_hook=lambda response_headers, *_: headers.update(response_headers), **kwargs)
+                # While the slot is still held, so in_flight tells whether the limit was saturated
+                self.on_success(headers)
+            except exceptions.CosmosHttpResponseError as e:
+                if e.status_code != 429 or attempt >= MAX_THROTTLE_RETRIES:
+                    raise
+                self.on_throttle(get_retry_after(e, attempt))
+                attempt += 1
+                continue
+            finally:
+                await self.release()
+            self.log_periodically()
+            return result
+
+    def log_periodically(self):
+        now = time.monotonic()
+        if now - self.last_log >= CONCURRENCY_LOG_INTERVAL:
+            self.last_log = now
+            logger.info(self.summary())
+
+    def summary(self):
+        now = time.monotonic()
+        return (f"Concurrency limit {int(self.limit)} ({self.in_flight} in flight), "
+                f"{self.ru_rate(now):.0f} RU/s of {self.target_ru_per_second:.0f} target, "
+                f"{self.requests} requests, {self.total_charge:.0f} RU total, {self.throttled} throttled")
@@ -0,0 +1,62 @@
+import os
+
+from save_to_db import get_document_size
+
+# Comma separated sub-fields of the saved fields to drop, e.g. descriptions.supportingMedia,affected.modules
+DROP_FIELDS = [field for field in os.getenv("DROP_FIELDS", "").split(",") if field]
+# Longest array kept in a document, 0 keeps every item unless the document is too large
+MAX_ARRAY_ITEMS = int(os.getenv("MAX_ARRAY_ITEMS", 0))
+# Cosmos rejects items over 2 MB, leave room for the system properties it adds
+MAX_DOCUMENT_BYTES = int(os.getenv("MAX_DOCUMENT_BYTES", 1_900_000))
+
+def drop_field(value, keys):
+    if isinstance(value, list):
+        for item in value:
+            drop_field(item, keys)
+    elif isinstance(value, dict) and keys:
+        if len(keys) == 1:
+            value.pop(keys[0], None)
+        else:
+            drop_field(value.get(keys[0]), keys[1:])
+
+
+def cap_arrays(value, cap, truncated, path=""):
+    """
+    Cut every array in value down to cap items, counting the items removed from each in truncated.
+    """
+    if isinstance(value, dict):
+        for key, item in value.items():
+            cap_arrays(item, cap, truncated, f"{path}.{key}" if path else key)
+    elif isinstance(value, list):
+        if len(value) > cap:
+            truncated[path] = truncated.get(path, 0) + len(value) - cap
+            del value[cap:]
+        for index, item in enumerate(value):
+            cap_arrays(item, cap, truncated, f"{path}[{index}]")
+
+
+def trim_document(document):
+    """
+    Drop the DROP_FIELDS sub-fields and cap arrays at MAX_ARRAY_ITEMS. Arrays are then halved
+    until the document fits in MAX_DOCUMENT_BYTES, and a truncated field records how many items
+    were cut from which array. A document still too large with its arrays emptied is returned
+    anyway, the pipeline leaves it out of the batches.
+    Returns the document and its serialised size, measured once trimmed so the pipeline's
+    byte budget does not serialise it again.
+    """
+    for field in DROP_FIELDS:
+        drop_field(document, field.strip().split("."))
+
+    truncated = {}
+    if MAX_ARRAY_ITEMS:
+        cap_arrays(document, MAX_ARRAY_ITEMS, truncated)
+
+    cap = MAX_ARRAY_ITEMS or 1024
+    while True:
+        if truncated:
+            document["truncated"] = truncated
+        size = get_document_size(document)
+        if size <= MAX_DOCUMENT_BYTES or cap == 0:
+            return document, size
+        cap //= 2
+        cap_arrays(document, cap, truncated)
@@ -1,6 +1,5 @@
 import requests
 import datefinder
-import uuid
 import json
 import os
 import pytz
@@ -9,16 +8,21 @@ from datetime import date
 from datetime import datetime
 from urllib.parse import urljoin
 from azure.cosmos import CosmosClient, exceptions
+from azure.identity import DefaultAzureCredential
+from cosmos_sink import CosmosSink
 
 # Environment variables passed in via sds flux configuration
 endpoint = os.environ.get("COSMOS_DB_URI", None)
 database = os.environ.get("COSMOS_DB_NAME", "reports")
 container_name = os.environ.get("COSMOS_DB_CONTAINER", "docsoutdated")
+# Partition key of the docsoutdated container
+PARTITION_KEY = "docTitle"
+# Each page of the documentation is a document
+KEY_FIELDS = ["docTitle", "url"]
 
 
 def get_document():
     document = {
-        "id": f"{uuid.uuid4()}",
         "reportName": "docsoutdated",
         "reportTitle": "Documentation out-of-date",
         "displayName": "HMCTS Documentation Review",
@@ -52,36 +56,13 @@ def get_formatted_datetime(strformat="%Y-%m-%d %H:%M:%S"):
     return datetime_london.strftime(strformat)
 
 
-def remove_documents(container):
-    try:
-        current_time = get_formatted_datetime()
-        print(f"Removing all document added before {current_time}")
-        for item in container.query_items(
-                query='SELECT * FROM c',
-                enable_cross_partition_query=True):
-            container.delete_item(item, partition_key=item["docTitle"])
-
-        print("Removing documents complete")
-    except exceptions.CosmosHttpResponseError as remove_response_error:
-        print(f"Removing items from db failed with: {remove_response_error}")
-
-
-def save_document(container, document):
-    resource_name = document.get('reportTitle')
-    try:
-        container.create_item(body=document)
-    except exceptions.CosmosHttpResponseError as save_response_error:
-        print(f"Saving to db for {resource_name} failed with CosmosHttpResponseError: {save_response_error}")
-        raise
-
-
-def add_documents(container, data):
-    print("Adding all document.")
-    try:
-        for document in data:
-            save_document(container, document)
-    except exceptions.CosmosHttpResponseError as add_response_error:
-        print(f"Adding document to db failed with CosmosHttpResponseError: {add_response_error}")
+def sync_documents(container, data):
+    print(f"Syncing {len(data)} documents at {get_formatted_datetime()}")
+    sink = CosmosSink(container, PARTITION_KEY)
+    failed = sink.sync(data, KEY_FIELDS, f"SELECT c.id, c.{PARTITION_KEY}, c.contentHash FROM c")
+    if failed:
+        raise RuntimeError(f"{failed} documents could not be saved")
+    print(f"Syncing documents complete: {sink.summary}")
 
 
 def extract_doc_details(doc_name, web_url, webpage):
@@ -167,25 +148,28 @@ def build_report():
     return documents
 
 
-try:
-    print("Connection to database...")
-    credential = DefaultAzureCredential()
-    client = CosmosClient(endpoint, credential=credential)
+def main():
+    try:
+        print("Connection to database...")
+        credential = DefaultAzureCredential()
+        client = CosmosClient(endpoint, credential=credential)
+
+        print("Setting of connectivity to database")
+        db_container = client.get_database_client(database).get_container_client(container_name)
+        report_data = build_report()
+        print(f"Processing {len(report_data)} documents")
 
-    print("Setting of connectivity to database")
-    database = client.get_database_client(database)
-    db_container = database.get_container_client(container_name)
-    report_data = build_report()
-    print(f"Processing {len(report_data)} documents")
+        if report_data is not None and len(report_data) > 0:
+            sync_documents(db_container, report_data)
+            print("Document save complete")
+        else:
+            print(f"Cannot process empty list. {len(report_data)} documents found")
+
+    except AttributeError as attribute_error:
+        print(f"Saving to db failed with AttributeError error: {attribute_error}")
+    except exceptions.CosmosHttpResponseError as http_response_error:
+        print(f"Saving to db failed with CosmosHttpResponseError error: {http_response_error}")
 
-    if report_data is not None and len(report_data) > 0:
-        remove_documents(db_container)
-        add_documents(db_container, report_data)
-        print("Document save complete")
-    else:
-        print(f"Cannot process empty list. {len(report_data)} documents found")
 
-except AttributeError as attribute_error:
-    print(f"Saving to db failed with AttributeError error: {attribute_error}")
-except exceptions.CosmosHttpResponseError as http_response_error:
-    print(f"Saving to db failed with CosmosHttpResponseError error: {http_response_error}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import pytest
+from cosmos_sink import get_document_id
+from cosmos_sink.fake import MAX_ITEM_BYTES, FakeContainer
+
+from main import KEY_FIELDS, get_document, sync_documents
+
+
+def get_page(doc_title, url):
+    document = get_document()
+    document.update(docTitle=doc_title, url=url, lastReviewed="2025-01-01")
+    return document
+
+
+def get_ids(container):
+    return sorted(item["id"] for item in container.items)
+
+
+def test_pages_are_written_over_by_title_and_url():
+    container = FakeContainer("/docTitle")
+    pages = [get_page("The HMCTS way", "https://hmcts.github.io/a"),
+             get_page("The HMCTS way", "https://hmcts.github.io/b")]
+    sync_documents(container, pages)
+
+    reviewed = get_page("The HMCTS way", "https://hmcts.github.io/a")
+    reviewed["lastReviewed"] = "2025-06-01"
+    sync_documents(container, [reviewed, get_page("The HMCTS way", "https://hmcts.github.io/b")])
+
+    assert get_ids(container) == sorted(get_document_id(page, KEY_FIELDS) for page in pages)
+    assert sorted(item["lastReviewed"] for item in container.items) == ["2025-01-01", "2025-06-01"]
+
+
+def test_pages_no_longer_found_are_removed():
+    container = FakeContainer("/docTitle")
+    sync_documents(container, [get_page("The HMCTS way", "https://hmcts.github.io/a"),
+                               get_page("Ops runbooks", "https://hmcts.github.io/ops")])
+
+    sync_documents(container, [get_page("Ops runbooks", "https://hmcts.github.io/ops")])
+
+    assert get_ids(container) == [get_document_id(get_page("Ops runbooks", "https://hmcts.github.io/ops"), KEY_FIELDS)]
+
+
+def test_failed_documents_fail_the_sync():
+    container = FakeContainer("/docTitle")
+    page = get_page("The HMCTS way", "https://hmcts.github.io/" + "x" * MAX_ITEM_BYTES)
+
+    with pytest.raises(RuntimeError, match="1 documents could not be saved"):
+        sync_documents(container, [page])
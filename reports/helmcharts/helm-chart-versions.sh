@@ -61,9 +61,10 @@ minor_version() {
 # for connecting and saving to cosmos.
 # ---------------------------------------------------------------------------
 store_document() {
-  # Add uuid, created date and environment info
-  python3 ./save-to-cosmos.py "${1}"
-  wait $!
+  if ! python3 ./save-to-cosmos.py "${1}"; then
+    echo "Error: cannot save documents."
+    exit 1
+  fi
 }
 
 echo "Job process start"
@@ -130,16 +131,14 @@ for chart in $(echo "$charts" | jq -c '.[]'); do
 
   # Enhance document with additional information
   created_on=$(date '+%Y-%m-%d %H:%M:%S')
-  id=$(uuidgen)
 
   document=$(echo "$chart" | jq --arg cluster_name "$cluster_name" \
                                 --arg verdict $verdict \
-                                --arg id "$id" \
                                 --arg environment "$environment" \
                                 --arg created_on "$created_on" \
                                 --arg report_type "table" \
                                 --arg display_name "HELM Repositories" \
-                                --arg color_code $color_code '. + {id: $id, environment: $environment, createdOn: $created_on, lastUpdated: $created_on, displayName: $display_name, cluster: $cluster_name, verdict: $verdict, colorCode: $color_code, reportType: $report_type}')
+                                --arg color_code $color_code '. + {environment: $environment, createdOn: $created_on, lastUpdated: $created_on, displayName: $display_name, cluster: $cluster_name, verdict: $verdict, colorCode: $color_code, reportType: $report_type}')
 
   documents+=("$document")
 done
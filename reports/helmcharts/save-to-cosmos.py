@@ -5,50 +5,32 @@ import pytz
 from datetime import datetime
 from azure.cosmos import CosmosClient, exceptions
 from azure.identity import DefaultAzureCredential
+from cosmos_sink import CosmosSink
 
 # Environment variables passed in via sds flux configuration
 endpoint = os.environ.get("COSMOS_DB_URI", None)
 database = os.environ.get("COSMOS_DB_NAME", "reports")
 container_name = os.environ.get("COSMOS_DB_CONTAINER", "helmcharts")
+# Partition key of the helmcharts container
+PARTITION_KEY = "namespace"
+# A chart is installed once per namespace of a cluster
+KEY_FIELDS = ["environment", "cluster", "namespace", "chart"]
+# Set on every run, an unchanged chart keeps the times it was last changed
+VOLATILE_FIELDS = ["createdOn", "lastUpdated"]
 environment = os.environ.get("ENVIRONMENT", None)
 
-# Document passing in as arguments from bash script
-documents = json.loads(sys.argv[1])
 
-
-# Checks to determine if the chart has already been processed
-# If chart data has not changed i.e the chart name, namespace, latest version and cluster name, it will be the same
-def remove_documents(container):
-    try:
-        current_time = get_formatted_datetime()
-        print(f"Removing all document added before {current_time}")
-        for item in container.query_items(
-                query=f"SELECT * FROM c WHERE c.environment = '{environment}'",
-                enable_cross_partition_query=True):
-            container.delete_item(item, partition_key=item["namespace"])
-
-        print("Removing documents complete")
-    except exceptions.CosmosHttpResponseError as remove_response_error:
-        print(f"Removing items from db failed with: {remove_response_error}")
-
-
-# Add new documents to database
-def add_documents(container, documents):
-    print("Adding all document.")
-    try:
-        for document in documents:
-            save_document(container, document)
-    except exceptions.CosmosHttpResponseError as add_response_error:
-        print(f"Adding document to db failed with CosmosHttpResponseError: {add_response_error}")
-
-
-def save_document(container, document):
-    resource_name = document.get('chart')
-    try:
-        container.create_item(body=document)
-    except exceptions.CosmosHttpResponseError as save_response_error:
-        print(f"Saving to db for {resource_name} failed with CosmosHttpResponseError: {save_response_error}")
-        raise
+# Replace last run's documents for the environment with the new ones, writing over the document
+# of each chart and removing only the charts no longer installed
+def sync_documents(container, environment, documents):
+    print(f"Syncing {len(documents)} documents at {get_formatted_datetime()}")
+    sink = CosmosSink(container, PARTITION_KEY)
+    failed = sink.sync(documents, KEY_FIELDS,
+                       f"SELECT c.id, c.{PARTITION_KEY}, c.contentHash FROM c WHERE c.environment = @environment",
+                       parameters=[dict(name='@environment', value=environment)], volatile_fields=VOLATILE_FIELDS)
+    if failed:
+        raise RuntimeError(f"{failed} documents could not be saved")
+    print(f"Syncing documents complete: {sink.summary}")
 
 
 def get_now():
@@ -60,23 +42,29 @@ def get_formatted_datetime(strformat="%Y-%m-%d %H:%M:%S"):
     return datetime_london.strftime(strformat)
 
 
-# Establish connection to cosmos db
-credential = DefaultAzureCredential()
-client = CosmosClient(endpoint, credential=credential)
+def main(argv):
+    # Document passing in as arguments from bash script
+    documents = json.loads(argv[1])
+
+    # Establish connection to cosmos db
+    credential = DefaultAzureCredential()
+    client = CosmosClient(endpoint, credential=credential)
+
+    # Save document to cosmos db
+    try:
+        db_container = client.get_database_client(database).get_container_client(container_name)
+
+        sync_documents(db_container, environment, documents)
 
-# Save document to cosmos db
-try:
-    database = client.get_database_client(database)
-    db_container = database.get_container_client(container_name)
+    except AttributeError as attribute_error:
+        print(f"Saving to db failed with AttributeError error: {attribute_error}")
+        raise
+    except exceptions.CosmosHttpResponseError as http_response_error:
+        print(f"Saving to db failed with CosmosHttpResponseError error: {http_response_error}")
+        raise
 
-    remove_documents(db_container)
-    add_documents(db_container, documents)
+    print("Save to database completed.")
 
-except AttributeError as attribute_error:
-    print(f"Saving to db failed with AttributeError error: {attribute_error}")
-    raise
-except exceptions.CosmosHttpResponseError as http_response_error:
-    print(f"Saving to db failed with CosmosHttpResponseError error: {http_response_error}")
-    raise
 
-print("Save to database completed.")
\ No newline at end of file
+if __name__ == '__main__':
+    main(sys.argv)
\ No newline at end of file
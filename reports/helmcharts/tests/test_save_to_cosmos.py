@@ -0,0 +1,57 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from cosmos_sink import get_document_id
+from cosmos_sink.fake import MAX_ITEM_BYTES, FakeContainer
+
+# save-to-cosmos.py is run as a script, load it by its path
+spec = importlib.util.spec_from_file_location("save_to_cosmos", Path(__file__).parent.parent / "save-to-cosmos.py")
+save_to_cosmos = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(save_to_cosmos)
+
+
+def get_chart(environment, cluster, namespace, chart, version="1.0.0"):
+    return {"environment": environment, "cluster": cluster, "namespace": namespace, "chart": chart,
+            "installedVersion": version, "createdOn": "2025-01-01 00:00:00"}
+
+
+def get_ids(container, environment):
+    return sorted(item["id"] for item in container.items if item["environment"] == environment)
+
+
+def test_charts_are_written_over_by_environment_cluster_namespace_and_chart():
+    container = FakeContainer("/namespace")
+    charts = [get_chart("prod", "00", "camunda", "camunda"), get_chart("prod", "01", "camunda", "camunda")]
+    save_to_cosmos.sync_documents(container, "prod", charts)
+
+    updated = [get_chart("prod", "00", "camunda", "camunda", "1.1.0"), get_chart("prod", "01", "camunda", "camunda")]
+    save_to_cosmos.sync_documents(container, "prod", updated)
+
+    assert get_ids(container, "prod") == sorted(get_document_id(chart, save_to_cosmos.KEY_FIELDS) for chart in charts)
+    assert len(set(get_ids(container, "prod"))) == 2
+    versions = sorted(item["installedVersion"] for item in container.items)
+    assert versions == ["1.0.0", "1.1.0"]
+
+
+def test_only_the_charts_of_the_synced_environment_are_removed():
+    container = FakeContainer("/namespace")
+    save_to_cosmos.sync_documents(container, "aat", [get_chart("aat", "00", "camunda", "camunda")])
+    save_to_cosmos.sync_documents(container, "prod", [get_chart("prod", "00", "camunda", "camunda"),
+                                                      get_chart("prod", "00", "flux", "flux")])
+
+    save_to_cosmos.sync_documents(container, "prod", [get_chart("prod", "00", "flux", "flux")])
+
+    assert get_ids(container, "prod") == [get_document_id(get_chart("prod", "00", "flux", "flux"),
+                                                          save_to_cosmos.KEY_FIELDS)]
+    assert get_ids(container, "aat") == [get_document_id(get_chart("aat", "00", "camunda", "camunda"),
+                                                         save_to_cosmos.KEY_FIELDS)]
+
+
+def test_failed_documents_fail_the_sync():
+    container = FakeContainer("/namespace")
+    chart = get_chart("prod", "00", "camunda", "camunda")
+    chart["values"] = "x" * MAX_ITEM_BYTES
+
+    with pytest.raises(RuntimeError, match="1 documents could not be saved"):
+        save_to_cosmos.sync_documents(container, "prod", [chart])
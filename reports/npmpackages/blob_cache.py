@@ -0,0 +1,31 @@
+from github_client import RunCache, get_env_store
+
+
+def get_cache_key(file_type, sha):
+    # The same content is parsed differently as a package.json and as a lockfile
+    return f"{file_type}:{sha}"
+
+
+class BlobCache(RunCache):
+    """
+    Parsed dependencies of package files keyed by their git blob sha, which only changes with
+    the content. Bump the version when the parsing of package files changes.
+    """
+    name = "blob cache"
+    version = 1
+
+    def get(self, file_type, sha):
+        """Returns (True, dependencies) for a cached file, dependencies being None for an unreadable one"""
+        key = get_cache_key(file_type, sha)
+        if key in self.entries:
+            return True, self.use(key)
+        self.misses += 1
+        return False, None
+
+    def put(self, file_type, sha, dependencies):
+        self.keep(get_cache_key(file_type, sha), dependencies)
+
+
+def get_cache_store():
+    """The store NPM_CACHE_BLOB_URL or NPM_CACHE_PATH point at, None when caching is off"""
+    return get_env_store("NPM")
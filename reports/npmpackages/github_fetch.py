@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Fetch the package files of every repository of the GitHub organisation.
+
+Usage: github_fetch.py <output-dir>
+Writes <output-dir>/<repository>.ndjson for each repository, one line for each of its package.json,
+package-lock.json and yarn.lock files with their dependencies.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+import aiohttp
+
+import github_client
+from github_client import GitHubClient, GitHubError, ResponseCache, create_session
+
+from blob_cache import BlobCache, get_cache_store
+from lockfiles import choose_files, get_file_entry, parse_dependencies
+
+GITHUB_ORG = os.getenv("GITHUB_ORG", "hmcts")
+# Requests in flight at once, shared by every repository of the scan
+PARALLELISM = int(os.getenv("PARALLELISM", 16))
+# Rounds a repository that could not be fetched is queued again for, after the rest of the organisation
+REPOSITORY_RETRIES = int(os.getenv("REPOSITORY_RETRIES", 3))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def get_blob(client, repository, sha):
+    """Text of a file by its blob sha, or None if it cannot be fetched"""
+    # Blobs are cached by their sha once parsed, their body is not worth keeping in the response cache
+    status, _, body = await client.request(f"/repos/{GITHUB_ORG}/{repository}/git/blobs/{sha}",
+                                           accept="application/vnd.github.raw+json", cached=False)
+    if status != 200:
+        logger.warning(f"Cannot fetch blob {sha} of {repository}: HTTP status {status}")
+        return None
+    return body.decode("utf-8", errors="replace")
+
+
+async def list_repositories(client):
+    """Name and default branch of every repository of the organisation"""
+    repositories = await client.get_pages(f"/orgs/{GITHUB_ORG}/repos")
+    unique = {repository["name"]: repository.get("default_branch") for repository in repositories}
+    return sorted(unique.items())
+
+
+async def fetch_file(client, repository, branch, path, sha, cache):
+    """
+    The entry of a package file, fetched and parsed only if its blob sha is not in the cache.
+    """
+    file_type = os.path.basename(path)
+    cached, dependencies = cache.get(file_type, sha)
+    if not cached:
+        text = await get_blob(client, repository, sha)
+        if text is None:
+            return None
+        dependencies = parse_dependencies(file_type, text)
+        cache.put(file_type, sha, dependencies)
+    if dependencies is None:
+        return None
+    return get_file_entry(repository, branch, path, dependencies)
+
+
+async def fetch_repository(client, repository, branch, cache=None):
+    """
+    Entries of the package files of a repository's default branch, empty if it has no tree, e.g. an empty
+    repository. Raises GitHubError when GitHub still rate limits or fails a request after every retry.
+    """
+    logger.info(f"Processing {repository} on branch {branch}")
+    status, tree = await client.get_json(f"/repos/{GITHUB_ORG}/{repository}/git/trees/{quote(branch)}",
+                                         params={"recursive": "true"})
+    if status != 200:
+        logger.info(f"Skipping {repository}: HTTP status {status}")
+        return []
+
+    cache = BlobCache() if cache is None else cache
+    blobs = {item["path"]: item["sha"] for item in tree.get("tree", []) if item.get("type") == "blob"}
+    entries = await asyncio.gather(*(fetch_file(client, repository, branch, path, blobs[path], cache)
+                                     for path in choose_files(blobs)))
+    return [entry for entry in entries if entry is not None]
+
+
+async def fetch_repositories(client, repositories, output_dir, cache):
+    """
+    Write the entries of each (repository, branch) of repositories to output_dir, one NDJSON file per repository.
+    A repository GitHub kept rate limiting or failing is queued and fetched again once the others are done,
+    rather than written empty. Raises RuntimeError if some still fail after REPOSITORY_RETRIES rounds.
+    """
+    async def fetch(repository, branch):
+        try:
+            entries = await fetch_repository(client, repository, branch, cache)
+        except (aiohttp.ClientError, GitHubError) as e:
+            logger.warning(f"Cannot fetch {repository}, queued for retry: {e}")
+            return repository, branch
+        (Path(output_dir) / f"{repository}.ndjson").write_text("".join(f"{json.dumps(entry)}\n" for entry in entries))
+        return None
+
+    pending = repositories
+    for attempt in range(REPOSITORY_RETRIES + 1):
+        if attempt > 0:
+            logger.info(f"Retrying {len(pending)} repositories, round {attempt} of {REPOSITORY_RETRIES}")
+        failed = await asyncio.gather(*(fetch(repository, branch) for repository, branch in pending))
+        pending = [repository for repository in failed if repository is not None]
+        if not pending:
+            return
+    raise RuntimeError(f"Cannot fetch {len(pending)} repositories: {', '.join(name for name, _ in pending)}")
+
+
+async def fetch_all(output_dir, token, concurrency=None, cache=None, response_cache=None):
+    """
+    Write the entries of every repository to output_dir, one NDJSON file per repository.
+    Requests are paced to GitHub's rate limits. Package files whose blob sha is in cache are not fetched again,
+    the repository list and trees in response_cache are only fetched again if they changed.
+    Returns the number of repositories.
+    """
+    cache = BlobCache() if cache is None else cache
+    concurrency = concurrency or PARALLELISM
+    async with create_session(token, concurrency) as session:
+        client = GitHubClient(session, concurrency, cache=response_cache)
+        repositories = await list_repositories(client)
+        logger.info(f"Fetching package files of {len(repositories)} repositories")
+
+        await fetch_repositories(client, repositories, output_dir, cache)
+        logger.info(f"Fetched {len(repositories)} repositories. {client.summary()}")
+        logger.info(cache.summary())
+        if response_cache is not None:
+            logger.info(response_cache.summary())
+        return len(repositories)
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: github_fetch.py <output-dir>", file=sys.stderr)
+        return 2
+    token = os.getenv("GH_TOKEN")
+    if not token:
+        print("No GitHub token set.", file=sys.stderr)
+        return 1
+
+    start_time = time.time()
+    store = get_cache_store()
+    cache = github_client.load_cache(store, BlobCache)
+    response_store = github_client.get_cache_store()
+    response_cache = github_client.load_cache(response_store, ResponseCache)
+    try:
+        asyncio.run(fetch_all(argv[1], token, cache=cache, response_cache=response_cache))
+    except (aiohttp.ClientError, RuntimeError) as e:
+        logger.error(f"Cannot get npm repositories: {e}")
+        return 1
+    finally:
+        # What was fetched before a failure is still worth keeping for the next run
+        github_client.save_cache(store, cache)
+        github_client.save_cache(response_store, response_cache)
+    logger.info(f"Fetch complete in {time.time() - start_time:.1f} sec")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,76 @@
+import json
+import posixpath
+import re
+
+from yarnlock_to_json import parse_yarn_lock, simplify
+
+# package.json, package-lock.json and yarn.lock files outside node_modules
+PACKAGE_FILE = re.compile(r"(^|/)(package(-lock)?\.json|yarn\.lock)$")
+NODE_MODULES = re.compile(r"(^|/)node_modules(/|$)")
+
+# Within a directory a yarn.lock is used over a package-lock.json, and either over the package.json
+FILE_PRECEDENCE = ["yarn.lock", "package-lock.json", "package.json"]
+
+
+def get_file_type(path):
+    return posixpath.basename(path)
+
+
+def choose_files(paths):
+    """
+    The file read for each directory of a repository tree: its yarn.lock, or else its package-lock.json,
+    or else its package.json.
+    """
+    by_directory = {}
+    for path in paths:
+        if PACKAGE_FILE.search(path) and not NODE_MODULES.search(path):
+            by_directory.setdefault(posixpath.dirname(path), {})[get_file_type(path)] = path
+
+    chosen = [min(files.items(), key=lambda item: FILE_PRECEDENCE.index(item[0])) for files in by_directory.values()]
+    return [path for file_type, path in sorted(chosen, key=lambda item: (FILE_PRECEDENCE.index(item[0]), item[1]))]
+
+
+def get_lock_dependencies(lock):
+    """Package name to version map of a package-lock.json, lockfile v1 dependencies and v2/v3 packages"""
+    dependencies = {}
+    for name, value in (lock.get("dependencies") or {}).items():
+        dependencies[name] = value.get("version") if isinstance(value, dict) else value
+    for key, value in (lock.get("packages") or {}).items():
+        if not key.startswith("node_modules/"):
+            continue
+        if isinstance(value, dict):
+            version = value.get("version") or value.get("resolved")
+        else:
+            version = value if isinstance(value, str) else None
+        if version is not None:
+            dependencies[key[len("node_modules/"):]] = version
+    return dependencies
+
+
+def parse_dependencies(file_type, text):
+    """
+    The dependencies, devDependencies, peerDependencies and resolutions of a package file.
+    Lockfiles only have dependencies. Returns None for a file that cannot be parsed.
+    """
+    if not text or not text.strip():
+        return None
+    if file_type == "yarn.lock":
+        return {"dependencies": simplify(parse_yarn_lock(text.splitlines(True))),
+                "devDependencies": {}, "peerDependencies": {}, "resolutions": {}}
+    try:
+        content = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(content, dict):
+        return None
+    if file_type == "package-lock.json":
+        return {"dependencies": get_lock_dependencies(content),
+                "devDependencies": {}, "peerDependencies": {}, "resolutions": {}}
+    return {field: content.get(field) or {}
+            for field in ("dependencies", "devDependencies", "peerDependencies", "resolutions")}
+
+
+def get_file_entry(repository, branch, path, dependencies):
+    """A repository file's entry in the per repository JSON"""
+    return {"repository": repository, "file": path, "fileType": get_file_type(path), "branch": branch,
+            **dependencies}
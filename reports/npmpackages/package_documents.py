@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""Transform the package files fetched by github_fetch.py into one document per package.
+
+Usage: package_documents.py <fetch-dir>
+Prints the documents of every <fetch-dir>/<repository>.ndjson as NDJSON, one repository at a time.
+"""
+import json
+import sys
+from pathlib import Path
+
+GITHUB_URL = "https://github.com/hmcts"
+# Packages of the same workspace, not published versions
+WORKSPACE_VERSION = "workspace:*"
+# Fields of a package file read in order, with the dependencyType of their packages and of what those require
+DEPENDENCY_FIELDS = [
+    ("dependencies", "dependency", "transitiveDependency"),
+    ("devDependencies", "devDependency", "transitiveDevDependency"),
+    ("peerDependencies", "peerDependency", "transitivePeerDependency"),
+    ("resolutions", "resolution", "transitiveDevDependency"),
+]
+
+
+def get_dependency_types(field, value):
+    """The dependencyType of a package and of the packages it requires"""
+    _, direct, transitive = next(entry for entry in DEPENDENCY_FIELDS if entry[0] == field)
+    if field == "dependencies" and isinstance(value, dict) and value.get("dev") is True:
+        # A lockfile v1 entry only needed for development
+        return "devDependency", "transitiveDevDependency"
+    return direct, transitive
+
+
+def get_package_documents(entry):
+    """
+    The documents of the packages a file entry lists, followed by the packages each one requires
+    when its value is a lockfile entry rather than a version.
+    """
+    repository, file, branch = entry["repository"], entry.get("file") or "", entry.get("branch") or "main"
+    base = {"repository": repository, "file": file, "branch": branch}
+    file_url = f"{GITHUB_URL}/{repository}/blob/{branch}/{file}"
+
+    for field, _, _ in DEPENDENCY_FIELDS:
+        for package, value in (entry.get(field) or {}).items():
+            if value == WORKSPACE_VERSION:
+                continue
+            direct, transitive = get_dependency_types(field, value)
+            version = value.get("version") if isinstance(value, dict) else value
+            yield {**base, "package": package, "version": version, "dependencyType": direct, "fileUrl": file_url}
+            requires = value.get("requires") if isinstance(value, dict) else None
+            for required, required_version in (requires or {}).items():
+                yield {**base, "package": required, "version": required_version, "dependencyType": transitive,
+                       "fileUrl": file_url}
+
+
+def read_entries(path):
+    """The file entries of a repository's NDJSON"""
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_documents(fetch_dir):
+    """
+    The package documents of every repository fetched to fetch_dir, read one repository file at a time.
+    """
+    for path in sorted(Path(fetch_dir).glob("*.ndjson")):
+        for entry in read_entries(path):
+            yield from get_package_documents(entry)
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: package_documents.py <fetch-dir>", file=sys.stderr)
+        return 2
+    for document in iter_documents(argv[1]):
+        sys.stdout.write(f"{json.dumps(document)}\n")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,49 @@
+import asyncio
+import json
+
+from github_client import LocalStore, load_cache, save_cache
+
+from blob_cache import BlobCache
+from github_fetch import fetch_repository
+from test_github_fetch import FakeGitHubClient
+
+TREE = (200, {"tree": [{"path": "package.json", "type": "blob", "sha": "1"}]}, {})
+PACKAGE = (200, json.dumps({"dependencies": {"express": "^4.0.0"}}).encode(), {})
+
+
+def test_unchanged_blobs_are_not_fetched_again():
+    cache = BlobCache()
+    first = FakeGitHubClient({"/repos/hmcts/app/git/trees/main": TREE, "/repos/hmcts/app/git/blobs/1": PACKAGE})
+    second = FakeGitHubClient({"/repos/hmcts/app/git/trees/main": TREE})
+
+    fetched = asyncio.run(fetch_repository(first, "app", "main", cache))
+    cached = asyncio.run(fetch_repository(second, "app", "main", cache))
+
+    assert cached == fetched
+    assert second.paths == ["/repos/hmcts/app/git/trees/main"]
+    assert (cache.hits, cache.misses, cache.hit_rate) == (1, 1, 0.5)
+
+
+def test_cache_keeps_only_the_entries_used_by_the_run(tmp_path):
+    store = LocalStore(str(tmp_path / "cache.json.gz"))
+    cache = BlobCache({"package.json:old": {"dependencies": {}}})
+    cache.put("yarn.lock", "new", {"dependencies": {"express": "4.18.2"}})
+    save_cache(store, cache)
+
+    loaded = load_cache(store, BlobCache)
+
+    assert loaded.entries == {"yarn.lock:new": {"dependencies": {"express": "4.18.2"}}}
+    assert load_cache(LocalStore(str(tmp_path / "missing.json.gz")), BlobCache).entries == {}
+
+
+def test_cache_of_another_version_is_dropped(tmp_path):
+    store = LocalStore(str(tmp_path / "cache.json.gz"))
+    cache = BlobCache()
+    cache.put("package.json", "1", {"dependencies": {}})
+    save_cache(store, cache)
+
+    class NextBlobCache(BlobCache):
+        version = BlobCache.version + 1
+
+    assert load_cache(store, NextBlobCache).entries == {}
+    assert cache.summary() == "Blob cache: 0 hits, 0 misses, 0% hit rate, 1 entries kept"
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+from github_client import GitHubClient, GitHubError
+
+from github_fetch import fetch_repositories, fetch_repository, list_repositories
+
+TREE = (200, {"tree": [{"path": "package.json", "type": "blob", "sha": "1"}]}, {})
+PACKAGE = (200, json.dumps({"dependencies": {"express": "^4.0.0"}}).encode(), {})
+
+
+class FakeGitHubClient(GitHubClient):
+    """
+    Answers requests from canned responses keyed by path. A list of responses answers one request each,
+    an exception is raised.
+    """
+
+    def __init__(self, responses):
+        super().__init__(session=None, concurrency=4)
+        self.responses = responses
+        self.paths = []
+
+    async def request(self, path, params=None, accept="application/vnd.github+json", cached=True):
+        self.paths.append(path)
+        response = self.responses.get(path, (404, "", {}))
+        if isinstance(response, list):
+            response = response.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        status, body, headers = response
+        return status, headers, body if isinstance(body, bytes) else json.dumps(body).encode()
+
+
+def test_repositories_are_listed_across_pages():
+    client = FakeGitHubClient({
+        "/orgs/hmcts/repos": (200, [{"name": "b", "default_branch": "main"}],
+                              {"Link": '<https://api.github.com/orgs/hmcts/repos?page=2>; rel="next"'}),
+        "https://api.github.com/orgs/hmcts/repos?page=2": (200, [{"name": "a", "default_branch": "master"}], {}),
+    })
+
+    assert asyncio.run(list_repositories(client)) == [("a", "master"), ("b", "main")]
+
+
+def test_repository_files_are_fetched_by_blob_sha():
+    client = FakeGitHubClient({
+        "/repos/hmcts/app/git/trees/main": (200, {"tree": [
+            {"path": "package.json", "type": "blob", "sha": "1"},
+            {"path": "package-lock.json", "type": "blob", "sha": "2"},
+            {"path": "docs", "type": "tree", "sha": "3"},
+        ]}, {}),
+        "/repos/hmcts/app/git/blobs/2": (200, json.dumps({"packages": {"node_modules/express": {"version": "4.19.0"}}}).encode(), {}),
+    })
+
+    entries = asyncio.run(fetch_repository(client, "app", "main"))
+
+    assert entries == [{"repository": "app", "file": "package-lock.json", "fileType": "package-lock.json", "branch": "main",
+                        "dependencies": {"express": "4.19.0"}, "devDependencies": {}, "peerDependencies": {},
+                        "resolutions": {}}]
+    assert "/repos/hmcts/app/git/blobs/1" not in client.paths
+
+
+def test_repository_without_a_tree_is_empty():
+    assert asyncio.run(fetch_repository(FakeGitHubClient({}), "empty", "main")) == []
+
+
+
+def test_repositories_github_keeps_limiting_are_retried_after_the_others(tmp_path):
+    client = FakeGitHubClient({
+        "/repos/hmcts/app/git/trees/main": [GitHubError("/repos/hmcts/app/git/trees/main", 429), TREE],
+        "/repos/hmcts/app/git/blobs/1": PACKAGE,
+    })
+
+    asyncio.run(fetch_repositories(client, [("app", "main"), ("empty", "main")], tmp_path, cache=None))
+
+    assert json.loads((tmp_path / "app.ndjson").read_text())["dependencies"] == {"express": "^4.0.0"}
+    assert (tmp_path / "empty.ndjson").read_text() == ""
+    assert client.paths.count("/repos/hmcts/app/git/trees/main") == 2
+
+
+def test_repositories_still_failing_are_not_written(tmp_path):
+    client = FakeGitHubClient({"/repos/hmcts/app/git/trees/main": [GitHubError("trees/main", 502)] * 4})
+
+    with pytest.raises(RuntimeError, match="Cannot fetch 1 repositories: app"):
+        asyncio.run(fetch_repositories(client, [("app", "main")], tmp_path, cache=None))
+
+    assert not (tmp_path / "app.ndjson").exists()
@@ -0,0 +1,40 @@
+import json
+
+from lockfiles import choose_files, parse_dependencies
+
+
+def test_yarn_lock_is_used_over_package_lock_over_package_json():
+    paths = ["package.json", "yarn.lock", "web/package.json", "web/package-lock.json", "api/package.json",
+             "node_modules/left-pad/package.json", "README.md"]
+
+    assert choose_files(paths) == ["yarn.lock", "web/package-lock.json", "api/package.json"]
+
+
+def test_package_json_keeps_every_dependency_field():
+    text = json.dumps({"name": "app", "dependencies": {"express": "^4.0.0"}, "devDependencies": {"jest": "29.0.0"}})
+
+    assert parse_dependencies("package.json", text) == {
+        "dependencies": {"express": "^4.0.0"}, "devDependencies": {"jest": "29.0.0"},
+        "peerDependencies": {}, "resolutions": {}}
+
+
+def test_package_lock_merges_v1_dependencies_and_v3_packages():
+    text = json.dumps({
+        "dependencies": {"express": {"version": "4.18.2"}},
+        "packages": {"": {"name": "app"}, "node_modules/express": {"version": "4.19.0"},
+                     "node_modules/debug": {"resolved": "https://registry/debug-2.6.9.tgz"}},
+    })
+
+    assert parse_dependencies("package-lock.json", text)["dependencies"] == {
+        "express": "4.19.0", "debug": "https://registry/debug-2.6.9.tgz"}
+
+
+def test_yarn_lock_is_simplified_to_package_versions():
+    text = 'express@^4.0.0:\n  version "4.18.2"\n  dependencies:\n    debug "2.6.9"\n'
+
+    assert parse_dependencies("yarn.lock", text)["dependencies"] == {"express": "4.18.2"}
+
+
+def test_unreadable_files_are_skipped():
+    assert parse_dependencies("package.json", "{not json") is None
+    assert parse_dependencies("package-lock.json", "") is None
@@ -0,0 +1,49 @@
+import json
+
+from package_documents import get_package_documents, iter_documents
+
+URL = "https://github.com/hmcts/app/blob/master/package.json"
+
+
+def test_packages_of_each_field_get_their_dependency_type():
+    entry = {"repository": "app", "file": "package.json", "branch": "master",
+             "dependencies": {"express": "^4.0.0", "shared": "workspace:*"}, "devDependencies": {"jest": "29.0.0"},
+             "peerDependencies": {"react": "18"}, "resolutions": {"minimist": "1.2.8"}}
+
+    documents = list(get_package_documents(entry))
+
+    assert [(document["package"], document["dependencyType"]) for document in documents] == [
+        ("express", "dependency"), ("jest", "devDependency"), ("react", "peerDependency"), ("minimist", "resolution")]
+    assert documents[0] == {"repository": "app", "file": "package.json", "branch": "master", "package": "express",
+                            "version": "^4.0.0", "dependencyType": "dependency", "fileUrl": URL}
+
+
+def test_lockfile_entries_are_followed_by_what_they_require():
+    entry = {"repository": "app", "file": "package.json", "branch": "master", "dependencies": {
+        "jest": {"version": "29.0.0", "dev": True, "requires": {"expect": "^29.0.0"}},
+        "express": {"version": "4.19.0", "requires": {"qs": "6.11.0"}}}}
+
+    documents = [(document["package"], document["version"], document["dependencyType"])
+                 for document in get_package_documents(entry)]
+
+    assert documents == [("jest", "29.0.0", "devDependency"), ("expect", "^29.0.0", "transitiveDevDependency"),
+                         ("express", "4.19.0", "dependency"), ("qs", "6.11.0", "transitiveDependency")]
+
+
+def test_branch_defaults_to_main():
+    entry = {"repository": "app", "file": "yarn.lock", "branch": None, "dependencies": {"express": "4.19.0"}}
+
+    [document] = get_package_documents(entry)
+
+    assert (document["branch"], document["fileUrl"]) == ("main", "https://github.com/hmcts/app/blob/main/yarn.lock")
+
+
+def test_documents_are_read_one_repository_file_at_a_time(tmp_path):
+    (tmp_path / "b.ndjson").write_text(
+        json.dumps({"repository": "b", "file": "package.json", "branch": "main", "dependencies": {"x": "1"}}) + "\n")
+    (tmp_path / "a.ndjson").write_text("")
+
+    documents = iter_documents(tmp_path)
+
+    assert next(documents)["repository"] == "b"
+    assert next(documents, None) is None
@@ -0,0 +1,52 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from cosmos_sink import get_document_id
+from cosmos_sink.fake import MAX_ITEM_BYTES, FakeContainer
+
+# save-to-cosmos.py is run as a script, load it by its path
+spec = importlib.util.spec_from_file_location("save_to_cosmos", Path(__file__).parent.parent / "save-to-cosmos.py")
+save_to_cosmos = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(save_to_cosmos)
+
+
+def get_package(repository, package, version, file="package-lock.json", dependency_type="dependencies"):
+    return {"repository": repository, "file": file, "package": package, "version": version,
+            "dependencyType": dependency_type}
+
+
+def get_ids(container):
+    return sorted(item["id"] for item in container.items)
+
+
+def test_each_version_of_a_package_in_a_file_is_a_document():
+    container = FakeContainer("/repository")
+    packages = [get_package("app", "express", "4.18.2"), get_package("app", "express", "5.0.0"),
+                get_package("app", "express", "4.18.2", "package.json"),
+                get_package("app", "express", "4.18.2", dependency_type="devDependencies")]
+
+    save_to_cosmos.sync_documents(container, (package for package in packages))
+    save_to_cosmos.sync_documents(container, (package for package in packages))
+
+    assert get_ids(container) == sorted(get_document_id(package, save_to_cosmos.KEY_FIELDS) for package in packages)
+    assert len(container.items) == 4
+
+
+def test_packages_no_longer_used_are_removed():
+    container = FakeContainer("/repository")
+    save_to_cosmos.sync_documents(container, iter([get_package("app", "express", "4.18.2"),
+                                                   get_package("app", "lodash", "4.17.21"),
+                                                   get_package("api", "express", "4.18.2")]))
+
+    save_to_cosmos.sync_documents(container, iter([get_package("app", "lodash", "4.17.21")]))
+
+    assert get_ids(container) == [get_document_id(get_package("app", "lodash", "4.17.21"), save_to_cosmos.KEY_FIELDS)]
+
+
+def test_failed_documents_fail_the_sync():
+    container = FakeContainer("/repository")
+    package = get_package("app", "x" * MAX_ITEM_BYTES, "1.0.0")
+
+    with pytest.raises(RuntimeError, match="1 documents could not be saved"):
+        save_to_cosmos.sync_documents(container, iter([package]))
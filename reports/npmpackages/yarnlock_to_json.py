@@ -94,6 +94,40 @@ def parse_yarn_lock(lines):
     return result
 
 
+def simplify(parsed, debug=False):
+    """Package name to version map of the parsed yarn.lock entries"""
+    # Extract only package name and version to reduce data size
+    simplified = {}
+    for key, value in parsed.items():
+        # Extract package name (everything before the first @)
+        package_name = key.split('@')[0] if '@' in key else key
+        # Remove leading/trailing quotes and backslashes from package name
+        package_name = package_name.strip(' "\'\\')
+        
+        # Skip the _metadata package
+        if package_name == '_metadata':
+            continue
+            
+        # Extract version from the value object (try both 'version' and 'version:' keys)
+        if isinstance(value, dict):
+            version = value.get('version', '') or value.get('version:', '')
+        else:
+            version = str(value)
+        
+        # Debug: Print extraction info for first few entries (only if debug flag is set)
+        if debug and len(simplified) < 3:
+            print(f"DEBUG: Processing key='{key}' -> name='{package_name}', version='{version}'", file=sys.stderr)
+        
+        # Only include if we have both name and version
+        if package_name and version:
+            simplified[package_name] = version
+    
+    # Debug: Print final count (only if debug flag is set)
+    if debug:
+        print(f"DEBUG: Simplified to {len(simplified)} entries", file=sys.stderr)
+    return simplified
+
+
 def main(argv):
     # Parse arguments for debug flag and input file
     debug = False
@@ -137,36 +171,8 @@ def main(argv):
             print(f"DEBUG: Sample value: {sample_value}", file=sys.stderr)
             print(f"DEBUG: Value type: {type(sample_value)}", file=sys.stderr)
     
-    # Extract only package name and version to reduce data size
-    simplified = {}
-    for key, value in parsed.items():
-        # Extract package name (everything before the first @)
-        package_name = key.split('@')[0] if '@' in key else key
-        # Remove leading/trailing quotes and backslashes from package name
-        package_name = package_name.strip(' "\'\\')
-        
-        # Skip the _metadata package
-        if package_name == '_metadata':
-            continue
-            
-        # Extract version from the value object (try both 'version' and 'version:' keys)
-        if isinstance(value, dict):
-            version = value.get('version', '') or value.get('version:', '')
-        else:
-            version = str(value)
-        
-        # Debug: Print extraction info for first few entries (only if debug flag is set)
-        if debug and len(simplified) < 3:
-            print(f"DEBUG: Processing key='{key}' -> name='{package_name}', version='{version}'", file=sys.stderr)
-        
-        # Only include if we have both name and version
-        if package_name and version:
-            simplified[package_name] = version
-    
-    # Debug: Print final count (only if debug flag is set)
-    if debug:
-        print(f"DEBUG: Simplified to {len(simplified)} entries", file=sys.stderr)
-    
+    simplified = simplify(parsed, debug)
+
     # Print simplified JSON to stdout
     print(json.dumps(simplified, indent=2, sort_keys=True))
     return 0
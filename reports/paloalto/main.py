@@ -27,9 +27,6 @@ try:
     # Connect to cosmosdb server
     storage = Storage(data_source)
 
-    # Remove all existing docs
-    storage.remove_documents(environment)
-
     # Connect to panorama server in environment
     panorama_mgmt = PanoramaMgmt(
         subscription_id=subscription_id,
@@ -42,18 +39,15 @@ try:
     panorama_document = panorama_mgmt.generate_server_document()
 
     if panorama_document is not None:
-        logger("Saving Panorama management info")
-        storage.save_document(panorama_document)
-
         # Ask management server for installed software information for managed devices
         logger("Fetching ngfw server info")
         device_documents = panorama_mgmt.generate_device_documents()
 
-        for idx, device_document in enumerate(device_documents, start=1):
-            logger(f"Saving ngfw server info, document: {idx}")
-            storage.save_document(device_document)
+        # Replace the environment's existing docs
+        logger("Saving Panorama management and ngfw server info")
+        storage.sync_documents(environment, [panorama_document, *device_documents])
 
-        logger(f"Process complete in {environment}.")
+        logger(f"Process complete in {environment}: {storage.sink.summary}")
     else:
         logger(f"Empty document returned. Nothing was saved to db for {environment}.")
 
@@ -1,7 +1,15 @@
-from azure.cosmos import CosmosClient, exceptions
+from azure.cosmos import CosmosClient
 from azure.identity import DefaultAzureCredential
+from cosmos_sink import CosmosSink
 from utility import logger
 
+# Partition key of the paloalto container
+PARTITION_KEY = "resourceType"
+# The Panorama server and each firewall of an environment is a document
+KEY_FIELDS = ["environment", "resourceType", "resource"]
+# Set on every run, an unchanged resource keeps the time it was last changed
+VOLATILE_FIELDS = ["lastUpdated"]
+
 
 class Storage:
 
@@ -10,6 +18,7 @@ class Storage:
         self.db_database = config.get("database")
         self.db_container = config.get("container")
         self.client = None
+        self.sink = None
 
         # Establish connection to db
         self.connect_to_db()
@@ -18,31 +27,22 @@ class Storage:
         logger("Establishing connection to cosmos db")
         credential = DefaultAzureCredential()
         self.client = CosmosClient(self.db_uri, credential=credential)
+        database = self.client.get_database_client(self.db_database)
+        self.sink = CosmosSink(database.get_container_client(self.db_container), PARTITION_KEY)
         logger("Connection established")
 
-    def save_document(self, document):
-        resource_name = document.get('resource')
-        logger(f"Saving to db for: {resource_name}")
-        try:
-            database = self.client.get_database_client(self.db_database)
-            container = database.get_container_client(self.db_container)
-            container.upsert_item(body=document)
-        except exceptions.CosmosHttpResponseError:
-            logger(f"Saving to db for {resource_name} failed")
-            raise
-
-    def remove_documents(self, environment):
-        try:
-            database = self.client.get_database_client(self.db_database)
-            container = database.get_container_client(self.db_container)
-
-            print(f"Removing all existing documents")
-            for item in container.query_items(
-                    query='SELECT * FROM c WHERE c.environment = @environment',
-                    parameters=[dict(name='@environment', value=environment)],
-                    enable_cross_partition_query=True):
-                container.delete_item(item, partition_key=item["resourceType"])
-
-            print("Removing documents complete")
-        except exceptions.CosmosHttpResponseError as remove_response_error:
-            print(f"Removing items from db failed with: {remove_response_error}")
+    def sync_documents(self, environment, documents):
+        """
+        Replace the environment's documents with documents, written over last run's document
+        for the same resource. Only resources no longer found are removed.
+        """
+        documents = list(documents)
+        logger(f"Saving to db: {', '.join(str(document.get('resource')) for document in documents)}")
+        failed = self.sink.sync(
+            documents, KEY_FIELDS,
+            query=f'SELECT c.id, c.{PARTITION_KEY}, c.contentHash FROM c WHERE c.environment = @environment',
+            parameters=[dict(name='@environment', value=environment)],
+            volatile_fields=VOLATILE_FIELDS)
+        if failed:
+            logger(f"Saving to db failed for {failed} documents")
+            raise RuntimeError(f"{failed} documents could not be saved")
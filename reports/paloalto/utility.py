@@ -1,12 +1,10 @@
 import os
 import pytz
-import uuid
 from datetime import datetime
 
 
 def get_document():
     document = {
-        "id": f"{uuid.uuid4()}",
         "displayName": "Palo Alto Resources",
         "reportType": "card",
         "lastUpdated": None,
@@ -1,59 +1,76 @@
+import os
 import pytz
 from datetime import datetime
-from azure.cosmos import exceptions
+from cosmos_sink import CosmosSink
+
+# Partition key of the platopsapps container
+PARTITION_KEY = "appName"
+
+# A cluster runs each app once, so the environment, cluster and app identify a document across runs
+KEY_FIELDS = ["environment", "clusterName", "appName"]
+# Publish each run as a new generation behind a pointer document instead of syncing documents in place
+PUBLISH_GENERATIONS = os.getenv("PUBLISH_GENERATIONS", 'False').lower() in ('true', '1', 't')
 
 """
-Removes all documents from the specified container that match the given environment.
+Saves the documents of a run for the given environment the way PUBLISH_GENERATIONS asks for.
 
 Parameters:
-- container: The database container from which documents will be removed.
-- environment: The environment to match for document removal.
+- container: The database container holding the documents.
+- environment: The environment the documents were collected from.
+- documents: A list of documents to be saved to the container.
 """
-def remove_documents(container, environment):
-    try:
-        current_time = get_formatted_datetime()
-        print(f"Removing all document added before {current_time}")
-        # Only remove data from env where job is currently running
-        query = f"SELECT * FROM c WHERE c.environment = '{environment}'"
-        for item in container.query_items(
-                query=query,
-                enable_cross_partition_query=True):
-            container.delete_item(item, partition_key=item["appName"])
-
-        print("Removing documents complete")
-    except exceptions.CosmosHttpResponseError as remove_response_error:
-        print(f"Removing items from db failed with: {remove_response_error}")
+def save_documents(container, environment, documents):
+    if PUBLISH_GENERATIONS:
+        publish_documents(container, environment, documents)
+    else:
+        sync_documents(container, environment, documents)
 
 
 """
-Adds a list of documents to the specified container.
+Replaces the documents of the given environment with the new list of documents.
+Documents are written over last run's documents for the same app and cluster, and only
+documents no longer in the list are removed.
 
 Parameters:
-- container: The database container to which documents will be added.
-- documents: A list of documents to be added to the container.
+- container: The database container holding the documents.
+- environment: The environment the documents were collected from.
+- documents: A list of documents to be saved to the container.
 """
-def add_documents(container, documents):
-    print("Adding all documents.")
-    try:
-        for document in documents:
-            save_document(container, document)
-    except exceptions.CosmosHttpResponseError as add_response_error:
-        print(f"Adding document to db failed with CosmosHttpResponseError: {add_response_error}")
+def sync_documents(container, environment, documents):
+    print(f"Syncing {len(documents)} documents at {get_formatted_datetime()}")
+    sink = CosmosSink(container, PARTITION_KEY)
+    # Only remove data from env where job is currently running
+    failed = sink.sync(documents, KEY_FIELDS,
+                       f"SELECT c.id, c.{PARTITION_KEY}, c.contentHash FROM c WHERE c.environment = @environment",
+                       parameters=[dict(name='@environment', value=environment)])
+    if failed:
+        raise RuntimeError(f"{failed} documents could not be saved")
+    print(f"Syncing documents complete: {sink.summary}")
+
 
 """
-Saves a single document to the specified container.
+Writes the documents of the given environment as a new generation, and points readers at it
+once every document is written. Older generations of the environment expire through their ttl.
+Each environment has its own pointer document, current-generation-<environment>.
+Documents of the environment synced in place before, which have no ttl, are removed once the pointer has moved.
 
 Parameters:
-- container: The database container to which the document will be saved.
-- document: The document to be saved.
+- container: The database container holding the documents.
+- environment: The environment the documents were collected from.
+- documents: A list of documents to be saved to the container.
 """
-def save_document(container, document):
-    resource_name = document.get('data')
-    try:
-        container.create_item(body=document)
-    except exceptions.CosmosHttpResponseError as save_response_error:
-        print(f"Saving to db for {resource_name} failed with CosmosHttpResponseError: {save_response_error}")
-        raise
+def publish_documents(container, environment, documents):
+    print(f"Publishing {len(documents)} documents at {get_formatted_datetime()}")
+    sink = CosmosSink(container, PARTITION_KEY)
+    failed = sink.publish(documents, KEY_FIELDS, f"current-generation-{environment}",
+                          synced_query=f"SELECT c.id, c.{PARTITION_KEY} FROM c "
+                                       "WHERE c.environment = @environment AND NOT IS_DEFINED(c.generation)",
+                          parameters=[dict(name='@environment', value=environment)],
+                          # On the pointer too, so a sync of the environment finds it when the flag is turned off
+                          scope={"environment": environment})
+    if failed:
+        raise RuntimeError(f"{failed} documents could not be written, the previous generation is still published")
+    print(f"Publishing documents complete: {sink.summary}")
 
 def get_now():
     return datetime.now(pytz.timezone('Europe/London'))
@@ -2,12 +2,11 @@
 from kubernetes import client, config
 from azure.cosmos import CosmosClient, exceptions
 from azure.identity import DefaultAzureCredential
-from cosmos_functions import remove_documents, add_documents
+from cosmos_functions import save_documents
 from unittest.mock import patch, MagicMock
 from version_utility import flux_latest_version, camunda_latest_version, docmosis_latest_version, compare_versions, get_semvar
 import os
 import sys
-import uuid
 import json
 import logging
 import re
@@ -152,7 +151,6 @@ if __name__ == "__main__":
             status = compare_versions(current_version, latest_version, service)
 
             data = {
-                "id": str(uuid.uuid4()) + "_" + cluster_name,
                 "appName": service,
                 "recordType": service,
                 "currentVersion": current_version,
@@ -184,8 +182,7 @@ if __name__ == "__main__":
             cosmosClient = CosmosClient(endpoint, credential=credential)
             database = cosmosClient.get_database_client(database)
             db_container = database.get_container_client(container_name)
-            remove_documents(db_container, environment)
-            add_documents(db_container, documents)
+            save_documents(db_container, environment, documents)
         except AttributeError as attribute_error:
             logging.error(f"Saving to db failed with AttributeError error: {attribute_error}")
             raise
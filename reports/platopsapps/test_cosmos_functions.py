@@ -0,0 +1,41 @@
+import pytest
+from cosmos_sink import get_document_id
+from cosmos_sink.fake import MAX_ITEM_BYTES, FakeContainer
+
+from cosmos_functions import KEY_FIELDS, sync_documents
+
+def get_app(environment, cluster_name, app_name, version="v1.0.0"):
+    return {"environment": environment, "clusterName": cluster_name, "appName": app_name, "currentVersion": version}
+
+def get_ids(container, environment):
+    return sorted(item["id"] for item in container.items if item["environment"] == environment)
+
+# Test an app on each cluster is a document, written over on the next run
+def test_apps_are_written_over_by_environment_cluster_and_app():
+    container = FakeContainer("/appName")
+    apps = [get_app("prod", "00", "camunda"), get_app("prod", "01", "camunda")]
+    sync_documents(container, "prod", apps)
+
+    sync_documents(container, "prod", [get_app("prod", "00", "camunda", "v1.1.0"), get_app("prod", "01", "camunda")])
+
+    assert get_ids(container, "prod") == sorted(get_document_id(app, KEY_FIELDS) for app in apps)
+    assert sorted(item["currentVersion"] for item in container.items) == ["v1.0.0", "v1.1.0"]
+
+# Test only the apps of the synced environment that are no longer found are removed
+def test_only_the_apps_of_the_synced_environment_are_removed():
+    container = FakeContainer("/appName")
+    sync_documents(container, "aat", [get_app("aat", "00", "camunda")])
+    sync_documents(container, "prod", [get_app("prod", "00", "camunda"), get_app("prod", "00", "docmosis")])
+
+    sync_documents(container, "prod", [get_app("prod", "00", "docmosis")])
+
+    assert get_ids(container, "prod") == [get_document_id(get_app("prod", "00", "docmosis"), KEY_FIELDS)]
+    assert get_ids(container, "aat") == [get_document_id(get_app("aat", "00", "camunda"), KEY_FIELDS)]
+
+# Test documents that could not be saved fail the job
+def test_failed_documents_fail_the_sync():
+    container = FakeContainer("/appName")
+    app = get_app("prod", "00", "camunda", "x" * MAX_ITEM_BYTES)
+
+    with pytest.raises(RuntimeError, match="1 documents could not be saved"):
+        sync_documents(container, "prod", [app])
@@ -6,7 +6,7 @@
 #
 # Steps/Flows
 # ----------
-# 1. Get list of HMCTS organisation from GitHub via cli commands
+# 1. Search the open renovate and updatecli PRs of the HMCTS organisation via search_prs.py
 # 2. Extract details from json response, transform and build a list
 # 3. Save document generated to cosmosdb with the aid of a python script
 # NOTE: The renovate table is emptied first the refreshed with new data
@@ -40,8 +40,10 @@ get_date_value() {
 # for connecting and saving to cosmos.
 # ---------------------------------------------------------------------------
 store_documents() {
-  python3 ./save-to-cosmos.py "${1}"
-  wait $!
+  if ! python3 ./save-to-cosmos.py "${1}"; then
+    echo "Job process exited: Cannot save documents."
+    exit 1
+  fi
 }
 
 # ---------------------------------------------------------------------------
@@ -49,13 +51,10 @@ store_documents() {
 # ---------------------------------------------------------------------------
 echo "Fetching renovate PRs. Maximum of ${max_repos}"
 
-# Get PRs opened by renovate
-renovate_repos=$(gh search prs \
-  --owner hmcts \
-  --author app/renovate \
-  --state=open \
-  --sort=created \
-  --json title,repository,createdAt,url,state -L "$max_repos" | jq -r '. | unique_by(.title)')
+# Get PRs opened by renovate and updatecli, repeated searches are answered from the response cache when unchanged
+pull_requests=$(python3 ./search_prs.py "$max_repos" "renovate=author:app/renovate" "updatecli=[updatecli]")
+
+renovate_repos=$(echo "$pull_requests" | jq -r '.renovate // empty | unique_by(.title)')
 
 [[ "$renovate_repos" == "" ]] && echo "Job process existed: Cannot get renovate repositories." && exit 0
 
@@ -71,11 +70,7 @@ renovate_result=$(echo "$renovate_result" | jq --arg createdBy "renovate" '[.[]
 # Get PRs opened by updatecli
 echo "Fetching updatcli PRs. Maximum of ${max_repos}"
 
-updatecli_repos=$(gh search prs "[updatecli]" \
-  --owner hmcts \
-  --state=open \
-  --sort=created \
-  --json title,repository,createdAt,url,state -L "$max_repos" | jq -r '. | unique_by(.title)')
+updatecli_repos=$(echo "$pull_requests" | jq -r '.updatecli // empty | unique_by(.title)')
 
 [[ "$updatecli_repos" == "" ]] && echo "Job process exited: Cannot get updatecli repositories." && exit 0
 
@@ -103,13 +98,9 @@ while [ "$idx" -lt "$count" ]
 do
   repository=$(echo "$repositories" | jq -r ".[$idx]")
 
-  # The document id
-  uuid=$(uuidgen)
-
-  # Enhance document with additional information
-  document=$(echo "$repository" | jq --arg id "$uuid" \
-    --arg report_type "table" \
-    --arg display_name "Open Renovate Pull Requests" '. + {id: $id, displayName: $display_name,  reportType: $report_type}')
+  # Enhance document with additional information, the id is derived from the repository and url when saved
+  document=$(echo "$repository" | jq --arg report_type "table" \
+    --arg display_name "Open Renovate Pull Requests" '. + {displayName: $display_name,  reportType: $report_type}')
 
   documents+=("$document")
   idx=$((idx + 1))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Search the open pull requests of the GitHub organisation.
+
+Usage: search_prs.py <limit> <name>=<query>...
+Prints a JSON object with, for each name, the newest <limit> open pull requests matching its query,
+e.g. renovate=author:app/renovate or updatecli=[updatecli], in the shape
+`gh search prs --json title,repository,createdAt,url,state` prints them.
+The searches of a run share one response cache.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+
+import aiohttp
+import github_client
+from github_client import GitHubClient, ResponseCache, create_session
+
+GITHUB_ORG = os.getenv("GITHUB_ORG", "hmcts")
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+logger = logging.getLogger(__name__)
+
+
+def get_pull_request(item):
+    """A search result in the shape gh prints it"""
+    # https://api.github.com/repos/hmcts/<name>
+    name_with_owner = item["repository_url"].split("/repos/", 1)[1]
+    return {"title": item["title"],
+            "repository": {"name": name_with_owner.split("/", 1)[1], "nameWithOwner": name_with_owner},
+            "createdAt": item["created_at"], "url": item["html_url"], "state": item["state"]}
+
+
+async def search_pull_requests(client, query, limit):
+    params = {"q": f"{query} org:{GITHUB_ORG} is:pr is:open", "sort": "created", "order": "desc"}
+    items = await client.get_pages("/search/issues", params, limit=limit)
+    return [get_pull_request(item) for item in items]
+
+
+async def search(token, queries, limit, cache):
+    async with create_session(token) as session:
+        # The search API allows 30 requests a minute, one page at a time is plenty
+        client = GitHubClient(session, concurrency=1, cache=cache)
+        pull_requests = {name: await search_pull_requests(client, query, limit) for name, query in queries.items()}
+        logger.info(client.summary())
+        return pull_requests
+
+
+def main(argv):
+    if len(argv) < 3 or not all("=" in argument for argument in argv[2:]):
+        print("Usage: search_prs.py <limit> <name>=<query>...", file=sys.stderr)
+        return 2
+    token = os.getenv("GH_TOKEN")
+    if not token:
+        print("No GitHub token set.", file=sys.stderr)
+        return 1
+
+    queries = dict(argument.split("=", 1) for argument in argv[2:])
+    store = github_client.get_cache_store()
+    cache = github_client.load_cache(store, ResponseCache)
+    try:
+        pull_requests = asyncio.run(search(token, queries, int(argv[1]), cache))
+    except (aiohttp.ClientError, RuntimeError) as e:
+        logger.error(f"Cannot search pull requests: {e}")
+        return 1
+    logger.info(cache.summary())
+    github_client.save_cache(store, cache)
+    print(json.dumps(pull_requests))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,53 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+from cosmos_sink import get_document_id
+from cosmos_sink.fake import MAX_ITEM_BYTES, FakeContainer
+
+# save-to-cosmos.py is run as a script, load it by its path
+spec = importlib.util.spec_from_file_location("save_to_cosmos", Path(__file__).parent.parent / "save-to-cosmos.py")
+save_to_cosmos = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(save_to_cosmos)
+
+
+def get_pull_request(repository, number, title="Update dependency"):
+    return {"repository": repository, "url": f"https://github.com/hmcts/{repository}/pull/{number}",
+            "title": title, "createdAt": "2025-01-01T00:00:00Z"}
+
+
+def get_ids(container):
+    return sorted(item["id"] for item in container.items)
+
+
+def test_pull_requests_are_written_over_by_repository_and_url():
+    container = FakeContainer("/repository")
+    pull_requests = [get_pull_request("app", 1), get_pull_request("app", 2), get_pull_request("api", 1)]
+    save_to_cosmos.sync_documents(container, pull_requests)
+
+    save_to_cosmos.sync_documents(container, [get_pull_request("app", 1, "Update dependency to v2"),
+                                              get_pull_request("app", 2), get_pull_request("api", 1)])
+
+    assert get_ids(container) == sorted(get_document_id(pull_request, save_to_cosmos.KEY_FIELDS)
+                                        for pull_request in pull_requests)
+    assert sorted(item["title"] for item in container.items if item["repository"] == "app") == [
+        "Update dependency", "Update dependency to v2"]
+    assert {item["verdict"] for item in container.items} == {"upgrade"}
+
+
+def test_pull_requests_no_longer_open_are_removed():
+    container = FakeContainer("/repository")
+    save_to_cosmos.sync_documents(container, [get_pull_request("app", 1), get_pull_request("app", 2),
+                                              get_pull_request("api", 1)])
+
+    save_to_cosmos.sync_documents(container, [get_pull_request("app", 2)])
+
+    assert get_ids(container) == [get_document_id(get_pull_request("app", 2), save_to_cosmos.KEY_FIELDS)]
+
+
+def test_failed_documents_fail_the_sync():
+    container = FakeContainer("/repository")
+    pull_request = get_pull_request("app", 1, "x" * MAX_ITEM_BYTES)
+
+    with pytest.raises(RuntimeError, match="1 documents could not be saved"):
+        save_to_cosmos.sync_documents(container, [pull_request])
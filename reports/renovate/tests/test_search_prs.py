@@ -0,0 +1,110 @@
+import asyncio
+import json
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from github_client import GitHubClient
+
+from search_prs import get_pull_request, main, search_pull_requests
+
+# 150 open pull requests, newest first, over two pages of 100
+ITEMS = [{"title": f"Update dependency {number}", "repository_url": f"https://api.github.com/repos/hmcts/app-{number % 3}",
+          "created_at": f"2025-01-01T00:{number // 60:02}:{number % 60:02}Z", "state": "open",
+          "html_url": f"https://github.com/hmcts/app-{number % 3}/pull/{number}"} for number in range(150, 0, -1)]
+
+
+def create_app(requests):
+    """The search API, answering a page of per_page items with a Link to the next one"""
+
+    async def search(request):
+        requests.append(dict(request.query))
+        page, per_page = int(request.query.get("page", 1)), int(request.query["per_page"])
+        headers = {}
+        if page * per_page < len(ITEMS):
+            headers["Link"] = f'<{request.url.update_query(page=page + 1)}>; rel="next"'
+        items = ITEMS[(page - 1) * per_page:page * per_page]
+        return web.json_response({"total_count": len(ITEMS), "items": items}, headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/search/issues", search)
+    return app
+
+
+def search(requests, query, limit):
+    async def scan():
+        async with TestServer(create_app(requests)) as server:
+            async with aiohttp.ClientSession() as session:
+                client = GitHubClient(session, concurrency=1, api_url=str(server.make_url("")).rstrip("/"))
+                return await search_pull_requests(client, query, limit)
+
+    return asyncio.run(scan())
+
+
+def test_search_results_are_in_the_shape_gh_prints_them():
+    item = {"title": "Update dependency express to v5", "repository_url": "https://api.github.com/repos/hmcts/app",
+            "created_at": "2025-01-01T00:00:00Z", "state": "open", "html_url": "https://github.com/hmcts/app/pull/1",
+            "number": 1, "user": {"login": "renovate[bot]"}}
+
+    # The fields renovate-prs.sh reads with jq: .title, .repository.name, .repository.nameWithOwner, .state, .url, .createdAt
+    assert get_pull_request(item) == {"title": "Update dependency express to v5",
+                                      "repository": {"name": "app", "nameWithOwner": "hmcts/app"},
+                                      "createdAt": "2025-01-01T00:00:00Z", "url": "https://github.com/hmcts/app/pull/1",
+                                      "state": "open"}
+
+
+@pytest.mark.skipif(shutil.which("jq") is None, reason="jq is not installed")
+def test_renovate_prs_reshapes_the_search_results():
+    script = (Path(__file__).parent.parent / "renovate-prs.sh").read_text()
+    reshape = re.search(r"renovate_result=\$\(echo \"\$renovate_repos\" \| jq '([^']+)'\)", script).group(1)
+    pull_requests = [get_pull_request(item) for item in ITEMS[:2]]
+
+    result = subprocess.run(["jq", reshape], input=json.dumps(pull_requests), capture_output=True, text=True, check=True)
+
+    assert json.loads(result.stdout) == [
+        {"repository": "app-0", "repositoryWithOwner": "hmcts/app-0", "title": "Update dependency 150", "state": "open",
+         "url": "https://github.com/hmcts/app-0/pull/150", "createdAt": "2025-01-01T00:02:30Z"},
+        {"repository": "app-2", "repositoryWithOwner": "hmcts/app-2", "title": "Update dependency 149", "state": "open",
+         "url": "https://github.com/hmcts/app-2/pull/149", "createdAt": "2025-01-01T00:02:29Z"}]
+
+
+def test_search_follows_the_pages_up_to_the_limit():
+    requests = []
+
+    pull_requests = search(requests, "author:app/renovate", 120)
+
+    assert len(pull_requests) == 120
+    assert pull_requests[0]["url"] == "https://github.com/hmcts/app-0/pull/150"
+    assert pull_requests[-1]["url"] == "https://github.com/hmcts/app-1/pull/31"
+    assert [request.get("page") for request in requests] == [None, "2"]
+    assert requests[0]["q"] == "author:app/renovate org:hmcts is:pr is:open"
+    assert (requests[0]["sort"], requests[0]["order"]) == ("created", "desc")
+
+
+def test_search_stops_at_the_page_holding_the_limit():
+    requests = []
+
+    pull_requests = search(requests, "[updatecli]", 30)
+
+    assert [pull_request["title"] for pull_request in pull_requests] == [f"Update dependency {number}"
+                                                                         for number in range(150, 120, -1)]
+    assert len(requests) == 1
+
+
+def test_search_returns_every_page_when_the_limit_is_higher_than_the_results():
+    requests = []
+
+    pull_requests = search(requests, "[updatecli]", 500)
+
+    assert len(pull_requests) == 150
+    assert len(requests) == 2
+
+
+def test_queries_are_named(capsys):
+    assert main(["search_prs.py", "100", "author:app/renovate"]) == 2
+    assert "Usage" in capsys.readouterr().err